@@ -0,0 +1,86 @@
+"""
+Accuracy and throughput of the local gibberish pre-screen (utils/gibberish.py).
+
+Runs the scorer over the labeled corpus in bench/data/gibberish_corpus.jsonl
+(labels: ok, gibberish, empty, non_answer). An answer is short-circuited when
+its verdict is not "ok"/"unsure" and confidence >= --confidence, i.e. the
+same rule Probe uses before calling the LLM. The number that matters is
+false short-circuits on real answers: those respondents would lose their
+follow-up question. Missed gibberish only costs the LLM call we had before.
+
+    python bench/gibberish_bench.py --confidence 0.85 --verbose
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.gibberish import GibberishScorer  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(__file__), "data", "gibberish_corpus.jsonl")
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--confidence", type=float, default=0.85)
+    parser.add_argument("--rounds", type=int, default=200, help="passes over the corpus for the throughput run")
+    parser.add_argument("--verbose", action="store_true", help="print every misclassified answer")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    scorer = GibberishScorer()
+    started = time.perf_counter()
+    scorer.score("warm up")
+    load_ms = (time.perf_counter() - started) * 1000
+
+    per_label: dict[str, dict[str, int]] = {}
+    for item in corpus:
+        estimate = scorer.score(item["text"])
+        short_circuit = estimate.verdict not in ("ok", "unsure") and estimate.confidence >= args.confidence
+        should = item["label"] != "ok"
+        stats = per_label.setdefault(item["label"], {"total": 0, "short_circuited": 0, "correct": 0})
+        stats["total"] += 1
+        stats["short_circuited"] += short_circuit
+        stats["correct"] += short_circuit == should
+        if args.verbose and short_circuit != should:
+            print(f"  {'FALSE SC' if short_circuit else 'missed  '} [{item['label']}] {item['text']!r} "
+                  f"-> {estimate.verdict} score={estimate.score} conf={estimate.confidence} {estimate.features}")
+
+    total = sum(s["total"] for s in per_label.values())
+    correct = sum(s["correct"] for s in per_label.values())
+    print(f"corpus: {args.corpus} ({total} answers), confidence >= {args.confidence}")
+    print(f"{'label':<12}{'n':>6}{'short-circuited':>18}")
+    for label, s in sorted(per_label.items()):
+        print(f"{label:<12}{s['total']:>6}{s['short_circuited']:>12} ({s['short_circuited'] / s['total']:.0%})")
+    real = per_label.get("ok", {"total": 0, "short_circuited": 0})
+    print(f"accuracy (short-circuit decision): {correct / total:.1%}")
+    print(f"false short-circuits on real answers: {real['short_circuited']}/{real['total']}")
+
+    timings: list[float] = []
+    texts = [item["text"] for item in corpus]
+    for _ in range(args.rounds):
+        for text in texts:
+            t0 = time.perf_counter_ns()
+            scorer.score(text)
+            timings.append((time.perf_counter_ns() - t0) / 1000)
+    print(f"wordlist load + bigram model: {load_ms:.1f}ms (once per process)")
+    print(f"throughput: {len(timings) / (sum(timings) / 1e6):,.0f} answers/s, "
+          f"p50 {_percentile(timings, 50):.1f}us, p99 {_percentile(timings, 99):.1f}us")
+
+
+if __name__ == "__main__":
+    main()
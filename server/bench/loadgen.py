@@ -0,0 +1,416 @@
+"""
+End-to-end load generator for /ws/ai-qa.
+
+Opens --sessions websocket sessions (at most --concurrency at a time), each
+replaying one multi-turn respondent script from bench/data/respondent_scripts.json:
+the first turn answers the survey question, later turns answer the follow-up
+the server streamed back. Per turn it records
+
+  metrics   send -> first metrics frame
+  ttft      send -> first follow-up token frame
+  gap       time between consecutive token frames
+  turn      send -> streaming-ended
+
+and reports percentiles, throughput and the server's CPU / RSS (sampled from
+/proc, so Linux only).
+
+By default it starts its own uvicorn worker(s), fully offline:
+MONGO_CONNECTION=memory:// seeded with a generated survey, REDIS_URL=memory://
+and LLM_SIMULATE=true with the latency settings given here (SIM_LLM_*).
+Pass --url (plus --su-id/--qs-id) to drive a server that is already running.
+
+With --cassettes DIR the local server talks to real providers and records every
+completion there (--cassette-mode record), or serves those recordings offline
+with their original timing scaled by --time-scale (--cassette-mode replay).
+
+    python bench/loadgen.py --sessions 200 --concurrency 100 --ttft-ms 600 --tokens-per-second 60
+    python bench/loadgen.py --workers 2 --protocol 2 --server-env PROBE_FUSED_MODE=true --json out.json
+    python bench/loadgen.py --cassettes bench/cassettes --cassette-mode record --sessions 20
+    python bench/loadgen.py --cassettes bench/cassettes --cassette-mode replay --sessions 20 --time-scale 1
+    python bench/loadgen.py --url ws://localhost:8000/ws/ai-qa --su-id ... --qs-id ... --pid 1234
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+from datetime import datetime, timezone
+from typing import Optional
+
+import websockets
+from bson import ObjectId, json_util
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "respondent_scripts.json")
+QUESTION = "What did you think of the trailer you just watched?"
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_KB = (os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096) // 1024
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class ProcSampler:
+    """CPU % and RSS of a process tree, read from /proc every `interval` seconds."""
+
+    def __init__(self, root_pid: int, interval: float = 0.5, children: bool = True):
+        self.root_pid = root_pid
+        self.children = children
+        self.interval = interval
+        self.cpu_percent: list[float] = []
+        self.rss_mb: list[float] = []
+        self._last: Optional[tuple[float, float]] = None
+
+    def _pids(self) -> list[int]:
+        if not self.children:
+            return [self.root_pid]
+        pids, stack = [], [self.root_pid]
+        while stack:
+            pid = stack.pop()
+            pids.append(pid)
+            try:
+                for task in os.listdir(f"/proc/{pid}/task"):
+                    with open(f"/proc/{pid}/task/{task}/children") as f:
+                        stack.extend(int(child) for child in f.read().split())
+            except OSError:
+                continue
+        return pids
+
+    def _read(self) -> tuple[float, float]:
+        cpu_ticks, rss_pages = 0, 0
+        for pid in self._pids():
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    # fields after the parenthesised command name; utime/stime are 14/15, rss is 24
+                    fields = f.read().rsplit(")", 1)[1].split()
+                cpu_ticks += int(fields[11]) + int(fields[12])
+                rss_pages += int(fields[21])
+            except (OSError, IndexError, ValueError):
+                continue
+        return cpu_ticks / CLK_TCK, rss_pages * PAGE_KB / 1024
+
+    def sample(self):
+        cpu_s, rss_mb = self._read()
+        now = time.perf_counter()
+        if self._last is not None:
+            wall = now - self._last[0]
+            if wall > 0:
+                self.cpu_percent.append(100 * (cpu_s - self._last[1]) / wall)
+        self._last = (now, cpu_s)
+        self.rss_mb.append(rss_mb)
+
+    async def run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def summary(self) -> dict:
+        return {
+            "cpu_mean_pct": statistics.fmean(self.cpu_percent) if self.cpu_percent else 0.0,
+            "cpu_peak_pct": max(self.cpu_percent, default=0.0),
+            "rss_peak_mb": max(self.rss_mb, default=0.0),
+            "rss_last_mb": self.rss_mb[-1] if self.rss_mb else 0.0,
+        }
+
+
+class Stats:
+    def __init__(self):
+        self.metrics_s: list[float] = []
+        self.ttft_s: list[float] = []
+        self.gap_s: list[float] = []
+        self.turn_s: list[float] = []
+        self.turns = 0
+        self.gated_turns = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.sessions_failed = 0
+        self.follow_up_chars = 0
+
+
+def _seed_file(directory: str, questions: int) -> tuple[str, str, list[str]]:
+    """Extended-JSON seed for MONGO_CONNECTION=memory://: one survey with `questions` questions."""
+    su_id = ObjectId()
+    survey = {
+        "_id": su_id,
+        "title": "Load test survey",
+        "description": "Respondents watched a two minute action movie trailer.",
+        "config": {"llm": "chatgpt", "language": "English"},
+        "createdAt": datetime.now(timezone.utc),
+        "status": "active",
+        "display": True,
+    }
+    docs = [
+        {
+            "_id": ObjectId(),
+            "su_id": su_id,
+            "question": QUESTION,
+            "description": "Overall reaction to the trailer.",
+            "seq_num": i,
+            "config": {"probes": 2, "max_probes": 4, "quality_threshold": 9, "gibberish_score": 7},
+        }
+        for i in range(questions)
+    ]
+    path = os.path.join(directory, "loadgen_seed.json")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json_util.dumps({"diy_monet": {"surveys": [survey], "survey-questions": docs}}))
+    return path, str(su_id), [str(doc["_id"]) for doc in docs]
+
+
+def _start_server(args, seed_path: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "MONGO_CONNECTION": "memory://",
+        "MEMORY_MONGO_SEED": seed_path,
+        "REDIS_URL": "memory://",
+        "LLM_SIMULATE": "true",
+        "LLM_WARM_PROVIDERS": "",
+        "SIM_LLM_TTFT_MS": str(args.ttft_ms),
+        "SIM_LLM_TTFT_DIST": args.ttft_dist,
+        "SIM_LLM_TTFT_SIGMA": str(args.ttft_sigma),
+        "SIM_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second),
+        "SIM_LLM_OUTPUT_TOKENS": str(args.output_tokens),
+        "SIM_LLM_ERROR_RATE": str(args.error_rate),
+    }
+    if args.cassettes:
+        env.update({
+            "LLM_SIMULATE": "false",
+            "LLM_CASSETTE_MODE": args.cassette_mode,
+            "LLM_CASSETTE_DIR": os.path.abspath(args.cassettes),
+            "LLM_CASSETTE_TIME_SCALE": str(args.time_scale),
+        })
+    for key in ("OPENAI_ORG", "OPENAI_KEY", "LLAMA_API_KEY", "DEEPSEEK_API_KEY"):
+        env.setdefault(key, "simulated")
+    for item in args.server_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    command = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "127.0.0.1", "--port", str(args.port),
+        "--workers", str(args.workers), "--log-level", "warning",
+    ]
+    return subprocess.Popen(command, cwd=SERVER_DIR, env=env)
+
+
+async def _wait_healthy(port: int, proc: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            await asyncio.to_thread(urllib.request.urlopen, f"http://127.0.0.1:{port}/health", None, 1)
+            return
+        except OSError:
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"server not healthy after {timeout}s")
+
+
+async def _turn(ws, payload: dict, args, stats: Stats) -> str:
+    sent = time.perf_counter()
+    await ws.send(json.dumps(payload))
+    first_metric = first_token = last_token = None
+    follow_up = ""
+    while True:
+        try:
+            raw = await asyncio.wait_for(ws.recv(), timeout=args.turn_timeout_s)
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            raise
+        now = time.perf_counter()
+        frame = json.loads(raw)
+        if frame.get("type") == "pong":
+            continue
+        if frame.get("error"):
+            stats.errors += 1
+            return ""
+        message = frame.get("message")
+        delta = frame.get("delta") or frame.get("response") or {}
+        if first_metric is None and "metrics" in delta:
+            first_metric = now
+            stats.metrics_s.append(now - sent)
+        text = (frame.get("append") or {}).get("question", "") if "v" in frame else (
+            delta.get("question", "") if message == "streaming" else ""
+        )
+        if text:
+            if first_token is None:
+                first_token = now
+                stats.ttft_s.append(now - sent)
+            else:
+                stats.gap_s.append(now - last_token)
+            last_token = now
+            follow_up += text
+        if message == "streaming-ended":
+            break
+    stats.turn_s.append(time.perf_counter() - sent)
+    stats.turns += 1
+    stats.follow_up_chars += len(follow_up)
+    if not follow_up:
+        stats.gated_turns += 1
+    return follow_up
+
+
+async def _session(idx: int, script: dict, args, targets: list[tuple[str, str]], stats: Stats):
+    su_id, qs_id = targets[idx % len(targets)]
+    subprotocols = ["monet.v2"] if args.protocol == 2 else None
+    try:
+        async with websockets.connect(args.url, subprotocols=subprotocols, max_size=None) as ws:
+            question = QUESTION
+            for answer in script["answers"][:args.turns or None]:
+                payload = {
+                    "su_id": su_id,
+                    "qs_id": qs_id,
+                    "mo_id": f"loadgen-{args.run_id}-{idx}",
+                    "question": question,
+                    "response": answer,
+                }
+                follow_up = await _turn(ws, payload, args, stats)
+                question = follow_up or question
+                await asyncio.sleep(random.uniform(0, args.think_ms / 1000))
+    except Exception as e:
+        stats.sessions_failed += 1
+        if args.verbose:
+            print(f"session {idx} failed: {e!r}", file=sys.stderr)
+
+
+async def _run(args, targets: list[tuple[str, str]], server_pid: Optional[int]) -> dict:
+    with open(args.scripts, encoding="utf-8") as f:
+        scripts = json.load(f)
+    stats = Stats()
+    # the local server is a child of this process: sample the client on its own
+    samplers = {"client": ProcSampler(os.getpid(), children=False)}
+    if server_pid:
+        samplers["server"] = ProcSampler(server_pid)
+    sampler_tasks = [asyncio.create_task(sampler.run()) for sampler in samplers.values()]
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def _limited(idx: int):
+        async with semaphore:
+            await asyncio.sleep(random.uniform(0, args.ramp_s))
+            await _session(idx, scripts[idx % len(scripts)], args, targets, stats)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_limited(i) for i in range(args.sessions)))
+    wall = time.perf_counter() - started
+    for task in sampler_tasks:
+        task.cancel()
+
+    def _dist(values: list[float]) -> dict:
+        return {f"p{p}_ms": _percentile(values, p) * 1000 for p in (50, 90, 99)} | {"n": len(values)}
+
+    return {
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "turns": stats.turns,
+        "gated_turns": stats.gated_turns,
+        "errors": stats.errors,
+        "timeouts": stats.timeouts,
+        "sessions_failed": stats.sessions_failed,
+        "wall_s": wall,
+        "turns_per_s": stats.turns / wall if wall else 0.0,
+        "tokens_per_s": stats.follow_up_chars / 4 / wall if wall else 0.0,
+        "metrics": _dist(stats.metrics_s),
+        "ttft": _dist(stats.ttft_s),
+        "gap": _dist(stats.gap_s),
+        "turn": _dist(stats.turn_s),
+        "resources": {name: sampler.summary() for name, sampler in samplers.items()},
+    }
+
+
+def _print_report(result: dict):
+    print(
+        f"{result['sessions']} sessions ({result['concurrency']} concurrent), {result['turns']} turns "
+        f"in {result['wall_s']:.1f}s: {result['turns_per_s']:.1f} turns/s, {result['tokens_per_s']:.0f} tokens/s"
+    )
+    print(
+        f"gated turns {result['gated_turns']}, errors {result['errors']}, "
+        f"timeouts {result['timeouts']}, failed sessions {result['sessions_failed']}"
+    )
+    print(f"{'':<8} {'n':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}")
+    for name in ("metrics", "ttft", "gap", "turn"):
+        row = result[name]
+        print(f"{name:<8} {row['n']:>7} {row['p50_ms']:>9.1f} {row['p90_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+    for name, usage in result["resources"].items():
+        print(
+            f"{name:<8} cpu mean {usage['cpu_mean_pct']:.0f}% peak {usage['cpu_peak_pct']:.0f}%, "
+            f"rss peak {usage['rss_peak_mb']:.0f} MB"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=0, help="turns per session (0 = the whole script)")
+    parser.add_argument("--scripts", default=SCRIPTS)
+    parser.add_argument("--protocol", type=int, choices=(1, 2), default=1)
+    parser.add_argument("--think-ms", type=float, default=500.0, help="max respondent think time between turns")
+    parser.add_argument("--ramp-s", type=float, default=2.0)
+    parser.add_argument("--turn-timeout-s", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true")
+    target = parser.add_argument_group("existing server")
+    target.add_argument("--url", help="ws URL of a running server (skips the local one)")
+    target.add_argument("--su-id")
+    target.add_argument("--qs-id")
+    target.add_argument("--pid", type=int, help="server pid to sample CPU/RSS from")
+    local = parser.add_argument_group("local simulated server")
+    local.add_argument("--port", type=int, default=8765)
+    local.add_argument("--workers", type=int, default=1)
+    local.add_argument("--questions", type=int, default=1, help="questions in the seeded survey")
+    local.add_argument("--ttft-ms", type=float, default=600.0)
+    local.add_argument("--ttft-dist", choices=("fixed", "exponential", "lognormal"), default="lognormal")
+    local.add_argument("--ttft-sigma", type=float, default=0.5)
+    local.add_argument("--tokens-per-second", type=float, default=60.0)
+    local.add_argument("--output-tokens", type=int, default=40)
+    local.add_argument("--error-rate", type=float, default=0.0)
+    local.add_argument("--cassettes", metavar="DIR", help="record/replay provider completions in DIR")
+    local.add_argument("--cassette-mode", choices=("record", "replay"), default="replay")
+    local.add_argument("--time-scale", type=float, default=1.0, help="replay delay multiplier (0 = no delays)")
+    local.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                       help="extra server setting, e.g. PROBE_FUSED_MODE=true (repeatable)")
+    args = parser.parse_args()
+    random.seed(args.seed)
+    args.run_id = f"{int(time.time())}"
+
+    proc = None
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.url:
+            if not (args.su_id and args.qs_id):
+                parser.error("--url needs --su-id and --qs-id")
+            targets, server_pid = [(args.su_id, args.qs_id)], args.pid
+        else:
+            seed_path, su_id, qs_ids = _seed_file(tmp, args.questions)
+            proc = _start_server(args, seed_path)
+            args.url = f"ws://127.0.0.1:{args.port}/ws/ai-qa"
+            targets, server_pid = [(su_id, qs_id) for qs_id in qs_ids], proc.pid
+        try:
+            if proc is not None:
+                asyncio.run(_wait_healthy(args.port, proc))
+            result = asyncio.run(_run(args, targets, server_pid))
+        finally:
+            if proc is not None:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+
+    _print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+Microbenchmarks for the code every /ws/ai-qa message runs, with a stored baseline.
+
+Each case times one operation of the per-turn hot path (message parsing,
+survey/question validation, `Probe.acreate`, prompt assembly, metric and
+frame encoding) in isolation, fully offline: MONGO_CONNECTION and REDIS_URL
+default to memory:// and providers to LLM_SIMULATE. A case is calibrated to
+run for at least --min-time per repeat, over --repeat repeats.
+
+Results are compared with bench/data/micro_baseline.json: a case regresses
+when even its fastest repeat is more than --threshold slower than the
+baseline median (a case may carry its own "threshold" in the baseline file),
+and the run exits 1. Comparing best-now against typical-then, with a wide
+default, keeps shared runners (which swing by a third between runs) from
+flagging scheduling jitter; tighten per case on a quiet machine. The baseline is machine
+specific: refresh it with --save-baseline on the machine that runs the
+comparison.
+
+    python bench/micro.py
+    python bench/micro.py --filter probe --repeat 9
+    python bench/micro.py --save-baseline
+"""
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+from datetime import datetime, timezone
+from typing import Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# offline: in-process Mongo/Redis and the simulated provider (instant, never used on the timed path)
+for _key, _value in {
+    "MONGO_CONNECTION": "memory://",
+    "REDIS_URL": "memory://",
+    "LLM_SIMULATE": "true",
+    "SIM_LLM_TTFT_MS": "0",
+    "SIM_LLM_TOKENS_PER_SECOND": "1000000",
+    "OPENAI_ORG": "bench",
+    "OPENAI_KEY": "bench",
+    "LLAMA_API_KEY": "bench",
+    "DEEPSEEK_API_KEY": "bench",
+}.items():
+    os.environ.setdefault(_key, _value)
+
+from bson import ObjectId  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(__file__), "data", "micro_baseline.json")
+
+SURVEY_ID = ObjectId()
+QUESTION_ID = ObjectId()
+SURVEY_DOC = {
+    "_id": SURVEY_ID,
+    "title": "Trailer reaction",
+    "description": "Respondents watched a two minute action movie trailer.",
+    "media": {"media_url": "https://cdn.example.com/trailer.mp4", "media_name": "trailer"},
+    "config": {"llm": "chatgpt", "language": "English", "add_context": True},
+    "createdAt": datetime(2025, 1, 1, tzinfo=timezone.utc),
+    "status": "active",
+    "tags": ["trailer", "action"],
+    "display": True,
+}
+QUESTION_DOC = {
+    "_id": QUESTION_ID,
+    "su_id": SURVEY_ID,
+    "question": "What did you think of the trailer you just watched?",
+    "description": "Overall reaction to the trailer.",
+    "seq_num": 0,
+    "config": {"probes": 2, "max_probes": 4, "quality_threshold": 9, "gibberish_score": 7},
+}
+ANSWER = "I loved the opening shot over the city, it set a really tense mood and the music built up nicely."
+MESSAGE = json.dumps({
+    "su_id": str(SURVEY_ID),
+    "mo_id": "respondent-1",
+    "qs_id": str(QUESTION_ID),
+    "question": QUESTION_DOC["question"],
+    "response": ANSWER,
+})
+METRICS = {
+    "quality": 7, "relevance": 8, "detail": 6, "confusion": 1, "negativity": 0, "consistency": 9,
+    "confidence": 8, "keywords": ["opening shot", "tense mood", "music"],
+    "reason": "Specific, relevant details about the opening and the score.", "gibberish_score": 0,
+}
+
+CASES: dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def case(name: str):
+    """Register a case: the decorated function does the setup and returns the operation to time."""
+    def register(setup: Callable[[], Callable[[], object]]):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+def _question(add_context: bool):
+    from models.Survey import PySurveyQuestion
+
+    doc = {**QUESTION_DOC, "config": {**QUESTION_DOC["config"], "add_context": add_context}}
+    return PySurveyQuestion(**doc)
+
+
+def _run_sync(coro):
+    # the fake websocket never suspends, so the coroutine finishes on the first send
+    try:
+        coro.send(None)
+    except StopIteration as done:
+        return done.value
+    raise RuntimeError("coroutine suspended")
+
+
+def _acreate(add_context: bool):
+    import asyncio
+    from models.Survey import PySurvey, SurveyResponse
+    from modules.ProdProbe_v2 import Probe
+
+    survey, question = PySurvey(**SURVEY_DOC), _question(add_context)
+    survey_response = SurveyResponse.model_validate_json(MESSAGE)
+    # one loop for the whole case, like a worker: only the construction is timed, not loop setup
+    loop = asyncio.new_event_loop()
+
+    def run():
+        return loop.run_until_complete(Probe.acreate(
+            mo_id="respondent-1", metadata=survey, question=question, session_no=1, survey_details=survey_response,
+        ))
+
+    # the first call extracts the intent; timed runs read it from the Redis intent cache
+    run()
+    return run
+
+
+@case("probe_acreate")
+def _probe_acreate():
+    return _acreate(False)
+
+
+@case("probe_acreate_add_context")
+def _probe_acreate_add_context():
+    return _acreate(True)
+
+
+@case("system_prompt_compile")
+def _system_prompt_compile():
+    from modules.PromptCompiler import prompt_compiler
+
+    kwargs = dict(
+        su_id=SURVEY_ID, qs_id=QUESTION_ID, language="English", survey_add_context=True,
+        question_add_context=True, survey_description=SURVEY_DOC["description"],
+        question_text=QUESTION_DOC["question"], intent="Gauge the overall reaction to the trailer.",
+    )
+    return lambda: prompt_compiler.compile(**kwargs)
+
+
+@case("system_prompt_build")
+def _system_prompt_build():
+    from modules.PromptCompiler import PromptCompiler
+
+    kwargs = dict(
+        language="English", survey_add_context=True, question_add_context=True,
+        survey_description=SURVEY_DOC["description"], question_text=QUESTION_DOC["question"],
+        intent="Gauge the overall reaction to the trailer.",
+    )
+    return lambda: PromptCompiler._build(**kwargs)
+
+
+@case("survey_response_validate_json")
+def _survey_response_validate_json():
+    from models.Survey import SurveyResponse
+
+    return lambda: SurveyResponse.model_validate_json(MESSAGE)
+
+
+@case("pysurvey_validate")
+def _pysurvey_validate():
+    from models.Survey import PySurvey
+
+    return lambda: PySurvey(**SURVEY_DOC)
+
+
+@case("pysurvey_question_validate")
+def _pysurvey_question_validate():
+    from models.Survey import PySurveyQuestion
+
+    return lambda: PySurveyQuestion(**QUESTION_DOC)
+
+
+@case("pyobjectid_validate_str")
+def _pyobjectid_validate_str():
+    from models.Survey import PySurveyQuestion
+
+    doc = {**QUESTION_DOC, "_id": str(QUESTION_ID), "su_id": str(SURVEY_ID)}
+    return lambda: PySurveyQuestion(**doc)
+
+
+@case("nsight_model_dump")
+def _nsight_model_dump():
+    from modules.ProdNSightGenerator import NSIGHT
+
+    nsight = NSIGHT(**METRICS)
+    return nsight.model_dump
+
+
+@case("nsight_partial_model_dump")
+def _nsight_partial_model_dump():
+    from modules.ProdNSightGenerator import NSIGHT
+
+    partial = NSIGHT.model_construct(quality=7, relevance=8, keywords=["opening shot"])
+    return partial.model_dump
+
+
+@case("final_response_frame")
+def _final_response_frame():
+    from utils.frames import FrameWriter
+
+    class _Socket:
+        # what starlette's WebSocket.send_json encodes before the frame hits the wire
+        async def send_json(self, data):
+            return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+    writer = FrameWriter(_Socket())
+    writer.begin(question="", min_probing=2, max_probing=4)
+    _run_sync(writer.metrics(ended=False, metrics=METRICS, is_gibberish=False))
+    return lambda: _run_sync(writer.token("What was it about the music that stood out", ended=False))
+
+
+@case("db_switcher_build_output")
+def _db_switcher_build_output():
+    from utils.db_switcher import DBSwitcher, MongoSurveyRepository
+
+    switcher = DBSwitcher()
+    survey = MongoSurveyRepository._normalize_survey(SURVEY_DOC)
+    question = MongoSurveyRepository._normalize_question(QUESTION_DOC)
+    return lambda: switcher.build_output(survey, question)
+
+
+def _timed(op: Callable[[], object], loops: int) -> float:
+    # like timeit: collect first, and keep the collector out of the timed loop
+    gc.collect()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        for _ in range(loops):
+            op()
+        return time.perf_counter() - started
+    finally:
+        gc.enable()
+
+
+def measure(op: Callable[[], object], repeat: int, min_time: float) -> dict:
+    op()
+    loops = 1
+    while True:
+        elapsed = _timed(op, loops)
+        if elapsed >= min_time:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+    per_op = []
+    for _ in range(repeat):
+        per_op.append(_timed(op, loops) / loops * 1e6)
+    return {"median_us": round(statistics.median(per_op), 3), "min_us": round(min(per_op), 3), "loops": loops}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="only cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=9)
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per repeat")
+    parser.add_argument("--threshold", type=float, default=0.5, help="allowed slowdown vs baseline (0.5 = 50%%)")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("cases", {})
+
+    results: dict[str, dict] = {}
+    regressions = []
+    print(f"{'case':<32}{'median us':>12}{'min us':>12}{'baseline':>12}{'change':>9}")
+    for name, setup in CASES.items():
+        if args.filter not in name:
+            continue
+        result = results[name] = measure(setup(), args.repeat, args.min_time)
+        base = baseline.get(name)
+        line = f"{name:<32}{result['median_us']:>12.2f}{result['min_us']:>12.2f}"
+        if base:
+            change = result["min_us"] / base["median_us"] - 1
+            limit = base.get("threshold", args.threshold)
+            flag = "  REGRESSION" if change > limit else ""
+            if flag:
+                regressions.append(name)
+            line += f"{base['median_us']:>12.2f}{change:>+9.0%}{flag}"
+        print(line)
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+        "cases": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        # keep hand-tuned per-case thresholds across refreshes
+        for name, result in results.items():
+            if "threshold" in baseline.get(name, {}):
+                result["threshold"] = baseline[name]["threshold"]
+        report["cases"] = {**baseline, **results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+    elif regressions:
+        print(f"{len(regressions)} regression(s) over baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
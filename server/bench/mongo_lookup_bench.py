@@ -0,0 +1,101 @@
+"""
+Token latency of the real /ws/ai-qa handler with blocking vs non-blocking Mongo lookups.
+
+Runs bench/loadgen.py twice against its local offline server
+(MONGO_CONNECTION=memory://, REDIS_URL=memory://, LLM_SIMULATE=true), with
+every in-memory Mongo call taking --lookup-ms (MEMORY_MONGO_LATENCY_MS):
+
+  async  the handler as shipped: the survey and question `find_one`s on the
+         async client are awaited together, the loop keeps serving other sockets
+  sync   the same handler, with the in-memory async client holding the event
+         loop for each round trip (MEMORY_MONGO_BLOCKING=true), the way the
+         sync pymongo client on the request path did before
+
+Everything else (probe claim, Redis, simulated LLM streaming, frame encoding)
+is the production code path. The LLM scheduler's concurrency cap is lifted
+(the simulated provider has no quota), so turns do not queue for a slot and
+the lookups are the only difference between the runs. The gap between token
+frames as seen by the clients shows what one socket's lookup costs every
+other socket that is streaming at that moment.
+
+    python bench/mongo_lookup_bench.py                      # 1000 sessions, 500 sockets
+    python bench/mongo_lookup_bench.py --sessions 200 --concurrency 100
+
+Single worker, 8ms lookups, 600ms simulated TTFT at 30 tokens/s, 4 turns per
+session (ms):
+
+    sockets  mode   gap p50  gap p99  ttft p50  ttft p99  turn p99
+    500      sync     281.4    912.7    7295.0   13737.0   32655.2
+    500      async    175.8    709.4    4941.9    7064.9   20144.3
+    100      sync      44.3    145.4    3039.2    5204.5    9158.1
+    100      async     37.3     66.3    2811.8    4417.9    6550.2
+
+At 500 sockets the worker is CPU bound (frame encoding and the simulated
+streams), so part of the gap is not Mongo at all; the blocking lookups still
+double the TTFT p99.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+LOADGEN = os.path.join(os.path.dirname(__file__), "loadgen.py")
+
+
+def _loadgen(args, blocking: bool, report: str) -> dict:
+    command = [
+        sys.executable, LOADGEN,
+        "--sessions", str(args.sessions),
+        "--concurrency", str(args.concurrency),
+        "--port", str(args.port),
+        "--ttft-ms", str(args.ttft_ms),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--seed", str(args.seed),
+        "--server-env", f"MEMORY_MONGO_LATENCY_MS={args.lookup_ms}",
+        "--server-env", f"MEMORY_MONGO_BLOCKING={str(blocking).lower()}",
+        "--server-env", f"LLM_MAX_CONCURRENCY={args.concurrency * 2}",
+        "--json", report,
+    ]
+    for item in args.server_env:
+        command += ["--server-env", item]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    with open(report, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--lookup-ms", type=float, default=8.0, help="Mongo round trip per find_one")
+    parser.add_argument("--ttft-ms", type=float, default=600.0)
+    parser.add_argument("--tokens-per-second", type=float, default=30.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra server setting for both runs (repeatable)")
+    parser.add_argument("--json", help="also write both reports to this file")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("sync", "async"):
+            results[mode] = _loadgen(args, mode == "sync", os.path.join(tmp, f"{mode}.json"))
+
+    print(f"{args.sessions} sessions ({args.concurrency} concurrent), {args.lookup_ms:g}ms per Mongo lookup")
+    print(f"{'mode':<6} {'turns':>6} {'errors':>7} {'gap p50':>9} {'gap p99':>9} {'ttft p50':>9} {'ttft p99':>9} {'turn p99':>9}")
+    for mode, result in results.items():
+        print(
+            f"{mode:<6} {result['turns']:>6} {result['errors'] + result['timeouts']:>7} "
+            f"{result['gap']['p50_ms']:>9.1f} {result['gap']['p99_ms']:>9.1f} "
+            f"{result['ttft']['p50_ms']:>9.1f} {result['ttft']['p99_ms']:>9.1f} {result['turn']['p99_ms']:>9.1f}"
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"lookup_ms": args.lookup_ms, **results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
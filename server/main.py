@@ -1,5 +1,6 @@
 import os
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -8,7 +9,17 @@ env_path = os.path.join(os.path.dirname(__file__), ".env")
 load_dotenv(env_path)
 
 # - routes
-from routes.websocket import websocket_router
+from routes.websocket import websocket_router, probes
+from routes.admin import admin_router
+from modules.Metrics import metrics
+from modules.LLMAdapter import llm_clients
+from modules.LLMRouter import provider_health
+from modules.LLMScheduler import llm_scheduler
+from modules.Tracing import tracer
+from modules.LoopMonitor import LOOP_MONITOR, loop_monitor
+from modules.ResponseCache import response_cache
+from utils.redis_pool import close_all as close_redis_pools
+from utils.write_behind import write_behind
 
 description = """
 Monet-Intern-Effort
@@ -45,14 +56,64 @@ app.add_middleware(
 
 # Include routers
 app.include_router(websocket_router)
+app.include_router(admin_router)
 
 # Health check endpoint
 @app.get("/health")
 def health_check():
     """Health check for WebSocket handler"""
-    # Basic health check without relying on websocket internals.
     websocket_status = "healthy"
     return {
         "websocket_status": websocket_status,
-        "active_probe_sessions": 0
+        "active_probe_sessions": len(probes),
+        "probe_registry": probes.stats(),
+        "llm_clients": llm_clients.stats(),
+        "llm_providers": provider_health.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "response_cache": response_cache.stats(),
+        "write_behind": write_behind.stats(),
+        "tracing": tracer.stats(),
+        "event_loop": loop_monitor.stats(),
     }
+
+
+metrics.gauge("monet_probe_sessions_live", "Live probe sessions in this worker.", lambda: len(probes))
+metrics.gauge("monet_probe_sessions_evicted", "Probe sessions evicted from this worker.", lambda: probes.evicted)
+metrics.gauge("monet_probe_registry_hits", "Probe registry lookups that found a live session.", lambda: probes.hits)
+metrics.gauge("monet_probe_registry_misses", "Probe registry lookups that missed.", lambda: probes.misses)
+metrics.gauge("monet_response_cache_hit_rate", "Response cache hit rate in this worker.", lambda: response_cache.stats()["hit_rate"])
+metrics.gauge("monet_response_cache_entries", "Response cache entries held in this worker.", lambda: response_cache.stats()["entries"])
+metrics.gauge("monet_llm_queued", "LLM calls waiting for a scheduler slot in this worker.", llm_scheduler.queued)
+metrics.gauge("monet_write_behind_pending", "Responses queued for a bulk database write.", write_behind.pending)
+metrics.gauge("monet_traces_kept", "Turn traces kept by this worker's tracer (slow, failed or sampled).", lambda: sum(tracer.kept.values()))
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus text exposition of the worker's in-process metrics"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.on_event("startup")
+async def warm_llm_clients():
+    """Build the pooled LLM clients and open their TLS connections before traffic arrives"""
+    # opt-in (e.g. LLM_WARM_PROVIDERS=chatgpt,deepseek): warming makes an outbound call per provider
+    providers = [p.strip() for p in os.environ.get("LLM_WARM_PROVIDERS", "").split(",") if p.strip()]
+    await llm_clients.warm(providers)
+
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    """Watch the event loop for callbacks that block it (sync I/O or CPU on the async path)"""
+    if LOOP_MONITOR:
+        loop_monitor.start()
+
+
+@app.on_event("shutdown")
+async def close_probe_sessions():
+    """Close the clients held by every live probe session"""
+    await loop_monitor.stop()
+    probes.clear()
+    # write out queued responses before the database/Redis clients go away
+    await write_behind.drain()
+    await close_redis_pools()
@@ -16,6 +16,7 @@ class SurveyConfig(BaseModel):
     mediaAI: bool = False  # overall check for the feature
     add_context: bool = False
     adaptive_probing: bool = False
+    response_cache: bool = False  # reuse metrics/first follow-ups for identical answers
 
 
 class SurveyMedia(BaseModel):
@@ -0,0 +1,141 @@
+import os
+import json
+import asyncio
+from typing import Optional
+from redis.asyncio import Redis
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    message_to_dict,
+    messages_from_dict,
+)
+from .ServerLogger import ServerLogger
+
+logger = ServerLogger()
+
+# failed history writes are retried this many times (with doubling backoff) before `aflush` gives up
+HISTORY_FLUSH_RETRIES = int(os.environ.get("HISTORY_FLUSH_RETRIES", 3))
+HISTORY_FLUSH_BACKOFF = float(os.environ.get("HISTORY_FLUSH_BACKOFF_MS", 100)) / 1000
+
+
+class AsyncRedisChatHistory:
+    """
+    Chat history with an in-memory copy of the session and async,
+    pipelined write-through to Redis.
+
+    Uses the same layout as LangChain's `RedisChatMessageHistory`
+    (`message_store:{session_id}`, newest message first), so sessions written
+    by either implementation can be read by the other. Redis is only read on
+    `aload()` (rehydration); appends go to memory immediately and are pushed
+    in order by a single background flusher, one pipeline per batch, so a
+    turn costs O(new messages) of Redis traffic. `aflush()` raises if the
+    writes still fail after retrying, so a caller never treats an unwritten
+    turn as done.
+    """
+
+    key_prefix = "message_store:"
+
+    def __init__(self, session_id: str, redis_client: Redis, ttl: Optional[int] = None):
+        self.session_id = session_id
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self._messages: list[BaseMessage] = []
+        self._pending: list[str] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._error: Optional[Exception] = None
+        self.loaded = False
+
+    @property
+    def key(self) -> str:
+        return self.key_prefix + self.session_id
+
+    @property
+    def messages(self) -> list[BaseMessage]:
+        return self._messages
+
+    async def aload(self) -> list[BaseMessage]:
+        """(Re)read the whole session from Redis, after any of our own pending writes land."""
+        await self.aflush()
+        items = await self.redis_client.lrange(self.key, 0, -1)
+        self._messages = messages_from_dict([json.loads(item) for item in items[::-1]])
+        self.loaded = True
+        return self._messages
+
+    def add_message(self, message: BaseMessage):
+        self._messages.append(message)
+        self._pending.append(json.dumps(message_to_dict(message)))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(self._flush())
+
+    def add_user_message(self, message: str):
+        self.add_message(HumanMessage(content=message))
+
+    def add_ai_message(self, message: str):
+        self.add_message(AIMessage(content=message))
+
+    async def aflush(self, retries: int = HISTORY_FLUSH_RETRIES, backoff: float = HISTORY_FLUSH_BACKOFF):
+        """
+        Wait until every appended message is in Redis. Failed writes are
+        retried `retries` times with doubling backoff; after that the last
+        Redis error is raised and the messages stay pending.
+        """
+        for attempt in range(retries + 1):
+            if attempt:
+                await asyncio.sleep(backoff * 2 ** (attempt - 1))
+            if self._pending and (self._flusher is None or self._flusher.done()):
+                self._flusher = asyncio.get_running_loop().create_task(self._flush())
+            while self._flusher is not None and not self._flusher.done():
+                await asyncio.shield(self._flusher)
+            if not self._pending:
+                return
+        raise self._error or RuntimeError(f"Chat history for {self.session_id} was not written")
+
+    def cancel_pending(self) -> int:
+        """Drop writes that have not been sent yet; returns how many were dropped."""
+        dropped = len(self._pending)
+        self._pending = []
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        return dropped
+
+    async def atruncate(self, length: int) -> int:
+        """
+        Forget every message after the first `length`, in memory and in Redis
+        (a turn that did not complete). Returns how many messages were dropped.
+        """
+        flusher = self._flusher
+        self.cancel_pending()
+        if flusher is not None:
+            # a batch that was mid-write may or may not have landed: the trim covers both
+            await asyncio.gather(flusher, return_exceptions=True)
+        dropped = len(self._messages) - length
+        self._messages = self._messages[:length]
+        if length:
+            # newest first: the oldest `length` messages sit at the tail
+            await self.redis_client.ltrim(self.key, -length, -1)
+        else:
+            await self.redis_client.delete(self.key)
+        return dropped
+
+    async def aclear(self):
+        self.cancel_pending()
+        self._messages = []
+        await self.redis_client.delete(self.key)
+
+    async def _flush(self):
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.lpush(self.key, *batch)
+                if self.ttl:
+                    pipe.expire(self.key, self.ttl)
+                await pipe.execute()
+                self._error = None
+            except Exception as e:
+                self._error = e
+                logger.error(f"Failed to write chat history for {self.session_id}: {e}")
+                # keep the order: retry the failed batch before anything newer
+                self._pending = batch + self._pending
+                return
@@ -0,0 +1,164 @@
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from .Metrics import metrics
+
+CONTEXT_MAX_TURNS = int(os.environ.get("CONTEXT_MAX_TURNS", 6))
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 3000))
+# opt-in: the rolling summary is an extra background LLM call per session and changes the prompt
+CONTEXT_SUMMARY = os.environ.get("CONTEXT_SUMMARY", "false").lower() == "true"
+# "full": metrics see the same window as the follow-up, "narrow": system prompt + latest response
+METRIC_CONTEXT = os.environ.get("METRIC_CONTEXT", "full").lower()
+
+tokens_saved = metrics.histogram(
+    "monet_context_tokens_saved",
+    "Approximate input tokens saved per turn by context windowing.",
+    ("chain",),
+    buckets=(0, 50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000),
+)
+tokens_sent = metrics.counter(
+    "monet_context_tokens_sent_total",
+    "Approximate input tokens sent to the LLM after context windowing.",
+    ("chain",),
+)
+
+SUMMARY_PREFIX = "Summary of the earlier conversation (older turns are not shown): "
+
+
+def estimate_tokens(message: BaseMessage) -> int:
+    """Cheap token estimate (~4 characters per token plus per-message overhead)."""
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return len(content) // 4 + 4
+
+
+def split_turns(messages: list[BaseMessage]) -> tuple[Optional[BaseMessage], list[list[BaseMessage]]]:
+    """Split a probe history into (system message, turns); a turn starts at each respondent message."""
+    system = messages[0] if messages and isinstance(messages[0], SystemMessage) else None
+    turns: list[list[BaseMessage]] = []
+    for message in messages[1 if system else 0:]:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return system, turns
+
+
+@dataclass
+class RollingSummary:
+    """Summary of the turns that fell out of the window, refreshed in the background."""
+
+    text: str = ""
+    covered_turns: int = 0
+    updating: bool = False
+
+    @staticmethod
+    def extractive(turns: list[list[BaseMessage]], max_chars: int = 600) -> str:
+        """Fallback used until the LLM summary catches up: the respondent's own answers, clipped."""
+        answers = [t[0].content for t in turns if t and isinstance(t[0], HumanMessage)]
+        text = " | ".join(str(a) for a in answers)
+        return text if len(text) <= max_chars else text[-max_chars:]
+
+    async def refresh(
+        self,
+        turns: list[list[BaseMessage]],
+        summarize: Callable[[str, list[BaseMessage]], Awaitable[str]],
+    ):
+        """Fold `turns` (the first `len(turns)` turns of the session) into the summary."""
+        if self.updating or len(turns) <= self.covered_turns:
+            return
+        self.updating = True
+        try:
+            new_messages = [m for turn in turns[self.covered_turns:] for m in turn]
+            self.text = (await summarize(self.text, new_messages)).strip()
+            self.covered_turns = len(turns)
+        finally:
+            self.updating = False
+
+
+@dataclass
+class ContextView:
+    messages: list[BaseMessage]
+    full_tokens: int
+    view_tokens: int
+    folded_turns: list[list[BaseMessage]]
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(self.full_tokens - self.view_tokens, 0)
+
+
+class ContextPolicy:
+    """
+    Decides which part of a probe conversation is sent to the LLM.
+
+    The system message is always pinned and the latest respondent message
+    always included; older turns are kept verbatim newest-first while they fit
+    in `max_turns` and `token_budget`. With CONTEXT_SUMMARY on, anything older
+    is represented by the rolling summary (or an extractive fallback while the
+    summary catches up); otherwise it is left out.
+    """
+
+    def __init__(
+        self,
+        max_turns: int = CONTEXT_MAX_TURNS,
+        token_budget: int = CONTEXT_TOKEN_BUDGET,
+        summarize: bool = CONTEXT_SUMMARY,
+        metric_context: str = METRIC_CONTEXT,
+    ):
+        self.max_turns = max(max_turns, 1)
+        self.token_budget = token_budget
+        self.summarize = summarize
+        self.metric_context = metric_context
+
+    def follow_up_view(self, messages: list[BaseMessage], summary: Optional[RollingSummary] = None) -> ContextView:
+        system, turns = split_turns(messages)
+        costs = [sum(estimate_tokens(m) for m in turn) for turn in turns]
+        full_tokens = sum(costs) + (estimate_tokens(system) if system else 0)
+
+        budget = self.token_budget - (estimate_tokens(system) if system else 0)
+        keep = 0
+        for cost in reversed(costs):
+            # the latest turn is always kept, whatever it costs
+            if keep and (keep >= self.max_turns or cost > budget):
+                break
+            budget -= cost
+            keep += 1
+
+        folded = turns[:len(turns) - keep]
+        view: list[BaseMessage] = [system] if system else []
+        if folded and self.summarize:
+            if summary is not None and summary.text and summary.covered_turns >= len(folded):
+                text = summary.text
+            else:
+                text = " ".join(filter(None, [
+                    summary.text if summary is not None else "",
+                    RollingSummary.extractive(folded[summary.covered_turns if summary else 0:]),
+                ]))
+            view.append(SystemMessage(content=SUMMARY_PREFIX + text))
+        for turn in turns[len(turns) - keep:]:
+            view.extend(turn)
+
+        view_tokens = sum(estimate_tokens(m) for m in view)
+        self._record("follow_up", full_tokens, view_tokens)
+        return ContextView(view, full_tokens, view_tokens, folded)
+
+    def metric_view(self, messages: list[BaseMessage], follow_up_view: ContextView) -> ContextView:
+        if self.metric_context != "narrow":
+            self._record("metrics", follow_up_view.full_tokens, follow_up_view.view_tokens)
+            return follow_up_view
+        system, turns = split_turns(messages)
+        # the probe system prompt carries the original question
+        view = ([system] if system else []) + (turns[-1][:1] if turns else [])
+        full_tokens = follow_up_view.full_tokens
+        view_tokens = sum(estimate_tokens(m) for m in view)
+        self._record("metrics", full_tokens, view_tokens)
+        return ContextView(view, full_tokens, view_tokens, [])
+
+    @staticmethod
+    def _record(chain: str, full_tokens: int, view_tokens: int):
+        tokens_saved.observe(max(full_tokens - view_tokens, 0), chain=chain)
+        tokens_sent.inc(view_tokens, chain=chain)
+
+
+context_policy = ContextPolicy()
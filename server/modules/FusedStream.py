@@ -0,0 +1,176 @@
+import json
+import asyncio
+from typing import AsyncIterator, Optional
+from pydantic import BaseModel
+from langchain_core.messages import AIMessageChunk, SystemMessage
+
+METRICS_OPEN = "<metrics>"
+METRICS_CLOSE = "</metrics>"
+
+_DONE = object()
+
+
+def fused_instruction(schema: type[BaseModel]) -> SystemMessage:
+    """Output contract for fused mode: the metrics block first, then the follow-up question."""
+    return SystemMessage(content=(
+        "Reply in exactly two parts.\n"
+        f"1. First, evaluate the respondent's latest response and write {METRICS_OPEN}"
+        f"a single JSON object matching this JSON schema{METRICS_CLOSE}. "
+        "No code fences, no text before it.\n"
+        f"JSON schema: {json.dumps(schema.model_json_schema(), separators=(',', ':'))}\n"
+        f"2. Then, right after {METRICS_CLOSE}, write only your follow-up question for the respondent."
+    ))
+
+
+class FusedParser:
+    """
+    Incremental splitter for `<metrics>{json}</metrics> follow-up text`.
+
+    `feed()` takes raw text chunks as they stream in and returns
+    ("metrics", raw_json) once the block closes and ("text", chunk) for the
+    follow-up. Markers split across chunk boundaries are handled by holding
+    back at most `len(marker) - 1` characters.
+    """
+
+    def __init__(self):
+        self._state = "preamble"
+        self._buffer = ""
+        self._raw_metrics: list[str] = []
+        self._text_started = False
+        self.metrics_found = False
+
+    def feed(self, text: str) -> list[tuple[str, str]]:
+        self._buffer += text
+        events: list[tuple[str, str]] = []
+        while True:
+            if self._state == "preamble":
+                idx = self._buffer.find(METRICS_OPEN)
+                if idx >= 0:
+                    self._buffer = self._buffer[idx + len(METRICS_OPEN):]
+                    self._state = "metrics"
+                    continue
+                head = self._buffer.lstrip()
+                if head and not METRICS_OPEN.startswith(head[:len(METRICS_OPEN)]):
+                    # the model skipped the metrics block: everything is follow-up text
+                    self._state = "text"
+                    continue
+                return events
+            if self._state == "metrics":
+                idx = self._buffer.find(METRICS_CLOSE)
+                if idx >= 0:
+                    self._raw_metrics.append(self._buffer[:idx])
+                    self._buffer = self._buffer[idx + len(METRICS_CLOSE):]
+                    self._state = "text"
+                    self.metrics_found = True
+                    events.append(("metrics", "".join(self._raw_metrics)))
+                    continue
+                keep = len(METRICS_CLOSE) - 1
+                if len(self._buffer) > keep:
+                    self._raw_metrics.append(self._buffer[:-keep])
+                    self._buffer = self._buffer[-keep:]
+                return events
+            # text
+            chunk, self._buffer = self._buffer, ""
+            if not self._text_started:
+                chunk = chunk.lstrip()
+                self._text_started = bool(chunk)
+            if chunk:
+                events.append(("text", chunk))
+            return events
+
+
+def parse_metrics(raw: str, schema: type[BaseModel]) -> BaseModel:
+    raw = raw.strip()
+    if raw.startswith("```"):
+        raw = raw.strip("`")
+        raw = raw[raw.find("{"):]
+    return schema.model_validate_json(raw)
+
+
+class FusedStream:
+    """
+    Fans one streamed completion out into the (follow-up, metrics) stream
+    pair that `Probe.gen_streamed_follow_up` returns. A single producer task
+    reads the provider stream; `text()` yields `AIMessageChunk`s and
+    `metrics()` yields the parsed schema object and ends as soon as the
+    metrics block closes, so the gate is decided while the follow-up is
+    still generating. `cancel()` aborts the provider call (e.g. when the
+    response is gibberish).
+    """
+
+    def __init__(self, source: AsyncIterator, schema: type[BaseModel]):
+        self._source = source
+        self._schema = schema
+        self._metrics_q: asyncio.Queue = asyncio.Queue()
+        self._text_q: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_started(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        parser = FusedParser()
+        metrics_open = True
+        try:
+            async for chunk in self._source:
+                content = chunk.content if hasattr(chunk, "content") else str(chunk)
+                for kind, payload in parser.feed(content):
+                    if kind == "metrics":
+                        try:
+                            metric = parse_metrics(payload, self._schema)
+                        except Exception as e:
+                            metric = e
+                        # metrics are complete: let the gate run while the follow-up streams
+                        self._metrics_q.put_nowait(metric)
+                        self._metrics_q.put_nowait(_DONE)
+                        metrics_open = False
+                        if isinstance(metric, Exception):
+                            raise metric
+                    else:
+                        self._text_q.put_nowait(AIMessageChunk(content=payload))
+            if not parser.metrics_found:
+                raise ValueError("Fused completion did not contain a metrics block")
+        except Exception as e:
+            if metrics_open:
+                self._metrics_q.put_nowait(e)
+            self._text_q.put_nowait(e)
+        finally:
+            if metrics_open:
+                self._metrics_q.put_nowait(_DONE)
+            self._text_q.put_nowait(_DONE)
+
+    async def _drain(self, queue: asyncio.Queue):
+        self._ensure_started()
+        while (item := await queue.get()) is not _DONE:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def metrics(self) -> AsyncIterator:
+        return self._drain(self._metrics_q)
+
+    def text(self) -> "FusedTextStream":
+        return FusedTextStream(self)
+
+    async def cancel(self):
+        if self._task is None or self._task.done():
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+class FusedTextStream:
+    """Follow-up side of a FusedStream; cancelling it aborts the shared provider call."""
+
+    def __init__(self, fused: FusedStream):
+        self._fused = fused
+
+    def __aiter__(self):
+        return self._fused._drain(self._fused._text_q)
+
+    async def cancel(self):
+        await self._fused.cancel()
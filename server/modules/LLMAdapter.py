@@ -1,10 +1,16 @@
 import os
+import asyncio
+from typing import Any, Optional
 from openai import OpenAI
 from langchain_openai import ChatOpenAI
 from langchain_ollama import ChatOllama
 from langsmith.wrappers import wrap_openai
 from langchain_deepseek import ChatDeepSeek
 from langchain_core.prompts import PromptTemplate, ChatPromptTemplate
+from .ServerLogger import ServerLogger
+from .LLMScheduler import Priority, ScheduledRunnable, estimate_input_tokens, llm_scheduler
+from .SimulatedLLM import LLM_SIMULATE, SimulatedChatModel
+from .LLMCassette import LLM_CASSETTE_MODE, CassetteLLM
 
 OPENAI_ORG = os.environ["OPENAI_ORG"]
 OPENAI_KEY = os.environ["OPENAI_KEY"]
@@ -12,6 +18,161 @@ LLAMA_API_KEY = os.environ["LLAMA_API_KEY"]
 DEEPSEEK_API_KEY = os.environ["DEEPSEEK_API_KEY"]
 LLAMA_API_URL = os.environ.get("LLAMA_API_URL", "https://api.llmapi.com/")
 
+logger = ServerLogger()
+
+LLM_MODELS = {
+    "chatgpt": "gpt-4o-mini",
+    "deepseek": "deepseek-chat",
+    "llama": "llama-2-70b-chat",
+    "ollama-mistral": "dolphin-mistral",
+    "ollama-tiny-llama": "dolphin-mistral",
+}
+
+
+def _build_client(llm_name: str, temperature: float, streaming: bool) -> Any:
+    provider = getattr(llm_name, "value", llm_name)
+    if LLM_CASSETTE_MODE == "replay":
+        return CassetteLLM(provider, LLM_MODELS.get(provider), temperature)
+    client = _provider_client(llm_name, temperature, streaming)
+    if LLM_CASSETTE_MODE == "record" and not _is_raw_llama(llm_name):
+        return CassetteLLM(provider, LLM_MODELS.get(provider), temperature, inner=client)
+    return client
+
+
+def _is_raw_llama(llm_name: str) -> bool:
+    # the llama provider is a raw OpenAI-compatible client, not a LangChain chat model
+    return llm_name == "llama" and not LLM_SIMULATE and LLM_CASSETTE_MODE != "replay"
+
+
+def _provider_client(llm_name: str, temperature: float, streaming: bool) -> Any:
+    if LLM_SIMULATE:
+        return SimulatedChatModel(provider=getattr(llm_name, "value", llm_name))
+    if llm_name == "chatgpt":
+        return ChatOpenAI(
+            organization=OPENAI_ORG,
+            api_key=OPENAI_KEY,
+            model=LLM_MODELS[llm_name],
+            temperature=temperature,
+            max_retries=2,
+            streaming=streaming
+        )
+    elif llm_name == "deepseek":
+        return ChatDeepSeek(
+            api_key=DEEPSEEK_API_KEY,
+            model=LLM_MODELS[llm_name],
+            temperature=temperature,
+            max_tokens=None,
+            timeout=None,
+            max_retries=2,
+            streaming=streaming
+        )
+    elif llm_name == "llama":
+        # Wrap the raw client to enable LangSmith tracing
+        return wrap_openai(OpenAI(
+            api_key=LLAMA_API_KEY,
+            base_url=LLAMA_API_URL,
+        ))
+    elif llm_name in {"ollama-mistral", "ollama-tiny-llama"}:
+        return ChatOllama(model=LLM_MODELS[llm_name], temperature=temperature, streaming=streaming)
+    else:
+        raise ValueError(f"Unsupported LLM: {llm_name}")
+
+
+class LLMClientRegistry:
+    """
+    Process-wide pool of LLM clients keyed by (provider, model, temperature,
+    streaming). Every adapter with the same key shares one client, and so one
+    keep-alive HTTP connection pool, plus its pre-bound structured-output
+    runnables.
+    """
+
+    def __init__(self):
+        self._clients: dict[tuple, Any] = {}
+        self._structured: dict[tuple, Any] = {}
+        self.created = 0
+        self.reused = 0
+
+    def get(self, llm_name: str, temperature: float = 0.0, streaming: bool = False) -> Any:
+        key = (llm_name, LLM_MODELS.get(llm_name), float(temperature), bool(streaming))
+        client = self._clients.get(key)
+        if client is None:
+            client = self._clients[key] = _build_client(llm_name, temperature, streaming)
+            self.created += 1
+        else:
+            self.reused += 1
+        return client
+
+    def structured(self, llm: Any, schema: type) -> Any:
+        """`llm.with_structured_output(schema)`, bound once per pooled client."""
+        key = (id(llm), schema)
+        runnable = self._structured.get(key)
+        if runnable is None:
+            runnable = self._structured[key] = llm.with_structured_output(schema)
+        return runnable
+
+    def scheduled(self, runnable: Any, llm_name: str, priority: Priority) -> ScheduledRunnable:
+        """`runnable` behind the provider's LLMScheduler slots, at `priority`."""
+        key = ("scheduled", id(runnable), priority)
+        scheduled = self._structured.get(key)
+        if scheduled is None:
+            scheduled = self._structured[key] = ScheduledRunnable(runnable, getattr(llm_name, "value", llm_name), priority)
+        return scheduled
+
+    async def warm(self, llm_names: list[str], temperature: float = 0.7, streaming: bool = True, timeout: float = 10.0):
+        """Build the clients the request path uses and open their TLS connections."""
+
+        async def _warm_one(llm_name: str):
+            client = self.get(llm_name, temperature, streaming)
+            root_async_client = getattr(client, "root_async_client", None)
+            if root_async_client is None:
+                return
+            try:
+                await asyncio.wait_for(root_async_client.models.list(), timeout=timeout)
+                logger.info(f"Warmed {llm_name} connection pool")
+            except Exception as e:
+                logger.warn(f"Failed to warm {llm_name} connection pool: {e}")
+
+        await asyncio.gather(*(_warm_one(name) for name in llm_names))
+
+    def router(
+        self,
+        llm_name: str,
+        temperature: float = 0.0,
+        streaming: bool = False,
+        schema: Optional[type] = None,
+        priority: Priority = Priority.FOLLOW_UP,
+    ) -> Any:
+        """
+        LLMRouter preferring `llm_name` and failing over / hedging to the
+        LLM_FALLBACKS providers, built once per key from the pooled clients.
+        """
+        from .LLMRouter import LLM_FALLBACKS, LLMRouter
+
+        primary = getattr(llm_name, "value", llm_name)
+        key = ("router", primary, float(temperature), bool(streaming), schema, priority)
+        router = self._structured.get(key)
+        if router is None:
+            runnables = {}
+            # the raw llama client is not a LangChain runnable and cannot be routed
+            for name in [primary] + [p for p in LLM_FALLBACKS if p not in (primary, "llama")]:
+                client = self.get(name, temperature, streaming)
+                runnable = self.structured(client, schema) if schema is not None else client
+                # each provider is scheduled on its own: a failover waits for the fallback's slots
+                runnables[name] = self.scheduled(runnable, name, priority)
+            router = self._structured[key] = LLMRouter(primary, runnables)
+        return router
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self._clients),
+            "structured_runnables": len(self._structured),
+            "created": self.created,
+            "reused": self.reused,
+        }
+
+
+llm_clients = LLMClientRegistry()
+
 
 class LLMAdapter:
     llm = None
@@ -19,43 +180,44 @@ class LLMAdapter:
     __llama_client = None  # For direct API access
     embeddings = None
 
-    def __init__(self, llm_name: str, temperature: float = 0.0, streaming: bool = False):
+    def __init__(
+        self,
+        llm_name: str,
+        temperature: float = 0.0,
+        streaming: bool = False,
+        priority: Priority = Priority.FOLLOW_UP,
+    ):
+        from .LLMRouter import LLM_FALLBACKS
+
         self.__llm_name = llm_name
-        if llm_name == "chatgpt":
-            self.llm = ChatOpenAI(
-                organization=OPENAI_ORG,
-                api_key=OPENAI_KEY,
-                model="gpt-4o-mini",
-                temperature=temperature,
-                max_retries=2,
-                streaming=streaming
-            )
-        elif llm_name == "deepseek":
-            self.llm = ChatDeepSeek(
-                api_key=DEEPSEEK_API_KEY,
-                model="deepseek-chat",
-                temperature=temperature,
-                max_tokens=None,
-                timeout=None,
-                max_retries=2,
-                streaming=streaming
-            )
-        elif llm_name == "llama":
-            # Wrap the raw client to enable LangSmith tracing
-            self.__llama_client = wrap_openai(OpenAI(
-                api_key=LLAMA_API_KEY, 
-                base_url=LLAMA_API_URL,
-                streaming=streaming
-            ))
-        elif llm_name == "ollama-mistral":
-            self.llm = ChatOllama(model="dolphin-mistral", temperature=temperature, streaming=streaming)
-        elif llm_name == "ollama-tiny-llama":
-            self.llm = ChatOllama(model="dolphin-mistral", temperature=temperature, streaming=streaming)
+        self.__client_args = (temperature, streaming)
+        self.__raw_llama = _is_raw_llama(llm_name)
+        self.__routed = bool(LLM_FALLBACKS) and not self.__raw_llama
+        self.priority = priority
+        if self.__raw_llama:
+            self.__llama_client = llm_clients.get(llm_name, temperature, streaming)
+        elif self.__routed:
+            self.llm = llm_clients.router(llm_name, temperature, streaming, priority=priority)
         else:
-            raise ValueError(f"Unsupported LLM: {llm_name}")
+            self.__client = llm_clients.get(llm_name, temperature, streaming)
+            self.llm = llm_clients.scheduled(self.__client, llm_name, priority)
+
+    def _llm_at(self, priority: Optional[Priority]) -> Any:
+        if priority is None or priority == self.priority:
+            return self.llm
+        if self.__routed:
+            return llm_clients.router(self.__llm_name, *self.__client_args, priority=priority)
+        return llm_clients.scheduled(self.__client, self.__llm_name, priority)
+
+    def structured_llm(self, schema: type, priority: Optional[Priority] = None) -> Any:
+        """Structured-output runnable, scheduled at `priority` (the adapter's own by default)."""
+        priority = self.priority if priority is None else priority
+        if self.__routed:
+            return llm_clients.router(self.__llm_name, *self.__client_args, schema=schema, priority=priority)
+        return llm_clients.scheduled(llm_clients.structured(self.__client, schema), self.__llm_name, priority)
 
     def invoke(self, prompt: PromptTemplate | ChatPromptTemplate, dependencies: dict[str, str]) -> str:
-        if self.__llm_name == "llama":
+        if self.__raw_llama:
             # Handle Llama API directly
             messages = [
                 {"role": "system", "content": "You are a helpful assistant."},
@@ -77,4 +239,23 @@ class LLMAdapter:
             # Handle other LLMs through LangChain
             chain = prompt | self.llm
             response = chain.invoke(dependencies)
-            return response.content
\ No newline at end of file
+            return response.content
+
+    async def ainvoke(
+        self,
+        prompt: PromptTemplate | ChatPromptTemplate,
+        dependencies: dict[str, str],
+        config: Optional[dict] = None,
+        priority: Optional[Priority] = None,
+    ) -> str:
+        if self.__raw_llama:
+            # the raw llama client is sync: keep it off the event loop (and behind its scheduler slots)
+            survey = str(((config or {}).get("metadata") or {}).get("su_id", ""))
+            tokens = estimate_input_tokens(prompt.format(**dependencies))
+            async with llm_scheduler.slot("llama", self.priority if priority is None else priority, survey, tokens):
+                return await asyncio.to_thread(self.invoke, prompt, dependencies)
+        chain = prompt | self._llm_at(priority)
+        response = await chain.ainvoke(dependencies, config=config)
+        if self.__llm_name == "ollama-mistral":
+            return response
+        return response.content
@@ -0,0 +1,255 @@
+import os
+import gzip
+import json
+import time
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Iterator, Optional
+from pydantic import BaseModel
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from .Metrics import metrics
+from .ServerLogger import ServerLogger
+
+logger = ServerLogger()
+
+# off | record (call the provider and save what it streams) | replay (serve cassettes, no provider)
+LLM_CASSETTE_MODE = os.environ.get("LLM_CASSETTE_MODE", "off").lower()
+LLM_CASSETTE_DIR = os.environ.get(
+    "LLM_CASSETTE_DIR", os.path.join(os.path.dirname(__file__), "..", "bench", "cassettes")
+)
+# replay delays are multiplied by this: 1 = recorded timing, 0 = as fast as possible
+LLM_CASSETTE_TIME_SCALE = float(os.environ.get("LLM_CASSETTE_TIME_SCALE", 1.0))
+# what replay does for a prompt that was never recorded: error | simulate
+LLM_CASSETTE_ON_MISS = os.environ.get("LLM_CASSETTE_ON_MISS", "error").lower()
+
+CASSETTE_VERSION = 1
+
+cassette_total = metrics.counter(
+    "monet_llm_cassette_total",
+    "LLM cassette lookups and recordings by mode and result (hit, miss, recorded).",
+    ("mode", "result"),
+)
+
+
+class CassetteMiss(LookupError):
+    """Replay found no cassette for a prompt."""
+
+
+def _to_messages(input: Any) -> list[BaseMessage]:
+    if hasattr(input, "to_messages"):
+        return input.to_messages()
+    if isinstance(input, str):
+        return [HumanMessage(content=input)]
+    return list(input)
+
+
+def prompt_key(provider: str, model: Optional[str], temperature: float, kind: str, input: Any) -> str:
+    """sha256 of everything that decides the completion: provider, model, temperature, output kind and the messages."""
+    messages = [[m.type, m.content] for m in _to_messages(input)]
+    canonical = json.dumps(
+        [provider, model, round(float(temperature), 3), kind, messages],
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CassetteStore:
+    """
+    One gzipped JSON file per prompt hash at `<root>/<hash[:2]>/<hash>.json.gz`,
+    so a lookup is a single file open however many cassettes there are.
+
+        {"v": 1, "kind": "chat", "provider": "chatgpt", "model": "gpt-4o-mini",
+         "chunks": [[ms since previous chunk, "text"], ...]}
+
+    Structured cassettes hold the (partial) schema objects as chunks instead of text.
+    """
+
+    def __init__(self, root: str = LLM_CASSETTE_DIR):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.json.gz")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            with gzip.open(self.path(key), "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, cassette: dict):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump({"v": CASSETTE_VERSION, **cassette}, f, separators=(",", ":"), ensure_ascii=False)
+        # concurrent recorders of the same prompt: last complete file wins
+        os.replace(tmp, path)
+
+
+cassettes = CassetteStore()
+
+
+class _Recording:
+    """Inter-chunk timings of one call, in milliseconds since the previous chunk (the first is the TTFT)."""
+
+    def __init__(self):
+        self.chunks: list[list] = []
+        self._last = time.perf_counter()
+
+    def add(self, payload: Any):
+        now = time.perf_counter()
+        self.chunks.append([round((now - self._last) * 1000, 1), payload])
+        self._last = now
+
+
+class CassetteLLM(Runnable):
+    """
+    Stand-in for a provider chat model (or its `with_structured_output`).
+
+    record: calls `inner` and saves what it streamed, with timings, under the
+    prompt hash. replay: serves the cassette with the recorded delays scaled by
+    LLM_CASSETTE_TIME_SCALE and never touches a provider.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        model: Optional[str],
+        temperature: float,
+        inner: Optional[Runnable] = None,
+        schema: Optional[type[BaseModel]] = None,
+        store: CassetteStore = cassettes,
+        time_scale: float = LLM_CASSETTE_TIME_SCALE,
+    ):
+        self.provider = provider
+        self.model = model
+        self.temperature = temperature
+        self.inner = inner
+        self.schema = schema
+        self.store = store
+        self.time_scale = time_scale
+        self.mode = "record" if inner is not None else "replay"
+        self.kind = f"structured:{schema.__name__}" if schema is not None else "chat"
+
+    @property
+    def root_async_client(self) -> Any:
+        # lets LLMClientRegistry.warm open the recorded provider's connections
+        return getattr(self.inner, "root_async_client", None)
+
+    def with_structured_output(self, schema: type[BaseModel], **kwargs) -> "CassetteLLM":
+        inner = self.inner.with_structured_output(schema, **kwargs) if self.inner is not None else None
+        return CassetteLLM(self.provider, self.model, self.temperature, inner, schema, self.store, self.time_scale)
+
+    def _key(self, input: Any) -> str:
+        return prompt_key(self.provider, self.model, self.temperature, self.kind, input)
+
+    # -- encoding
+
+    def _encode(self, chunk: Any) -> Any:
+        if self.schema is not None:
+            return chunk.model_dump(mode="json") if isinstance(chunk, BaseModel) else chunk
+        return chunk.content if hasattr(chunk, "content") else str(chunk)
+
+    def _decode(self, payload: Any, final: bool = False) -> Any:
+        if self.schema is not None:
+            return self.schema.model_validate(payload)
+        return AIMessage(content=payload) if final else AIMessageChunk(content=payload)
+
+    def _save(self, key: str, recording: _Recording, overwrite: bool = True):
+        # a one-chunk invoke never replaces a streamed recording of the same prompt (replay joins those)
+        if not overwrite and self.store.exists(key):
+            return
+        self.store.put(key, {
+            "kind": self.kind,
+            "provider": self.provider,
+            "model": self.model,
+            "chunks": recording.chunks,
+        })
+        cassette_total.inc(mode="record", result="recorded")
+
+    # -- replay
+
+    def _load(self, key: str) -> Optional[dict]:
+        cassette = self.store.get(key)
+        if cassette is not None:
+            cassette_total.inc(mode="replay", result="hit")
+            return cassette
+        cassette_total.inc(mode="replay", result="miss")
+        if LLM_CASSETTE_ON_MISS == "simulate":
+            logger.warn(f"No {self.kind} cassette for {self.provider} prompt {key}, simulating")
+            return None
+        raise CassetteMiss(f"No {self.kind} cassette for {self.provider} prompt {key} under {self.store.root}")
+
+    def _simulated(self) -> Runnable:
+        from .SimulatedLLM import SimulatedChatModel
+
+        model = SimulatedChatModel(provider=self.provider)
+        return model.with_structured_output(self.schema) if self.schema is not None else model
+
+    def _joined(self, cassette: dict) -> tuple[float, Any]:
+        delay = sum(ms for ms, _ in cassette["chunks"]) / 1000 * self.time_scale
+        if self.schema is not None:
+            return delay, self._decode(cassette["chunks"][-1][1])
+        return delay, self._decode("".join(text for _, text in cassette["chunks"]), final=True)
+
+    # -- Runnable
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> Any:
+        key = self._key(input)
+        if self.mode == "record":
+            recording = _Recording()
+            result = self.inner.invoke(input, config, **kwargs)
+            recording.add(self._encode(result))
+            self._save(key, recording, overwrite=False)
+            return result
+        cassette = self._load(key)
+        if cassette is None:
+            return self._simulated().invoke(input, config, **kwargs)
+        delay, result = self._joined(cassette)
+        time.sleep(delay)
+        return result
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> Any:
+        key = self._key(input)
+        if self.mode == "record":
+            recording = _Recording()
+            result = await self.inner.ainvoke(input, config, **kwargs)
+            recording.add(self._encode(result))
+            self._save(key, recording, overwrite=False)
+            return result
+        cassette = self._load(key)
+        if cassette is None:
+            return await self._simulated().ainvoke(input, config, **kwargs)
+        delay, result = self._joined(cassette)
+        await asyncio.sleep(delay)
+        return result
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> Iterator:
+        yield self.invoke(input, config, **kwargs)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> AsyncIterator:
+        key = self._key(input)
+        if self.mode == "record":
+            recording = _Recording()
+            async for chunk in self.inner.astream(input, config, **kwargs):
+                recording.add(self._encode(chunk))
+                yield chunk
+            # only complete streams are saved: a cancelled call leaves no cassette
+            self._save(key, recording)
+            return
+        cassette = self._load(key)
+        if cassette is None:
+            async for chunk in self._simulated().astream(input, config, **kwargs):
+                yield chunk
+            return
+        for ms, payload in cassette["chunks"]:
+            if ms and self.time_scale:
+                await asyncio.sleep(ms / 1000 * self.time_scale)
+            yield self._decode(payload)
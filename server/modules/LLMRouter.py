@@ -0,0 +1,391 @@
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+from langchain_core.runnables import Runnable, RunnableConfig
+from .Metrics import metrics
+from .ServerLogger import ServerLogger
+
+logger = ServerLogger()
+
+# extra providers the router may fail over / hedge to, in order (the survey's llm always comes first)
+LLM_FALLBACKS = [p.strip() for p in os.environ.get("LLM_FALLBACKS", "").split(",") if p.strip()]
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", 95))
+LLM_HEDGE_DEFAULT_MS = float(os.environ.get("LLM_HEDGE_DEFAULT_MS", 2000))
+LLM_HEDGE_MIN_MS = float(os.environ.get("LLM_HEDGE_MIN_MS", 300))
+LLM_HEDGE_MAX_MS = float(os.environ.get("LLM_HEDGE_MAX_MS", 5000))
+LLM_FIRST_TOKEN_TIMEOUT = float(os.environ.get("LLM_FIRST_TOKEN_TIMEOUT_SECONDS", 30))
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_OPEN_SECONDS = float(os.environ.get("LLM_BREAKER_OPEN_SECONDS", 30))
+LLM_STATS_WINDOW = int(os.environ.get("LLM_STATS_WINDOW", 200))
+# TTFT samples needed before the hedge delay follows the measured percentile
+MIN_HEDGE_SAMPLES = 20
+
+ttft_seconds = metrics.histogram(
+    "monet_llm_ttft_seconds",
+    "Time to first chunk per LLM provider, as seen by the router.",
+    ("provider",),
+)
+requests_total = metrics.counter(
+    "monet_llm_requests_total",
+    "Routed LLM calls by provider and result (ok, error, timeout, cancelled).",
+    ("provider", "result"),
+)
+hedges_total = metrics.counter(
+    "monet_llm_hedges_total",
+    "Hedged LLM calls by which attempt won (primary, hedge).",
+    ("winner",),
+)
+
+
+class ProviderHealth:
+    """Rolling TTFT / error window and circuit breaker for one provider."""
+
+    def __init__(
+        self,
+        name: str,
+        window: int = LLM_STATS_WINDOW,
+        failure_threshold: int = LLM_BREAKER_FAILURES,
+        open_seconds: float = LLM_BREAKER_OPEN_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self._ttfts: deque = deque(maxlen=window)
+        self._outcomes: deque = deque(maxlen=window)
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        # half-open admits one trial call; the rest are refused until it resolves
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._clock() - self.opened_at >= self.open_seconds:
+            return "half_open"
+        return "open"
+
+    def available(self) -> bool:
+        """Closed, or half-open with the trial call still unclaimed."""
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.trial_in_flight)
+
+    def acquire(self) -> Optional[str]:
+        """
+        Admit one call: "call" while closed, "trial" for the single call a
+        half-open breaker lets through (claimed until it succeeds, fails or
+        is cancelled), None when refused.
+        """
+        state = self.state
+        if state == "closed":
+            return "call"
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return "trial"
+        return None
+
+    def release(self, admission: Optional[str]):
+        """Give back a trial that ended without a verdict (cancelled, e.g. it lost a hedge)."""
+        if admission == "trial":
+            self.trial_in_flight = False
+
+    def record_ttft(self, seconds: float):
+        self._ttfts.append(seconds)
+        ttft_seconds.observe(seconds, provider=self.name)
+
+    def record_success(self, admission: Optional[str] = None):
+        self.release(admission)
+        self._outcomes.append(True)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        requests_total.inc(provider=self.name, result="ok")
+
+    def record_failure(self, result: str = "error", admission: Optional[str] = None):
+        self.release(admission)
+        self._outcomes.append(False)
+        self.consecutive_failures += 1
+        requests_total.inc(provider=self.name, result=result)
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warn(f"LLM circuit breaker opened for {self.name} ({self.consecutive_failures} failures)")
+            self.opened_at = self._clock()
+
+    def ttft_percentile(self, pct: float) -> Optional[float]:
+        if len(self._ttfts) < MIN_HEDGE_SAMPLES:
+            return None
+        ordered = sorted(self._ttfts)
+        return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def hedge_delay(self) -> float:
+        measured = self.ttft_percentile(LLM_HEDGE_PERCENTILE)
+        delay_ms = measured * 1000 if measured is not None else LLM_HEDGE_DEFAULT_MS
+        return min(max(delay_ms, LLM_HEDGE_MIN_MS), LLM_HEDGE_MAX_MS) / 1000
+
+    def stats(self) -> dict:
+        p50 = self.ttft_percentile(50)
+        p95 = self.ttft_percentile(95)
+        return {
+            "state": self.state,
+            "trial_in_flight": self.trial_in_flight,
+            "consecutive_failures": self.consecutive_failures,
+            "error_rate": round(self.error_rate(), 4),
+            "ttft_p50_s": round(p50, 4) if p50 is not None else None,
+            "ttft_p95_s": round(p95, 4) if p95 is not None else None,
+            "samples": len(self._ttfts),
+        }
+
+
+class ProviderHealthRegistry:
+    def __init__(self):
+        self._providers: dict[str, ProviderHealth] = {}
+
+    def get(self, name: str) -> ProviderHealth:
+        health = self._providers.get(name)
+        if health is None:
+            health = self._providers[name] = ProviderHealth(name)
+        return health
+
+    def stats(self) -> dict:
+        return {name: health.stats() for name, health in self._providers.items()}
+
+
+provider_health = ProviderHealthRegistry()
+
+
+class _Attempt:
+    """One provider's stream, driven by a task; the first event resolves `first`."""
+
+    def __init__(
+        self,
+        provider: str,
+        admission: Optional[str],
+        runnable: Runnable,
+        input: Any,
+        config: Optional[RunnableConfig],
+        **kwargs,
+    ):
+        self.provider = provider
+        self.admission = admission
+        self.health = provider_health.get(provider)
+        self.started = time.perf_counter()
+        self.first: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run(runnable, input, config, **kwargs))
+
+    def _emit(self, event: tuple):
+        if not self.first.done():
+            self.first.set_result(event)
+        else:
+            self.queue.put_nowait(event)
+
+    async def _run(self, runnable: Runnable, input: Any, config, **kwargs):
+        try:
+            async for chunk in runnable.astream(input, config, **kwargs):
+                if not self.first.done():
+                    self.health.record_ttft(time.perf_counter() - self.started)
+                self._emit(("chunk", chunk))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.health.record_failure(admission=self.admission)
+            self._emit(("error", e))
+            return
+        self.health.record_success(self.admission)
+        self._emit(("done", None))
+
+    async def cancel(self, result: str = "cancelled"):
+        if self.task.done():
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except (asyncio.CancelledError, Exception):
+            pass
+        if result == "timeout":
+            self.health.record_failure("timeout", self.admission)
+        else:
+            self.health.release(self.admission)
+            requests_total.inc(provider=self.provider, result=result)
+
+
+class LLMRouter(Runnable):
+    """
+    Runnable that stands in for a single provider's chat model.
+
+    The survey's provider is always preferred; configured fallbacks are used
+    when its circuit breaker is open or it fails before the first chunk
+    (after that, errors propagate: a half-streamed answer is never
+    restarted elsewhere). With hedging on, a second provider is started
+    once the first has been silent for its rolling p95 TTFT; whichever
+    streams first wins and the other is cancelled.
+    """
+
+    def __init__(
+        self,
+        primary: str,
+        runnables: dict[str, Runnable],
+        hedge: bool = LLM_HEDGE,
+        first_token_timeout: float = LLM_FIRST_TOKEN_TIMEOUT,
+    ):
+        self.primary = primary
+        self.runnables = runnables
+        self.hedge = hedge
+        self.first_token_timeout = first_token_timeout
+
+    def candidates(self) -> list[str]:
+        """Primary first, then fallbacks by rolling p95 TTFT; providers with an open breaker are skipped."""
+        fallbacks = [name for name in self.runnables if name != self.primary]
+        fallbacks.sort(key=lambda name: provider_health.get(name).ttft_percentile(95) or float("inf"))
+        ordered = [self.primary] + fallbacks
+        available = [name for name in ordered if provider_health.get(name).available()]
+        # all breakers open: still try the primary rather than failing outright
+        return available or [self.primary]
+
+    def _admit(self, name: str, candidates: list[str]) -> tuple[bool, Optional[str]]:
+        """(may call, admission) for `name`; the last-resort primary is always called."""
+        admission = provider_health.get(name).acquire()
+        return admission is not None or candidates == [self.primary], admission
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> Any:
+        last_error: Optional[Exception] = None
+        candidates = self.candidates()
+        for name in candidates:
+            allowed, admission = self._admit(name, candidates)
+            if not allowed:
+                continue
+            health = provider_health.get(name)
+            started = time.perf_counter()
+            try:
+                result = self.runnables[name].invoke(input, config, **kwargs)
+            except Exception as e:
+                health.record_failure(admission=admission)
+                last_error = e
+                logger.warn(f"LLM provider {name} failed, failing over: {e}")
+                continue
+            except BaseException:
+                health.release(admission)
+                raise
+            health.record_ttft(time.perf_counter() - started)
+            health.record_success(admission)
+            return result
+        raise last_error or RuntimeError("No LLM provider admitted the call (circuit breakers open)")
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> Any:
+        last_error: Optional[Exception] = None
+        candidates = self.candidates()
+        for name in candidates:
+            allowed, admission = self._admit(name, candidates)
+            if not allowed:
+                continue
+            health = provider_health.get(name)
+            started = time.perf_counter()
+            try:
+                result = await self.runnables[name].ainvoke(input, config, **kwargs)
+            except Exception as e:
+                health.record_failure(admission=admission)
+                last_error = e
+                logger.warn(f"LLM provider {name} failed, failing over: {e}")
+                continue
+            except BaseException:
+                health.release(admission)
+                raise
+            health.record_ttft(time.perf_counter() - started)
+            health.record_success(admission)
+            return result
+        raise last_error or RuntimeError("No LLM provider admitted the call (circuit breakers open)")
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> Iterator:
+        yield self.invoke(input, config, **kwargs)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> AsyncIterator:
+        candidates = self.candidates()
+        queued = list(candidates)
+        attempts: list[_Attempt] = []
+        hedged = False
+        last_error: Optional[Exception] = None
+        winner: Optional[_Attempt] = None
+        primary: Optional[_Attempt] = None
+        first_event: Optional[tuple] = None
+
+        def _start() -> Optional[_Attempt]:
+            # skip providers whose half-open trial another request claimed meanwhile
+            while queued:
+                name = queued.pop(0)
+                allowed, admission = self._admit(name, candidates)
+                if allowed:
+                    attempt = _Attempt(name, admission, self.runnables[name], input, config, **kwargs)
+                    attempts.append(attempt)
+                    return attempt
+            return None
+
+        try:
+            primary = _start()
+            while winner is None:
+                if not attempts:
+                    if _start() is None:
+                        raise last_error or RuntimeError("No LLM provider produced a response")
+                now = time.perf_counter()
+                deadlines = [a.started + self.first_token_timeout for a in attempts]
+                hedge_at = None
+                if self.hedge and not hedged and queued and len(attempts) == 1:
+                    hedge_at = attempts[0].started + attempts[0].health.hedge_delay()
+                wake_at = min(deadlines + ([hedge_at] if hedge_at is not None else []))
+                done, _ = await asyncio.wait(
+                    [a.first for a in attempts],
+                    timeout=max(wake_at - now, 0),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+
+                if not done:
+                    now = time.perf_counter()
+                    for attempt in [a for a in attempts if a.started + self.first_token_timeout <= now]:
+                        logger.warn(f"LLM provider {attempt.provider} sent nothing in {self.first_token_timeout}s")
+                        attempts.remove(attempt)
+                        await attempt.cancel("timeout")
+                        last_error = asyncio.TimeoutError(f"{attempt.provider} first token timeout")
+                    if hedge_at is not None and now >= hedge_at and queued and attempts:
+                        hedged = _start() is not None
+                    continue
+
+                for attempt in list(attempts):
+                    if not attempt.first.done():
+                        continue
+                    kind, payload = attempt.first.result()
+                    if kind == "error":
+                        attempts.remove(attempt)
+                        last_error = payload
+                        logger.warn(f"LLM provider {attempt.provider} failed before streaming, failing over: {payload}")
+                        continue
+                    if winner is None:
+                        winner, first_event = attempt, (kind, payload)
+
+            for attempt in attempts:
+                if attempt is not winner:
+                    await attempt.cancel()
+            if hedged:
+                # the primary may have been dropped from `attempts` (timeout, error) before the winner arrived
+                hedges_total.inc(winner="primary" if winner is primary else "hedge")
+
+            event = first_event
+            while True:
+                kind, payload = event
+                if kind == "chunk":
+                    yield payload
+                elif kind == "error":
+                    raise payload
+                else:
+                    return
+                event = await winner.queue.get()
+        finally:
+            for attempt in attempts:
+                await attempt.cancel()
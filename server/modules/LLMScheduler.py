@@ -0,0 +1,265 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from enum import IntEnum
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+from langchain_core.runnables import Runnable, RunnableConfig
+from .ContextPolicy import estimate_tokens
+from .Metrics import metrics
+from .ServerLogger import ServerLogger
+
+logger = ServerLogger()
+
+LLM_SCHEDULER = os.environ.get("LLM_SCHEDULER", "true").lower() == "true"
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 32))
+# 0 disables the token-rate limit
+LLM_TOKENS_PER_MINUTE = int(os.environ.get("LLM_TOKENS_PER_MINUTE", 0))
+# output tokens charged on top of the prompt estimate when a call is admitted
+LLM_SCHEDULER_OUTPUT_TOKENS = int(os.environ.get("LLM_SCHEDULER_OUTPUT_TOKENS", 256))
+
+queue_wait_seconds = metrics.histogram(
+    "monet_llm_queue_wait_seconds",
+    "Time LLM calls waited in the scheduler for a provider slot.",
+    ("provider", "priority"),
+)
+admitted_total = metrics.counter(
+    "monet_llm_admitted_total",
+    "LLM calls admitted by the scheduler, by whether they had to queue.",
+    ("provider", "priority", "queued"),
+)
+
+
+class Priority(IntEnum):
+    """Scheduling classes, served strictly in this order."""
+
+    FOLLOW_UP = 0  # live follow-up stream the respondent is waiting on
+    METRICS = 1  # per-turn NSIGHT scoring
+    INTENT = 2  # intent extraction and survey warm-up
+    BATCH = 3  # offline / bulk jobs
+
+    @property
+    def label(self) -> str:
+        return self.name.lower()
+
+
+def _provider_setting(name: str, provider: str, default: int) -> int:
+    """`{name}_{PROVIDER}` (e.g. LLM_MAX_CONCURRENCY_CHATGPT) overrides `{name}`."""
+    override = os.environ.get(f"{name}_{provider.upper().replace('-', '_')}")
+    return int(override) if override is not None else default
+
+
+def estimate_input_tokens(input: Any) -> int:
+    """Prompt size of whatever reaches the chat model (prompt value, messages or text)."""
+    if hasattr(input, "to_messages"):
+        input = input.to_messages()
+    if isinstance(input, list):
+        return sum(estimate_tokens(m) for m in input if hasattr(m, "content"))
+    return len(str(input)) // 4
+
+
+class _Waiter:
+    __slots__ = ("priority", "start", "seq", "cost", "future", "enqueued")
+
+    def __init__(self, priority: Priority, start: float, seq: int, cost: int, future: asyncio.Future):
+        self.priority = priority
+        self.start = start
+        self.seq = seq
+        self.cost = cost
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.start, self.seq) < (other.priority, other.start, other.seq)
+
+
+class ProviderScheduler:
+    """
+    Admission control for one provider: at most `max_concurrency` calls in
+    flight and (optionally) a token bucket refilled at `tokens_per_minute`.
+
+    Waiting calls are served by priority class first; within a class, start-time
+    fair queuing by survey (each survey's virtual clock advances by the tokens it
+    was charged) keeps one busy survey from starving the others. The head of the
+    queue is never overtaken, so a large call is not starved by smaller ones.
+    """
+
+    def __init__(self, provider: str, max_concurrency: int, tokens_per_minute: int):
+        self.provider = provider
+        self.max_concurrency = max(max_concurrency, 1)
+        self.tokens_per_minute = max(tokens_per_minute, 0)
+        self._tokens = float(self.tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._heap: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._vtime: dict[Priority, float] = {}
+        self._finish: dict[tuple, float] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.active = 0
+        self.admitted = 0
+
+    def _refill(self):
+        if not self.tokens_per_minute:
+            return
+        now = time.monotonic()
+        rate = self.tokens_per_minute / 60
+        self._tokens = min(self.tokens_per_minute, self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    def _fits(self, cost: int) -> bool:
+        return not self.tokens_per_minute or self._tokens >= cost
+
+    def _charge(self, cost: int):
+        self.active += 1
+        self.admitted += 1
+        if self.tokens_per_minute:
+            self._tokens -= cost
+
+    def _tag(self, priority: Priority, survey: str, cost: int) -> float:
+        vtime = self._vtime.get(priority, 0.0)
+        start = max(vtime, self._finish.get((priority, survey), 0.0))
+        self._finish[(priority, survey)] = start + cost
+        if len(self._finish) > 1024:
+            # surveys that are caught up with the class clock carry no state
+            self._finish = {k: v for k, v in self._finish.items() if v > self._vtime.get(k[0], 0.0)}
+        return start
+
+    def _head(self) -> Optional[_Waiter]:
+        while self._heap and self._heap[0].future.done():
+            heapq.heappop(self._heap)
+        return self._heap[0] if self._heap else None
+
+    def _dispatch(self):
+        self._timer = None
+        self._refill()
+        while self.active < self.max_concurrency:
+            waiter = self._head()
+            if waiter is None:
+                return
+            if not self._fits(waiter.cost):
+                wait = (waiter.cost - self._tokens) / (self.tokens_per_minute / 60)
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._heap)
+            self._vtime[waiter.priority] = waiter.start
+            self._charge(waiter.cost)
+            waiter.future.set_result(None)
+
+    async def acquire(self, priority: Priority, survey: str = "", tokens: int = 0):
+        cost = min(max(tokens, 1), self.tokens_per_minute) if self.tokens_per_minute else max(tokens, 1)
+        self._refill()
+        if self._head() is None and self.active < self.max_concurrency and self._fits(cost):
+            self._charge(cost)
+            admitted_total.inc(provider=self.provider, priority=priority.label, queued="false")
+            queue_wait_seconds.observe(0.0, provider=self.provider, priority=priority.label)
+            return
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(priority, self._tag(priority, survey, cost), next(self._seq), cost, future)
+        heapq.heappush(self._heap, waiter)
+        if self._timer is None:
+            self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # admitted and cancelled in the same tick: hand the slot back
+                self.release()
+            raise
+        admitted_total.inc(provider=self.provider, priority=priority.label, queued="true")
+        queue_wait_seconds.observe(time.perf_counter() - waiter.enqueued, provider=self.provider, priority=priority.label)
+
+    def release(self):
+        self.active -= 1
+        if self._timer is None:
+            self._dispatch()
+
+    def queued(self) -> int:
+        return sum(1 for waiter in self._heap if not waiter.future.done())
+
+    def stats(self) -> dict:
+        self._refill()
+        return {
+            "active": self.active,
+            "queued": self.queued(),
+            "admitted": self.admitted,
+            "max_concurrency": self.max_concurrency,
+            "tokens_per_minute": self.tokens_per_minute,
+            "tokens_available": int(self._tokens) if self.tokens_per_minute else None,
+        }
+
+
+class LLMScheduler:
+    """One ProviderScheduler per provider, sized from LLM_MAX_CONCURRENCY[_<PROVIDER>] / LLM_TOKENS_PER_MINUTE[_<PROVIDER>]."""
+
+    def __init__(self):
+        self._providers: dict[str, ProviderScheduler] = {}
+
+    def get(self, provider: str) -> ProviderScheduler:
+        scheduler = self._providers.get(provider)
+        if scheduler is None:
+            scheduler = self._providers[provider] = ProviderScheduler(
+                provider,
+                _provider_setting("LLM_MAX_CONCURRENCY", provider, LLM_MAX_CONCURRENCY),
+                _provider_setting("LLM_TOKENS_PER_MINUTE", provider, LLM_TOKENS_PER_MINUTE),
+            )
+        return scheduler
+
+    @asynccontextmanager
+    async def slot(self, provider: str, priority: Priority, survey: str = "", tokens: int = 0):
+        """Hold one of `provider`'s slots for the duration of the block."""
+        if not LLM_SCHEDULER:
+            yield
+            return
+        scheduler = self.get(provider)
+        await scheduler.acquire(priority, survey, tokens)
+        try:
+            yield
+        finally:
+            scheduler.release()
+
+    def queued(self) -> int:
+        return sum(scheduler.queued() for scheduler in self._providers.values())
+
+    def stats(self) -> dict:
+        return {name: scheduler.stats() for name, scheduler in self._providers.items()}
+
+
+llm_scheduler = LLMScheduler()
+
+
+def _survey_of(config: Optional[RunnableConfig]) -> str:
+    return str(((config or {}).get("metadata") or {}).get("su_id", ""))
+
+
+class ScheduledRunnable(Runnable):
+    """
+    Wraps a provider's chat model (or structured-output runnable) so every
+    async call and stream waits for a scheduler slot, and holds it until the
+    call returns or the stream is closed. The survey used for fair queuing is
+    read from the run config's `metadata.su_id`.
+
+    Sync `invoke` is not scheduled (the limits are per event loop).
+    """
+
+    def __init__(self, runnable: Runnable, provider: str, priority: Priority):
+        self.runnable = runnable
+        self.provider = provider
+        self.priority = priority
+
+    def _slot(self, input: Any, config: Optional[RunnableConfig]):
+        tokens = estimate_input_tokens(input) + LLM_SCHEDULER_OUTPUT_TOKENS
+        return llm_scheduler.slot(self.provider, self.priority, _survey_of(config), tokens)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> Any:
+        return self.runnable.invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> Any:
+        async with self._slot(input, config):
+            return await self.runnable.ainvoke(input, config, **kwargs)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> AsyncIterator:
+        async with self._slot(input, config):
+            async for chunk in self.runnable.astream(input, config, **kwargs):
+                yield chunk
@@ -0,0 +1,225 @@
+import gc
+import os
+import sys
+import time
+import asyncio
+import threading
+from typing import Optional
+from .Metrics import metrics
+from .Profiler import SERVER_DIR, short_path
+from .ServerLogger import ServerLogger
+
+logger = ServerLogger()
+
+LOOP_MONITOR = os.environ.get("LOOP_MONITOR", "true").lower() == "true"
+LOOP_MONITOR_INTERVAL_MS = float(os.environ.get("LOOP_MONITOR_INTERVAL_MS", 50))
+# a callback that holds the loop longer than this is a stall: its stack is captured
+LOOP_BLOCK_THRESHOLD_MS = float(os.environ.get("LOOP_BLOCK_THRESHOLD_MS", 100))
+LOOP_MONITOR_MAX_SITES = int(os.environ.get("LOOP_MONITOR_MAX_SITES", 200))
+
+UNSAMPLED = "(stall ended before the watchdog sampled it)"
+GC_FRAME = "(garbage collection)"
+
+loop_lag_seconds = metrics.histogram(
+    "monet_event_loop_lag_seconds",
+    "Event loop scheduling delay: how late the monitor's heartbeat woke up.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+loop_stalls_total = metrics.counter(
+    "monet_event_loop_stalls_total",
+    "Heartbeats delayed past LOOP_BLOCK_THRESHOLD_MS, by the server call site that was blocking.",
+    ("site",),
+)
+
+
+class BlockingSite:
+    __slots__ = ("site", "frame", "count", "total_ms", "max_ms", "stack", "last_seen")
+
+    def __init__(self, site: str, frame: str, stack: list[str]):
+        self.site = site
+        self.frame = frame
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.stack = stack
+        self.last_seen = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "site": self.site,
+            "blocking_frame": self.frame,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 1),
+            "max_ms": round(self.max_ms, 1),
+            "mean_ms": round(self.total_ms / self.count, 1) if self.count else 0.0,
+            "last_seen": self.last_seen,
+            "stack": self.stack,
+        }
+
+
+def _capture(frame, collecting: bool) -> tuple[str, str, list[str]]:
+    """(first server call site, innermost frame, stack innermost first) of a blocked loop thread."""
+    # a collection runs inside whatever allocation triggered it: keep the site, blame the collector
+    stack = [GC_FRAME] if collecting else []
+    site = None
+    while frame is not None:
+        code = frame.f_code
+        # the line each frame is executing, not where its function starts
+        label = f"{code.co_name} ({short_path(code.co_filename)}:{frame.f_lineno})"
+        stack.append(label)
+        if site is None and code.co_filename.startswith(SERVER_DIR) and code.co_filename != __file__:
+            site = label
+        frame = frame.f_back
+    innermost = stack[0] if stack else "(no python frame)"
+    return site or innermost, innermost, stack
+
+
+class LoopMonitor:
+    """
+    Event loop lag watchdog.
+
+    A heartbeat task sleeps LOOP_MONITOR_INTERVAL_MS and records how late it
+    woke up (`monet_event_loop_lag_seconds`). A watchdog thread notices when
+    the heartbeat is overdue by more than LOOP_BLOCK_THRESHOLD_MS and grabs the
+    loop thread's stack while it is still blocked; when the heartbeat finally
+    runs, the stall's length is charged to that stack's call site. Sites are
+    keyed by the innermost frame in this server's code (where the sync call
+    was made) plus the innermost Python frame (what it was blocked in), which
+    reads GC_FRAME when the loop thread was inside a garbage collection.
+    """
+
+    def __init__(
+        self,
+        interval_ms: float = LOOP_MONITOR_INTERVAL_MS,
+        threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS,
+        max_sites: int = LOOP_MONITOR_MAX_SITES,
+    ):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.max_sites = max_sites
+        self._sites: dict[tuple, BlockingSite] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread: Optional[int] = None
+        # perf_counter deadline of the next heartbeat, and the stack captured for the current stall
+        self._due: Optional[float] = None
+        self._pending: Optional[tuple] = None
+        self._collecting = False
+        self.beats = 0
+        self.stalls = 0
+        self.max_lag_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="monet-loop-watchdog", daemon=True)
+        self._watchdog.start()
+        gc.callbacks.append(self._on_gc)
+        logger.info(
+            f"Event loop monitor started (heartbeat {self.interval * 1000:.0f}ms, stall threshold {self.threshold * 1000:.0f}ms)"
+        )
+
+    async def stop(self):
+        self._stop.set()
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._due = None
+
+    def _on_gc(self, phase: str, info: dict):
+        if threading.get_ident() == self._loop_thread:
+            self._collecting = phase == "start"
+
+    async def _heartbeat(self):
+        while True:
+            self._due = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - self._due)
+            self.beats += 1
+            loop_lag_seconds.observe(lag)
+            if lag >= self.threshold:
+                self._charge(lag)
+
+    def _watch(self):
+        poll = max(self.threshold / 4, 0.005)
+        while not self._stop.wait(poll):
+            due = self._due
+            if due is None or self._pending is not None and self._pending[0] == due:
+                continue
+            if time.perf_counter() - due < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            self._pending = (due, *_capture(frame, self._collecting))
+
+    def _charge(self, lag: float):
+        pending, self._pending = self._pending, None
+        if pending is not None and pending[0] == self._due:
+            _, site, innermost, stack = pending
+        else:
+            site, innermost, stack = UNSAMPLED, UNSAMPLED, []
+        lag_ms = lag * 1000
+        self.stalls += 1
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        loop_stalls_total.inc(site=site)
+        with self._lock:
+            entry = self._sites.get((site, innermost))
+            if entry is None:
+                if len(self._sites) >= self.max_sites:
+                    # forget the site that has cost the least so far
+                    del self._sites[min(self._sites, key=lambda key: self._sites[key].total_ms)]
+                entry = self._sites[(site, innermost)] = BlockingSite(site, innermost, stack)
+                logger.warn(f"Event loop blocked {lag_ms:.0f}ms at {site} in {innermost}")
+            entry.count += 1
+            entry.total_ms += lag_ms
+            entry.max_ms = max(entry.max_ms, lag_ms)
+            entry.last_seen = time.time()
+
+    def top(self, limit: int = 20, order: str = "total_ms") -> list[dict]:
+        """Call sites that blocked the loop, worst first (`total_ms`, `max_ms` or `count`)."""
+        with self._lock:
+            sites = sorted(self._sites.values(), key=lambda entry: getattr(entry, order), reverse=True)
+            return [entry.to_dict() for entry in sites[:limit]]
+
+    def reset(self):
+        with self._lock:
+            self._sites.clear()
+        self.stalls = 0
+        self.max_lag_ms = 0.0
+
+    def _percentile_ms(self, pct: float) -> float:
+        # bucket upper bound, never above the worst lag actually seen
+        bound = loop_lag_seconds.percentile(pct) or 0.0
+        return round(min(bound * 1000, self.max_lag_ms) if self.max_lag_ms else bound * 1000, 2)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "beats": self.beats,
+            "stalls": self.stalls,
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "lag_p50_ms": self._percentile_ms(50),
+            "lag_p99_ms": self._percentile_ms(99),
+            "sites": len(self._sites),
+        }
+
+
+loop_monitor = LoopMonitor()
@@ -0,0 +1,179 @@
+import os
+import copy
+import time
+import asyncio
+from typing import Any, Optional
+from bson import ObjectId, json_util
+from pymongo.results import DeleteResult, InsertManyResult, InsertOneResult
+from .ServerLogger import ServerLogger
+
+logger = ServerLogger()
+
+# MONGO_CONNECTION=memory:// keeps every collection in process (offline benches);
+# MEMORY_MONGO_SEED points at an extended-JSON file {"<db>": {"<collection>": [docs]}}
+MEMORY_SCHEME = "memory://"
+# simulated server round trip per call; MEMORY_MONGO_BLOCKING makes the async client
+# hold the event loop for it, the way a sync pymongo call on the request path does
+MEMORY_MONGO_LATENCY_MS = float(os.environ.get("MEMORY_MONGO_LATENCY_MS", 0))
+MEMORY_MONGO_BLOCKING = os.environ.get("MEMORY_MONGO_BLOCKING", "false").lower() == "true"
+
+# "<db>.<collection>" -> documents, shared by the sync and async clients
+_collections: dict[str, list[dict]] = {}
+_seeded = False
+
+
+def _seed():
+    global _seeded
+    if _seeded:
+        return
+    _seeded = True
+    path = os.environ.get("MEMORY_MONGO_SEED")
+    if not path:
+        return
+    with open(path, encoding="utf-8") as f:
+        databases = json_util.loads(f.read())
+    for database, collections in databases.items():
+        for name, docs in collections.items():
+            _collections.setdefault(f"{database}.{name}", []).extend(docs)
+    logger.info(f"Seeded in-memory Mongo from {path}")
+
+
+def _matches(doc: dict, filter: Optional[dict]) -> bool:
+    """Equality and `$in` on top-level fields: the subset the request path queries with."""
+    for field, condition in (filter or {}).items():
+        value = doc.get(field)
+        if isinstance(condition, dict) and "$in" in condition:
+            if value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _round_trip():
+    if MEMORY_MONGO_LATENCY_MS:
+        time.sleep(MEMORY_MONGO_LATENCY_MS / 1000)
+
+
+async def _async_round_trip():
+    if not MEMORY_MONGO_LATENCY_MS:
+        return
+    if MEMORY_MONGO_BLOCKING:
+        time.sleep(MEMORY_MONGO_LATENCY_MS / 1000)
+    else:
+        await asyncio.sleep(MEMORY_MONGO_LATENCY_MS / 1000)
+
+
+class _Cursor:
+    def __init__(self, docs: list[dict]):
+        self._docs = docs
+
+    def sort(self, key: str, direction: int = 1) -> "_Cursor":
+        self._docs.sort(key=lambda doc: (doc.get(key) is None, doc.get(key)), reverse=direction < 0)
+        return self
+
+    def limit(self, count: int) -> "_Cursor":
+        if count:
+            self._docs = self._docs[:count]
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> list[dict]:
+        return self._docs[:length] if length else list(self._docs)
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        for doc in self._docs:
+            yield doc
+
+    def __iter__(self):
+        return iter(self._docs)
+
+
+class SyncMemoryCollection:
+    """The pymongo `Collection` calls this service makes, over an in-process list."""
+
+    def __init__(self, database: str, name: str):
+        self.full_name = f"{database}.{name}"
+        self.name = name
+        _seed()
+        self._docs = _collections.setdefault(self.full_name, [])
+
+    def find_one(self, filter: Optional[dict] = None, *args, **kwargs) -> Optional[dict]:
+        _round_trip()
+        return self._find_one(filter)
+
+    def _find_one(self, filter: Optional[dict]) -> Optional[dict]:
+        return next((copy.deepcopy(doc) for doc in self._docs if _matches(doc, filter)), None)
+
+    def find(self, filter: Optional[dict] = None, *args, **kwargs) -> _Cursor:
+        return _Cursor([copy.deepcopy(doc) for doc in self._docs if _matches(doc, filter)])
+
+    def count_documents(self, filter: Optional[dict] = None, **kwargs) -> int:
+        return sum(1 for doc in self._docs if _matches(doc, filter))
+
+    def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        document.setdefault("_id", ObjectId())
+        self._docs.append(copy.deepcopy(document))
+        return InsertOneResult(document["_id"], acknowledged=True)
+
+    def insert_many(self, documents: list[dict], ordered: bool = True, **kwargs) -> InsertManyResult:
+        ids = [self.insert_one(document).inserted_id for document in documents]
+        return InsertManyResult(ids, acknowledged=True)
+
+    def delete_many(self, filter: Optional[dict] = None, **kwargs) -> DeleteResult:
+        keep = [doc for doc in self._docs if not _matches(doc, filter)]
+        deleted = len(self._docs) - len(keep)
+        self._docs[:] = keep
+        return DeleteResult({"n": deleted}, acknowledged=True)
+
+
+class MemoryCollection(SyncMemoryCollection):
+    """Async (`AsyncMongoClient`) flavour of SyncMemoryCollection."""
+
+    async def find_one(self, filter: Optional[dict] = None, *args, **kwargs) -> Optional[dict]:
+        await _async_round_trip()
+        return self._find_one(filter)
+
+    async def count_documents(self, filter: Optional[dict] = None, **kwargs) -> int:
+        return super().count_documents(filter, **kwargs)
+
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        return super().insert_one(document, **kwargs)
+
+    async def insert_many(self, documents: list[dict], ordered: bool = True, **kwargs) -> InsertManyResult:
+        ids = [(await self.insert_one(document)).inserted_id for document in documents]
+        return InsertManyResult(ids, acknowledged=True)
+
+    async def delete_many(self, filter: Optional[dict] = None, **kwargs) -> DeleteResult:
+        return super().delete_many(filter, **kwargs)
+
+
+class _MemoryDatabase:
+    def __init__(self, name: str, asynchronous: bool):
+        self.name = name
+        self._collection_cls = MemoryCollection if asynchronous else SyncMemoryCollection
+
+    def __getitem__(self, name: str):
+        return self._collection_cls(self.name, name)
+
+    def get_collection(self, name: str):
+        return self[name]
+
+
+class MemoryMongoClient:
+    """Stand-in for MongoClient / AsyncMongoClient when MONGO_CONNECTION is `memory://`."""
+
+    def __init__(self, asynchronous: bool = False):
+        self._asynchronous = asynchronous
+
+    def __getitem__(self, name: str) -> _MemoryDatabase:
+        return _MemoryDatabase(name, self._asynchronous)
+
+
+def reset():
+    """Drop every in-memory collection (the seed is loaded again on next use)."""
+    global _seeded
+    _collections.clear()
+    _seeded = False
@@ -0,0 +1,210 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+from .Tracing import tracer
+
+# latency buckets in seconds, from sub-millisecond sends up to slow LLM streams
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+Sample = tuple[str, dict, float]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(label, "")) for label in self.labelnames)
+
+    def samples(self) -> list[Sample]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[Sample]:
+        return [
+            (self.name, dict(zip(self.labelnames, key)), value)
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Gauge whose value is read from `fn` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, fn: Callable[[], float]):
+        super().__init__(name, documentation)
+        self._fn = fn
+
+    def samples(self) -> list[Sample]:
+        return [(self.name, {}, float(self._fn()))]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts..., +Inf count, sum]
+        self._values: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[idx] += 1
+            state[-1] += value
+
+    def percentile(self, pct: float, **labels) -> Optional[float]:
+        """Upper bound of the bucket holding the `pct` percentile (None without data)."""
+        state = self._values.get(self._key(labels))
+        if not state:
+            return None
+        total = sum(state[:-1])
+        if not total:
+            return None
+        rank = total * pct / 100
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+            running += count
+            if running >= rank:
+                return bound
+        return float("inf")
+
+    def samples(self) -> list[Sample]:
+        samples: list[Sample] = []
+        for key, state in sorted(self._values.items()):
+            labels = dict(zip(self.labelnames, key))
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                running += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, running))
+            samples.append((f"{self.name}_sum", labels, state[-1]))
+            samples.append((f"{self.name}_count", labels, running))
+        return samples
+
+
+class MetricsRegistry:
+    """In-process metrics, exported in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, fn: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(name, documentation, fn))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+metrics = MetricsRegistry()
+
+STAGE_LABELS = ("stage", "provider", "db_type")
+
+stage_seconds = metrics.histogram(
+    "monet_stage_seconds",
+    "Duration of each stage of a websocket turn.",
+    STAGE_LABELS,
+)
+stage_errors = metrics.counter(
+    "monet_stage_errors_total",
+    "Stages that raised an exception.",
+    STAGE_LABELS,
+)
+
+
+@contextmanager
+def time_stage(stage: str, **labels):
+    """Record the duration of the wrapped block under `monet_stage_seconds{stage=...}` (and as a span of the current turn)."""
+    started = time.perf_counter()
+    with tracer.span(stage, **labels):
+        try:
+            yield
+        except Exception:
+            stage_errors.inc(stage=stage, **labels)
+            raise
+        finally:
+            stage_seconds.observe(time.perf_counter() - started, stage=stage, **labels)
+
+
+def observe_stage(stage: str, seconds: float, **labels):
+    stage_seconds.observe(seconds, stage=stage, **labels)
+    tracer.record(stage, seconds, **labels)
@@ -1,6 +1,7 @@
 import os
 from pymongo import MongoClient, AsyncMongoClient
 from .ServerLogger import ServerLogger
+from .MemoryMongo import MEMORY_SCHEME, MemoryMongoClient
 
 logger = ServerLogger()
 
@@ -16,7 +17,9 @@ class MongoCore:
     def __init__(self, **kwargs):
         self.instance_details = {**self.instance_details, **kwargs}
         logger.info(f"{logger.doc} connected to {self.instance_details['database']}")
-        if kwargs.get("async-client"):
+        if self.mongo_uri and self.mongo_uri.startswith(MEMORY_SCHEME):
+            self.__db_connection = MemoryMongoClient(asynchronous=bool(kwargs.get("async-client")))
+        elif kwargs.get("async-client"):
             logger.warn(f"{logger.WIP} Initializing async client")
             self.__db_connection = AsyncMongoClient(
                 self.mongo_uri, tls=True, tlsAllowInvalidCertificates=True
@@ -38,3 +41,7 @@ class MongoCore:
 
 monet_db = MongoCore(database="diy_monet")
 monet_db_test = MongoCore(database="diy_monet_test")
+
+# async clients for the request path (websocket handlers must never block the loop)
+monet_db_async = MongoCore(**{"database": "diy_monet", "async-client": True})
+monet_db_test_async = MongoCore(**{"database": "diy_monet_test", "async-client": True})
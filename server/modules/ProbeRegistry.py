@@ -0,0 +1,167 @@
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+from .ServerLogger import ServerLogger
+
+logger = ServerLogger()
+
+EvictCallback = Callable[[str, Any, str], None]
+
+
+def close_probe(key: str, probe: Any, reason: str):
+    """Default eviction callback: release the probe's clients."""
+    close = getattr(probe, "close", None)
+    if callable(close):
+        close()
+
+
+class ProbeRegistry:
+    """
+    Bounded registry of live Probe sessions keyed by `su_id-qs_id-mo_id`.
+
+    Entries are kept in LRU order and evicted when they sit idle longer than
+    `idle_ttl_seconds`, or when the registry grows past `max_entries` or
+    `max_bytes`. A probe's size is measured on `put` and again on `touch`,
+    which the handler calls after every turn as the history grows. Every
+    eviction runs the registered callbacks so the probe's clients get closed
+    instead of waiting for the garbage collector.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        idle_ttl_seconds: Optional[float] = None,
+        on_evict: Optional[list[EvictCallback]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries or int(os.environ.get("PROBE_REGISTRY_MAX_ENTRIES", 1000))
+        self.max_bytes = max_bytes or int(os.environ.get("PROBE_REGISTRY_MAX_BYTES", 256 * 1024 * 1024))
+        self.idle_ttl_seconds = idle_ttl_seconds or float(os.environ.get("PROBE_REGISTRY_IDLE_TTL_SECONDS", 1800))
+        self._on_evict: list[EvictCallback] = list(on_evict) if on_evict is not None else [close_probe]
+        self._clock = clock
+        # key -> (probe, last_used, size)
+        self._entries: "OrderedDict[str, tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        self.purge_expired()
+        return key in self._entries
+
+    def add_evict_callback(self, callback: EvictCallback):
+        self._on_evict.append(callback)
+
+    def get(self, key: str) -> Any:
+        """Return the live probe for `key` (refreshing its idle timer) or None."""
+        self.purge_expired()
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        probe, _, size = entry
+        self._entries[key] = (probe, self._clock(), size)
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return probe
+
+    def put(self, key: str, probe: Any):
+        """Register `probe` under `key`, evicting whatever it replaces and anything over budget."""
+        existing = self._entries.pop(key, None)
+        if existing is not None:
+            self._bytes -= existing[2]
+            if existing[0] is not probe:
+                self._evict(key, existing[0], "replaced")
+        size = self._sizeof(probe)
+        self._entries[key] = (probe, self._clock(), size)
+        self._bytes += size
+        self.purge_expired()
+        self._enforce_budget()
+
+    def touch(self, key: str) -> bool:
+        """
+        Re-measure the probe under `key` after a turn grew its history, and
+        evict other entries if that pushed the registry over `max_bytes`.
+        Returns False if the entry is gone (evicted or released meanwhile).
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        probe, _, size = entry
+        new_size = self._sizeof(probe)
+        self._entries[key] = (probe, self._clock(), new_size)
+        self._bytes += new_size - size
+        self._enforce_budget()
+        return True
+
+    def discard(self, key: str, reason: str = "released"):
+        """Drop `key` from the registry (e.g. the session ended)."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+            self._evict(key, entry[0], reason)
+
+    def purge_expired(self) -> int:
+        """Evict entries idle for longer than the TTL. Oldest entries sit at the front."""
+        deadline = self._clock() - self.idle_ttl_seconds
+        purged = 0
+        while self._entries:
+            key, (probe, last_used, size) = next(iter(self._entries.items()))
+            if last_used > deadline:
+                break
+            self._entries.popitem(last=False)
+            self._bytes -= size
+            self._evict(key, probe, "idle")
+            purged += 1
+        return purged
+
+    def clear(self, reason: str = "shutdown"):
+        while self._entries:
+            key, (probe, _, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self._evict(key, probe, reason)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "live": len(self._entries),
+            "bytes": self._bytes,
+            "evicted": self.evicted,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "idle_ttl_seconds": self.idle_ttl_seconds,
+        }
+
+    def _enforce_budget(self):
+        # never evict the entry that was just inserted (it sits at the end)
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            key, (probe, _, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self._evict(key, probe, "capacity")
+
+    def _evict(self, key: str, probe: Any, reason: str):
+        self.evicted += 1
+        for callback in self._on_evict:
+            try:
+                callback(key, probe, reason)
+            except Exception as e:
+                logger.error(f"Probe registry eviction callback failed for {key}: {e}")
+
+    @staticmethod
+    def _sizeof(probe: Any) -> int:
+        approx_size = getattr(probe, "approx_size", None)
+        if callable(approx_size):
+            return int(approx_size())
+        return sys.getsizeof(probe)
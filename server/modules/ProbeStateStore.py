@@ -0,0 +1,60 @@
+import os
+import json
+from typing import Optional
+from redis.exceptions import WatchError
+from .ServerLogger import ServerLogger
+from utils.redis_pool import get_async_redis
+
+logger = ServerLogger()
+
+
+class ProbeStateStore:
+    """
+    Redis-backed Probe session state (`session_no`, `counter`, `ended`, ...).
+
+    State lives next to the chat history as `probe_state:{su_id}-{qs_id}-{mo_id}`
+    with a monotonically increasing `version`. Workers read it at the start of
+    a turn and claim the turn with `compare_and_set`, so any uvicorn worker can
+    serve any respondent and two racing turns never both win.
+    """
+
+    key_prefix = "probe_state:"
+
+    def __init__(self, redis_url: Optional[str] = None, ttl_seconds: Optional[int] = None):
+        self._ttl = ttl_seconds or int(os.environ.get("REDIS_TTL_SECONDS", 3600))
+        self._redis = get_async_redis(redis_url)
+
+    def _key(self, key: str) -> str:
+        return f"{self.key_prefix}{key}"
+
+    async def load(self, key: str) -> tuple[dict, int]:
+        """Return (state, version); a missing session is ({}, 0)."""
+        raw = await self._redis.hmget(self._key(key), "state", "version")
+        state, version = raw
+        if state is None:
+            return {}, 0
+        return json.loads(state), int(version or 0)
+
+    async def compare_and_set(self, key: str, expected_version: int, state: dict) -> bool:
+        """Write `state` only if nobody moved the session past `expected_version`."""
+        redis_key = self._key(key)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(redis_key)
+                current = await pipe.hget(redis_key, "version")
+                if int(current or 0) != expected_version:
+                    await pipe.unwatch()
+                    return False
+                pipe.multi()
+                pipe.hset(redis_key, mapping={
+                    "state": json.dumps(state),
+                    "version": expected_version + 1,
+                })
+                pipe.expire(redis_key, self._ttl)
+                await pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    async def delete(self, key: str):
+        await self._redis.delete(self._key(key))
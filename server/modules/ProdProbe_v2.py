@@ -1,24 +1,84 @@
 import os
+import sys
 import pytz
-from redis import Redis
+import asyncio
+import hashlib
+import functools
 from bson import ObjectId
 from datetime import datetime
 from langsmith import traceable
-from typing import AsyncIterable
-from utils.intent import extract_intent
+from typing import AsyncIterable, Optional
+from utils.intent import aextract_intent
 from modules.LLMAdapter import LLMAdapter
-from modules.MongoWrapper import monet_db
+from modules.LLMScheduler import Priority
+from modules.MongoWrapper import monet_db_async
 from modules.ServerLogger import ServerLogger
-from langchain_core.messages import SystemMessage
+from modules.Metrics import metrics, time_stage
+from modules.Tracing import tracer
+from modules.PromptCompiler import PROMPT_CHUNKS, prompt_compiler
+from utils.redis_pool import get_async_redis
+from utils.write_behind import write_behind
+from langchain_core.messages import SystemMessage, HumanMessage
 from modules.ProdNSightGenerator import NSIGHT, NSIGHT_v2
 from models.Survey import PySurvey, PySurveyQuestion, SurveyResponse
 from langchain_core.prompts import PromptTemplate, ChatPromptTemplate
-from langchain_community.chat_message_histories import RedisChatMessageHistory
+from modules.ChatHistory import AsyncRedisChatHistory
+from modules.ContextPolicy import RollingSummary, context_policy
+from modules.FusedStream import FusedStream, fused_instruction
+from utils.gibberish import GibberishEstimate, gibberish_scorer
+from modules.ResponseCache import CachedTurn, response_cache
 
 india = pytz.timezone('Asia/Kolkata')
 logger = ServerLogger()
 
-QnAs = monet_db.get_collection("QnAs")
+# rough per-probe footprint of the chat history handle and bookkeeping
+# (LLM clients and Redis pools are shared, see LLMClientRegistry / redis_pool)
+PROBE_BASE_SIZE = 8 * 1024
+
+QnAs = monet_db_async.get_collection("QnAs")
+
+# one LLM call per turn that returns the NSIGHT block followed by the follow-up question
+FUSED_MODE = os.environ.get("PROBE_FUSED_MODE", "false").lower() == "true"
+FUSED_INSTRUCTION = fused_instruction(NSIGHT)
+
+# score answers locally first; confident gibberish / empty / "idk" answers never reach the LLM
+# opt-in: a wrong local verdict costs the respondent their follow-up question
+GIBBERISH_PRESCREEN = os.environ.get("GIBBERISH_PRESCREEN", "false").lower() == "true"
+GIBBERISH_PRESCREEN_CONFIDENCE = float(os.environ.get("GIBBERISH_PRESCREEN_CONFIDENCE", 0.85))
+
+prescreen_total = metrics.counter(
+    "monet_prescreen_total",
+    "Responses scored by the local gibberish pre-screen, by verdict and whether the LLM was skipped.",
+    ("verdict", "short_circuit"),
+)
+
+PRESCREEN_REASONS = {
+    "empty": "The respondent did not write an answer.",
+    "non_answer": "The respondent declined to answer (e.g. \"I don't know\").",
+    "gibberish": "The response is random characters or meaningless repetition.",
+}
+
+SUMMARY_PROMPT = PromptTemplate(
+    template="""
+        Summarize this survey probing conversation for an interviewer who will continue it.
+        Keep what the respondent actually said (facts, opinions, named details) and which follow-up questions were already asked.
+        At most 80 words. No preamble.
+
+        Existing summary: {summary}
+
+        New conversation:
+        {conversation}
+    """.strip()
+)
+
+async def _no_follow_up():
+    return
+    yield
+
+
+async def _single_metric(nsight: NSIGHT):
+    yield nsight
+
 
 class Probe(LLMAdapter):
 
@@ -33,10 +93,13 @@ class Probe(LLMAdapter):
         simple_store=False,
         session_no:int = 0,
         survey_details: SurveyResponse = None,
+        db_type: str = "mongo",
+        intent: Optional[str] = None, # resolved by `acreate` when the question adds context
         ):
         super().__init__(metadata.config.llm, 0.7, streaming=True)
+        self.metric_labels = {"provider": metadata.config.llm.value, "db_type": db_type}
         self.id = f"{metadata.id}-{question.id}-{mo_id}"
-        self.__metric_llm__ = self.llm.with_structured_output(NSIGHT)
+        self.__metric_llm__ = self.structured_llm(NSIGHT, priority=Priority.METRICS)
         self.metadata = metadata
         self.counter = 0
         self.simple_store = simple_store
@@ -47,154 +110,93 @@ class Probe(LLMAdapter):
         self.ended = False
         self.session_no = session_no
         self.survey_details = survey_details
+        self._summary = RollingSummary()
+        self._summary_task = None
+        self.last_context: dict = {}
+        self.fused = FUSED_MODE
 
         if question.config.probes > question.config.max_probes:
             self.invalid = True
 
-        self.__prompt_chunks__ = {
-            "main-chk": """
-                You are a video analysis partner. Your goal is to extract truth from the user's input based *strictly* on the provided context description, while **mirroring the user's level of specificity**.
-                    1. **Valid/General Subject:** If the user uses general terms (e.g., "the actor", "the music"), ask a detail question using those SAME general terms. **DO NOT** insert specific character/actor names from context unless the user wrote them first.
-                    2. **Mixed Subject (Real + Fake):** If the user links an unverified subject with a verified one, **IGNORE the unverified subject** and ask only about the verified one.
-                    3. **Purely Fake/Off-Topic:** If the user *only* mentions a person/object NOT in the context, you MUST ask: "Where did you notice [Subject] in **[Video Title]**?".""",
-
-            "rule-chk": """
-                Subject Verification Logic (MANDATORY)
-                    - **Scenario A: Purely On-Topic / General**
-                    (User mentions verified elements or general concepts like 'the actor', 'the setting')
-                    -> Action: Ask a natural follow-up about visual/audio details.
-                    -> **CRITICAL:** Use generic terms (e.g., "the performer", "that character"). **NEVER** swap a general word for a specific name (e.g., do NOT say the Actor's Name) unless the user named them first.
-
-                    - **Scenario B: Mixed Input (Verified + Unverified)**
-                    (User links a correct element with an incorrect/hallucinated one)
-                    -> Action: The user is adding false details. **Pivot immediately to the Verified element.**
-                    -> Example: "What specific details of **[Verified Subject's]** performance stood out in that moment?" (Ignore the incorrect part).
-
-                    - **Scenario C: Purely Off-Topic**
-                    (User mentions a person/object completely absent from the context)
-                    -> Action: Challenge them using the Video Title from the context.
-                    -> Example: "Where did you notice [Unverified Subject] *in [Video Title]*?"
-
-                Stay Anchored
-                    - Keep the conversation relevant to the original question.
-                    - Do not introduce new themes or interpretations.
-                    - If on topic, use user's last idea to build your follow-up.
-                    - Redirect to original question's intent/context if user diverts too much away from the topic.
-                    - Do not validate hallucinations.
-
-                Ask One Clear Question
-                    - Keep it short (max 15 words).
-                    - No multi-part questions.
-                    - Avoid emotional or symbolic language unless the user introduces it.
-
-                Encourage Elaboration
-                    - Provide hints and contexts subtly wherever required.
-                    - Focus on visible evidence.
-            """
-        }
+        self.__prompt_chunks__ = PROMPT_CHUNKS
 
-        self.__system_prompt__ = PromptTemplate(
-            template = """
-                {main-chk}
-                {rule-chk}
-                """
-            ).invoke(
-                {
-                    "main-chk": self.__prompt_chunks__["main-chk"],
-                    "rule-chk": self.__prompt_chunks__["rule-chk"]
-                }
-            ).text
-    
         self._history_redis_url = os.environ.get(
             "REDIS_URL",
             "redis://localhost:6379/0"
         )
-        self._redis = Redis.from_url(self._history_redis_url)
-
-        # survey level context (switch)
-        if self.metadata.config.add_context:
-            self.__system_prompt__ = PromptTemplate(
-                template = """
-                    {main_prompt}
-                    
-                    Survey Description: {survey_description}
-                    
-                """
-            ).invoke(
-                {
-                    "main_prompt": self.__system_prompt__,
-                    "survey_description": self.metadata.description
-                }
-            ).text
-
-        # survey question level context (switch) 
+
+        # survey question level context (switch): the intent is extracted
+        # asynchronously by `acreate`, never on the event loop here
+        extracted_intent = intent
         if self.question.config.add_context:
-            extracted_intent = extract_intent(
-                question_description=self.question.description,
-                question_text=self.question.question,
-                survey_details=self.survey_details,
-                invoke_fn=self.invoke,
-                logger=logger,
-                redis_client=self._redis,
-                ttl_seconds=int(os.environ.get("REDIS_TTL_SECONDS_INTENT", 86400)) # 24 hours
-            )
-            if not extracted_intent:
-                extracted_intent = self.question.description
-
-            self.__system_prompt__ = PromptTemplate(
-                template = """
-                    {main_prompt}
-                    
-                    Original Question: {original_question}
-                    
-                    Question Intended Purpose: {question_intent}
-                """
-            ).invoke(
-                {
-                    "main_prompt": self.__system_prompt__,
-                    "original_question": self.question.question,
-                    "question_intent": extracted_intent
-                }
-            ).text        
-        else:
-            self.__system_prompt__ = PromptTemplate(
-                template = """
-                    {main_prompt}
-                    
-                    Original Question: {original_question}
-                """
-            ).invoke(
-                {
-                    "main_prompt": self.__system_prompt__,
-                    "original_question": self.question.question
-                }
-            ).text
-            
-        # language prompt (switch)
-        if self.metadata.config.language != "English":
-            self.__system_prompt__ = PromptTemplate(
-                template = """
-                    {main_prompt}
-
-                    <-- Language Instruction -->
-                    Please ask Questions in {language} language.
-                    <-- Language Instruction -->
-                """
-            ).invoke(
-                {
-                    "main_prompt": self.__system_prompt__,
-                    "language": self.metadata.config.language
-                }
-            ).text
-        
-        self._history = RedisChatMessageHistory(
+            if intent is None:
+                raise ValueError("Probe needs the extracted intent for add_context questions: build it with Probe.acreate")
+            extracted_intent = intent or self.question.description
+
+        self.__system_prompt__ = prompt_compiler.compile(
+            su_id=self.su_id,
+            qs_id=self.qs_id,
+            language=self.metadata.config.language,
+            survey_add_context=self.metadata.config.add_context,
+            question_add_context=self.question.config.add_context,
+            survey_description=self.metadata.description,
+            question_text=self.question.question,
+            intent=extracted_intent,
+        )
+
+        # anything that changes what the LLM would answer changes the response cache key
+        self.prompt_version = hashlib.sha1(
+            f"{self.__version__}\x00{self.metadata.config.llm.value}\x00{self.__system_prompt__}".encode("utf-8")
+        ).hexdigest()[:12]
+
+        self._history = AsyncRedisChatHistory(
             session_id=self._session_id(),
-            url=self._history_redis_url,
+            redis_client=get_async_redis(self._history_redis_url),
             ttl=int(os.environ.get("REDIS_TTL_SECONDS", 3600))
         )
 
-        self._ensure_system_message()
 
+    @classmethod
+    async def acreate(
+        cls,
+        mo_id: str,
+        metadata: PySurvey,
+        question: PySurveyQuestion,
+        survey_details: SurveyResponse = None,
+        db_type: str = "mongo",
+        **kwargs,
+    ) -> "Probe":
+        """
+        Build and hydrate a probe without blocking the event loop: the intent
+        is extracted with the async, single-flight `aextract_intent` (one LLM
+        call per question across concurrent respondents and workers).
+        """
+        intent = None
+        if question.config.add_context:
+            labels = {"provider": metadata.config.llm.value, "db_type": db_type}
+            adapter = LLMAdapter(metadata.config.llm, 0.7, streaming=True, priority=Priority.INTENT)
+            with time_stage("intent_extraction", **labels):
+                intent = await aextract_intent(
+                    question_description=question.description,
+                    question_text=question.question,
+                    survey_details=survey_details,
+                    ainvoke_fn=functools.partial(adapter.ainvoke, config={"metadata": {"su_id": str(metadata.id)}}),
+                    logger=logger,
+                    redis_client=get_async_redis(os.environ.get("REDIS_URL", "redis://localhost:6379/0")),
+                    ttl_seconds=int(os.environ.get("REDIS_TTL_SECONDS_INTENT", 86400)) # 24 hours
+                )
+        with tracer.span("probe_construct"):
+            probe = cls(
+                mo_id=mo_id,
+                metadata=metadata,
+                question=question,
+                survey_details=survey_details,
+                db_type=db_type,
+                intent=intent,
+                **kwargs,
+            )
+        await probe.ahydrate()
+        return probe
 
     def _session_id(self) -> str:
         return f"{self.id}:{self.session_no}"
@@ -204,6 +206,17 @@ class Probe(LLMAdapter):
         if not self._history.messages:
             self._history.add_message(SystemMessage(content=self.__system_prompt__))
 
+    async def ahydrate(self):
+        """Load the session's history from Redis (once per probe, or after another worker moved it)."""
+        with tracer.span("history_load") as span:
+            await self._history.aload()
+            self._ensure_system_message()
+            span.set(messages=len(self._history.messages))
+
+    @property
+    def history(self) -> AsyncRedisChatHistory:
+        return self._history
+
     def to_state(self) -> dict:
         return {
             "session_no": self.session_no,
@@ -228,23 +241,101 @@ class Probe(LLMAdapter):
         except Exception:
             pass
 
-    def clear_memory(self):
+    def approx_size(self) -> int:
+        """Approximate resident bytes held by this probe (used by the session registry)."""
+        history_size = sum(sys.getsizeof(m.content) for m in self._history.messages)
+        return PROBE_BASE_SIZE + sys.getsizeof(self.__system_prompt__) + history_size
+
+    async def rollback(self, history_length: int) -> int:
+        """
+        Undo a claimed turn that did not complete: cancel the pending summary
+        refresh and cut the history back to the `history_length` messages it
+        had when the turn was claimed, in memory and in Redis. Returns the
+        number of messages dropped.
+        """
+        if self._summary_task is not None and not self._summary_task.done():
+            self._summary_task.cancel()
+        return await self._history.atruncate(history_length)
+
+    def close(self):
+        """
+        Called when the session registry evicts this probe. Redis and LLM
+        clients are pooled, and pending history writes are left to finish in
+        the background, so there is nothing to tear down here.
+        """
+        pass
+
+    async def clear_memory(self):
         try:
-            self._history.clear()
+            await self._history.aclear()
         except Exception as e:
             logger.error("Failed to clear Redis chat history")
             logger.error(e)
 
 
-    async def _stream_with_history_update(self, chain, inputs: dict, run_config: dict):
-        full_content = ""
-        async for chunk in chain.astream(inputs, config=run_config):
-            content = chunk.content if hasattr(chunk, "content") else str(chunk)
-            full_content += content
-            yield chunk
-        if full_content:
-            self._history.add_ai_message(full_content)
+    def add_follow_up(self, text: str):
+        """
+        Record the follow-up the respondent was sent. Called by the consumer
+        once it has streamed the whole question, so a turn stopped by the
+        gibberish gate (or rolled back) leaves no AI message in history.
+        """
+        if text:
+            self._history.add_ai_message(text)
+
+
+    async def _summarize(self, summary: str, messages: list) -> str:
+        conversation = "\n".join(
+            f"{'Respondent' if isinstance(m, HumanMessage) else 'Interviewer'}: {m.content}"
+            for m in messages
+        )
+        return await self.ainvoke(
+            SUMMARY_PROMPT,
+            {"summary": summary or "-", "conversation": conversation},
+            config={"metadata": {"su_id": str(self.su_id)}},
+            # off the request path: yields to live turns under load
+            priority=Priority.BATCH,
+        )
+
+    def _schedule_summary(self, folded_turns: list):
+        """Refresh the rolling summary off the request path; the next turn picks it up."""
+        if self._summary_task is not None and not self._summary_task.done():
+            return
+        if len(folded_turns) <= self._summary.covered_turns:
+            return
 
+        async def _refresh():
+            try:
+                await self._summary.refresh(folded_turns, self._summarize)
+            except Exception as e:
+                logger.error(f"Failed to refresh conversation summary for {self.id}: {e}")
+
+        self._summary_task = asyncio.get_running_loop().create_task(_refresh())
+
+    def prescreen(self, response: str) -> NSIGHT | None:
+        """
+        Synthesized NSIGHT for answers the local scorer is confident carry no
+        content, or None when the answer has to go to the LLM. The result is
+        always above the question's gibberish gate, so no follow-up is generated.
+        """
+        if not GIBBERISH_PRESCREEN or self.question.config.gibberish_score >= 10:
+            return None
+        estimate: GibberishEstimate = gibberish_scorer.score(response, self.metadata.config.language)
+        short_circuit = estimate.verdict in PRESCREEN_REASONS and estimate.confidence >= GIBBERISH_PRESCREEN_CONFIDENCE
+        prescreen_total.inc(verdict=estimate.verdict, short_circuit=str(short_circuit).lower())
+        if not short_circuit:
+            return None
+        return NSIGHT(
+            quality=1,
+            relevance=0,
+            detail=0,
+            confusion=10 if estimate.verdict == "non_answer" else 0,
+            negativity=0,
+            consistency=0,
+            confidence=0,
+            keywords=[estimate.verdict.replace("_", " ")],
+            reason=f"Pre-screened locally: {PRESCREEN_REASONS[estimate.verdict]}",
+            gibberish_score=10,
+        )
 
     @traceable(run_type="chain", name="Gen Streamed Follow Up")
     def gen_streamed_follow_up(self, question: str, response: str) -> tuple[AsyncIterable[str], AsyncIterable[NSIGHT]]:
@@ -252,9 +343,24 @@ class Probe(LLMAdapter):
         user_text = f"Response {next_counter}. {response}"
         self._history.add_user_message(user_text)
         self.counter = next_counter
-        prompt = ChatPromptTemplate.from_messages(self._history.messages)
-        chain = prompt | self.llm
-        metric_chain = prompt | self.__metric_llm__
+
+        prescreened = self.prescreen(response)
+        if prescreened is not None:
+            self.last_context = {"prescreen": prescreened.keywords[0]}
+            return (_no_follow_up(), _single_metric(prescreened))
+
+        # pinned system prompt + recent turns under the token budget (+ rolling summary)
+        messages = self._history.messages
+        view = context_policy.follow_up_view(messages, self._summary)
+        metric_view = context_policy.metric_view(messages, view)
+        self.last_context = {
+            "full_tokens": view.full_tokens,
+            "follow_up_tokens": view.view_tokens,
+            "metric_tokens": metric_view.view_tokens,
+            "tokens_saved": view.saved_tokens + metric_view.saved_tokens,
+        }
+        if view.folded_turns and context_policy.summarize:
+            self._schedule_summary(view.folded_turns)
 
         # Define metadata for tracing (User ID, Survey ID, Question ID)
         run_config = {
@@ -267,16 +373,56 @@ class Probe(LLMAdapter):
             "tags": ["probe", "websocket"]
         }
 
-        llm_stream: str = self._stream_with_history_update(chain, {}, run_config)
-        
-        metric_llm_stream: NSIGHT = metric_chain.astream({}, config={**run_config, "tags": ["metrics", "websocket"]})
+        if self.fused:
+            fused_chain = ChatPromptTemplate.from_messages(view.messages + [FUSED_INSTRUCTION]) | self.llm
+            fused = FusedStream(
+                fused_chain.astream({}, config={**run_config, "tags": ["probe", "metrics", "fused", "websocket"]}),
+                NSIGHT,
+            )
+            llm_stream, metric_llm_stream = fused.text(), fused.metrics()
+        else:
+            chain = ChatPromptTemplate.from_messages(view.messages) | self.llm
+            metric_chain = ChatPromptTemplate.from_messages(metric_view.messages) | self.__metric_llm__
+
+            llm_stream: str = chain.astream({}, config=run_config)
+
+            metric_llm_stream: NSIGHT = metric_chain.astream({}, config={**run_config, "tags": ["metrics", "websocket"]})
+
+        if self.metadata.config.response_cache:
+            return self._cached_streams(response, view, metric_view, llm_stream, metric_llm_stream)
         return (llm_stream, metric_llm_stream)
 
+    def _cached_streams(self, response: str, view, metric_view, llm_stream, metric_llm_stream):
+        """
+        Serve the turn from the per-question response cache when an identical
+        answer was already scored. The first turn's input is fully determined
+        by the prompt and the answer, so both results are cached; later turns
+        only cache metrics, and only when the metric chain sees the latest
+        answer alone (METRIC_CONTEXT=narrow).
+        """
+        cache_follow_up = self.counter == 1
+        cache_metrics = cache_follow_up or context_policy.metric_context == "narrow"
+        if not cache_metrics:
+            return (llm_stream, metric_llm_stream)
+        turn = CachedTurn(
+            response_cache,
+            response_cache.key(self.qs_id, response, self.counter, self.prompt_version),
+            metric_tokens=metric_view.view_tokens,
+            follow_up_tokens=view.view_tokens,
+            cache_metrics=cache_metrics,
+            cache_follow_up=cache_follow_up,
+        )
+        return (
+            turn.follow_up(llm_stream),
+            turn.metrics(metric_llm_stream, NSIGHT),
+        )
+
 
     @traceable(run_type="tool", name="Store Response")
-    def store_response(self, nsight_v2: NSIGHT_v2, session_no: int):
+    async def store_response(self, nsight_v2: NSIGHT_v2, session_no: int) -> bool:
+        """Queue the turn's NSIGHT for a bulk insert into QnAs (see utils.write_behind)."""
         now_india = datetime.now(india)
-        insert_one_res = QnAs.insert_one({
+        return await write_behind.mongo(QnAs).put({
             **nsight_v2.model_dump(),
             "ended": self.ended,
             "mo_id": self.mo_id,
@@ -286,6 +432,3 @@ class Probe(LLMAdapter):
             "created_at": now_india.isoformat(),
             "session_no": session_no,
         })
-        logger.info("Inserted one doc successfully")
-        logger.info(insert_one_res)
-        return insert_one_res
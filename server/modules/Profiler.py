@@ -0,0 +1,302 @@
+import os
+import gc
+import sys
+import time
+import asyncio
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Optional
+from .ServerLogger import ServerLogger
+
+logger = ServerLogger()
+
+# upper bounds for on-demand profiling of a live worker (admin endpoints)
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", 60))
+PROFILE_MIN_INTERVAL_MS = float(os.environ.get("PROFILE_MIN_INTERVAL_MS", 1))
+# tracemalloc is stopped automatically after this long, so a forgotten session cannot tax the worker forever
+TRACEMALLOC_MAX_SECONDS = float(os.environ.get("TRACEMALLOC_MAX_SECONDS", 1800))
+# instances counted (gc walk) with every memory snapshot
+PROFILE_TRACKED_TYPES = [
+    name.strip() for name in os.environ.get(
+        "PROFILE_TRACKED_TYPES",
+        "Probe,AsyncRedisChatHistory,HumanMessage,AIMessage,AIMessageChunk,SystemMessage,NSIGHT,SpeculativeStream",
+    ).split(",") if name.strip()
+]
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+IDLE_FRAME = "(event loop idle)"
+
+
+class ProfilerBusy(RuntimeError):
+    """Another profile is already running in this worker."""
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+def short_path(filename: str) -> str:
+    if filename.startswith(SERVER_DIR):
+        return os.path.relpath(filename, SERVER_DIR)
+    marker = f"{os.sep}site-packages{os.sep}"
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    return os.path.basename(filename)
+
+
+def _is_idle(frame) -> bool:
+    # the loop is parked in selector.select() waiting for I/O
+    return frame.f_code.co_name in {"select", "poll"} and frame.f_code.co_filename.endswith("selectors.py")
+
+
+class CpuProfiler:
+    """
+    Sampling CPU profiler for a running worker.
+
+    `profile()` starts a daemon thread that reads the target thread's stack
+    (the event loop thread by default) every `interval_ms` through
+    `sys._current_frames()` and counts collapsed stacks. Nothing runs
+    between profiles; one profile at a time per worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.profiles = 0
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def profile(self, seconds: float, interval_ms: float = 5.0, all_threads: bool = False) -> dict:
+        seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+        interval = max(interval_ms, PROFILE_MIN_INTERVAL_MS) / 1000
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A CPU profile is already running in this worker")
+        try:
+            target = None if all_threads else threading.get_ident()
+            stacks: Counter = Counter()
+            stop = threading.Event()
+            sampler = threading.Thread(
+                target=self._sample, args=(target, interval, stacks, stop), name="monet-cpu-profiler", daemon=True
+            )
+            started = time.perf_counter()
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                await asyncio.to_thread(sampler.join)
+            self.profiles += 1
+            samples = sum(stacks.values())
+            return {
+                "duration_s": round(time.perf_counter() - started, 3),
+                "interval_ms": interval * 1000,
+                "samples": samples,
+                "idle_ratio": round(stacks.get(IDLE_FRAME, 0) / samples, 4) if samples else 0.0,
+                "stacks": stacks,
+            }
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _sample(target: Optional[int], interval: float, stacks: Counter, stop: threading.Event):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not stop.wait(interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (target is not None and ident != target):
+                    continue
+                if _is_idle(frame):
+                    stacks[IDLE_FRAME] += 1
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if target is None:
+                    labels.append(f"thread {names.get(ident, ident)}")
+                stacks[";".join(reversed(labels))] += 1
+
+    @staticmethod
+    def collapsed(result: dict) -> str:
+        """Brendan Gregg's collapsed format (flamegraph.pl, speedscope, inferno)."""
+        return "".join(f"{stack} {count}\n" for stack, count in result["stacks"].most_common())
+
+    @staticmethod
+    def summary(result: dict, limit: int = 30) -> dict:
+        """Top functions by self (innermost frame) and total (anywhere on the stack) samples."""
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in result["stacks"].items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for frame in set(frames):
+                total_counts[frame] += count
+        samples = result["samples"] or 1
+        return {
+            **{key: value for key, value in result.items() if key != "stacks"},
+            "top_self": [{"frame": f, "samples": c, "ratio": round(c / samples, 4)} for f, c in self_counts.most_common(limit)],
+            "top_total": [{"frame": f, "samples": c, "ratio": round(c / samples, 4)} for f, c in total_counts.most_common(limit)],
+        }
+
+
+def _module_name(filename: str, depth: int) -> str:
+    """Dotted module for a source file, cut to `depth` parts (`langchain_core.messages`, `modules.ProdProbe_v2`)."""
+    if filename.startswith(SERVER_DIR):
+        path = os.path.relpath(filename, SERVER_DIR)
+    else:
+        marker = f"{os.sep}site-packages{os.sep}"
+        if marker in filename:
+            path = filename.split(marker, 1)[1]
+        elif filename.startswith("<"):
+            return filename
+        else:
+            path = f"stdlib{os.sep}{os.path.basename(filename)}"
+    parts = os.path.splitext(path)[0].split(os.sep)
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts[:depth]) or path
+
+
+def _count_instances(type_names: list[str]) -> dict:
+    wanted = set(type_names)
+    counts: Counter = Counter()
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        if name in wanted:
+            counts[name] += 1
+    return {name: counts.get(name, 0) for name in type_names}
+
+
+class MemoryProfiler:
+    """
+    tracemalloc sessions for a running worker.
+
+    `start()` begins tracing and takes a baseline; `diff()` compares a fresh
+    snapshot with it and attributes growth to the allocating module and to
+    the first frame in this server's code that led to it (`owner`, e.g.
+    `modules.ProdProbe_v2` for pydantic or langchain objects a Probe built).
+    Tracing is off until started and stops itself after TRACEMALLOC_MAX_SECONDS.
+    Snapshots, comparisons and instance counts walk the whole heap, so they
+    run in a worker thread instead of stalling the event loop.
+    """
+
+    def __init__(self):
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._baseline_instances: dict = {}
+        self._started_at: Optional[float] = None
+        self._expiry: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def running(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    async def start(self, frames: int = 16) -> dict:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, frames))
+            self._started_at = time.time()
+            self._expiry = asyncio.get_running_loop().call_later(TRACEMALLOC_MAX_SECONDS, self._expire)
+            logger.info(f"tracemalloc started ({frames} frames)")
+        return await self.reset()
+
+    async def reset(self) -> dict:
+        """Take a new baseline (the next diff shows growth from now)."""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running (start it first)")
+        baseline, instances = await asyncio.to_thread(
+            lambda: (self._snapshot(), _count_instances(PROFILE_TRACKED_TYPES))
+        )
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc was stopped while the baseline was taken")
+        self._baseline, self._baseline_instances = baseline, instances
+        return self.status()
+
+    def stop(self) -> dict:
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        was_running = tracemalloc.is_tracing()
+        tracemalloc.stop()
+        self._baseline = None
+        self._baseline_instances = {}
+        self._started_at = None
+        if was_running:
+            logger.info("tracemalloc stopped")
+        return self.status()
+
+    def _expire(self):
+        logger.warn(f"tracemalloc stopped after {TRACEMALLOC_MAX_SECONDS:.0f}s (TRACEMALLOC_MAX_SECONDS)")
+        self._expiry = None
+        self.stop()
+
+    def status(self) -> dict:
+        traced, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            "running": tracemalloc.is_tracing(),
+            "frames": tracemalloc.get_traceback_limit() if tracemalloc.is_tracing() else 0,
+            "started_at": self._started_at,
+            "traced_bytes": traced,
+            "peak_bytes": peak,
+            "overhead_bytes": tracemalloc.get_tracemalloc_memory() if tracemalloc.is_tracing() else 0,
+        }
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    async def diff(self, limit: int = 25, depth: int = 2) -> dict:
+        if self._baseline is None:
+            raise RuntimeError("tracemalloc is not running (start it first)")
+        return await asyncio.to_thread(self._diff, self._baseline, self._baseline_instances, limit, depth)
+
+    def _diff(self, baseline: tracemalloc.Snapshot, baseline_instances: dict, limit: int, depth: int) -> dict:
+        snapshot = self._snapshot()
+        by_module: Counter = Counter()
+        by_owner: Counter = Counter()
+        count_by_module: Counter = Counter()
+        lines = []
+        for stat in snapshot.compare_to(baseline, "traceback"):
+            if not stat.size_diff:
+                continue
+            # tracemalloc tracebacks run from the oldest frame to the allocation
+            frames = list(reversed(stat.traceback))
+            module = _module_name(frames[0].filename, depth)
+            owner = next(
+                (_module_name(f.filename, depth) for f in frames if f.filename.startswith(SERVER_DIR)),
+                module,
+            )
+            by_module[module] += stat.size_diff
+            count_by_module[module] += stat.count_diff
+            by_owner[owner] += stat.size_diff
+            lines.append(stat)
+        lines.sort(key=lambda stat: stat.size_diff, reverse=True)
+        instances = _count_instances(PROFILE_TRACKED_TYPES)
+        return {
+            **self.status(),
+            "growth_bytes": sum(by_module.values()),
+            "by_module": [
+                {"module": m, "size_diff": s, "count_diff": count_by_module[m]} for m, s in by_module.most_common(limit)
+            ],
+            "by_owner": [{"owner": o, "size_diff": s} for o, s in by_owner.most_common(limit)],
+            "top_allocations": [
+                {
+                    "size_diff": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                    "traceback": [f"{short_path(f.filename)}:{f.lineno}" for f in reversed(stat.traceback)],
+                }
+                for stat in lines[:limit]
+            ],
+            "instances": {
+                name: {"count": count, "diff": count - baseline_instances.get(name, 0)}
+                for name, count in instances.items()
+            },
+        }
+
+
+cpu_profiler = CpuProfiler()
+memory_profiler = MemoryProfiler()
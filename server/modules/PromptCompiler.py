@@ -0,0 +1,231 @@
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Optional
+from langchain_core.prompts import PromptTemplate
+from .Metrics import metrics
+
+PROMPT_CHUNKS = {
+    "main-chk": """
+                You are a video analysis partner. Your goal is to extract truth from the user's input based *strictly* on the provided context description, while **mirroring the user's level of specificity**.
+                    1. **Valid/General Subject:** If the user uses general terms (e.g., "the actor", "the music"), ask a detail question using those SAME general terms. **DO NOT** insert specific character/actor names from context unless the user wrote them first.
+                    2. **Mixed Subject (Real + Fake):** If the user links an unverified subject with a verified one, **IGNORE the unverified subject** and ask only about the verified one.
+                    3. **Purely Fake/Off-Topic:** If the user *only* mentions a person/object NOT in the context, you MUST ask: "Where did you notice [Subject] in **[Video Title]**?".""",
+
+    "rule-chk": """
+                Subject Verification Logic (MANDATORY)
+                    - **Scenario A: Purely On-Topic / General**
+                    (User mentions verified elements or general concepts like 'the actor', 'the setting')
+                    -> Action: Ask a natural follow-up about visual/audio details.
+                    -> **CRITICAL:** Use generic terms (e.g., "the performer", "that character"). **NEVER** swap a general word for a specific name (e.g., do NOT say the Actor's Name) unless the user named them first.
+
+                    - **Scenario B: Mixed Input (Verified + Unverified)**
+                    (User links a correct element with an incorrect/hallucinated one)
+                    -> Action: The user is adding false details. **Pivot immediately to the Verified element.**
+                    -> Example: "What specific details of **[Verified Subject's]** performance stood out in that moment?" (Ignore the incorrect part).
+
+                    - **Scenario C: Purely Off-Topic**
+                    (User mentions a person/object completely absent from the context)
+                    -> Action: Challenge them using the Video Title from the context.
+                    -> Example: "Where did you notice [Unverified Subject] *in [Video Title]*?"
+
+                Stay Anchored
+                    - Keep the conversation relevant to the original question.
+                    - Do not introduce new themes or interpretations.
+                    - If on topic, use user's last idea to build your follow-up.
+                    - Redirect to original question's intent/context if user diverts too much away from the topic.
+                    - Do not validate hallucinations.
+
+                Ask One Clear Question
+                    - Keep it short (max 15 words).
+                    - No multi-part questions.
+                    - Avoid emotional or symbolic language unless the user introduces it.
+
+                Encourage Elaboration
+                    - Provide hints and contexts subtly wherever required.
+                    - Focus on visible evidence.
+            """
+}
+
+
+class PromptCompiler:
+    """
+    Memoized system-prompt compiler.
+
+    The Probe system prompt only depends on the survey/question configuration,
+    so it is compiled once per (su_id, qs_id, language, add_context flags,
+    content hash) and served from a bounded LRU afterwards. The content hash
+    covers the intent and the texts spliced into the prompt, so an edited
+    survey never serves a stale prompt; `invalidate()` drops entries eagerly.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or int(os.environ.get("PROMPT_CACHE_MAX_ENTRIES", 512))
+        self._cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _fingerprint(*parts: str) -> str:
+        digest = hashlib.sha1()
+        for part in parts:
+            digest.update((part or "").encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def compile(
+        self,
+        *,
+        su_id,
+        qs_id,
+        language: str,
+        survey_add_context: bool,
+        question_add_context: bool,
+        survey_description: str,
+        question_text: str,
+        intent: Optional[str] = None,
+    ) -> str:
+        key = (
+            str(su_id),
+            str(qs_id),
+            language,
+            bool(survey_add_context),
+            bool(question_add_context),
+            self._fingerprint(intent, survey_description, question_text),
+        )
+        prompt = self._cache.get(key)
+        if prompt is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return prompt
+
+        self.misses += 1
+        prompt = self._build(
+            language=language,
+            survey_add_context=survey_add_context,
+            question_add_context=question_add_context,
+            survey_description=survey_description,
+            question_text=question_text,
+            intent=intent,
+        )
+        self._cache[key] = prompt
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return prompt
+
+    def invalidate(self, su_id=None, qs_id=None) -> int:
+        """Drop cached prompts for a survey (and optionally one question); no args clears all."""
+        if su_id is None:
+            dropped = len(self._cache)
+            self._cache.clear()
+            return dropped
+        stale = [
+            key for key in self._cache
+            if key[0] == str(su_id) and (qs_id is None or key[1] == str(qs_id))
+        ]
+        for key in stale:
+            del self._cache[key]
+        return len(stale)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    @staticmethod
+    def _build(
+        *,
+        language: str,
+        survey_add_context: bool,
+        question_add_context: bool,
+        survey_description: str,
+        question_text: str,
+        intent: Optional[str],
+    ) -> str:
+        system_prompt = PromptTemplate(
+            template = """
+                {main-chk}
+                {rule-chk}
+                """
+            ).invoke(
+                {
+                    "main-chk": PROMPT_CHUNKS["main-chk"],
+                    "rule-chk": PROMPT_CHUNKS["rule-chk"]
+                }
+            ).text
+
+        # survey level context (switch)
+        if survey_add_context:
+            system_prompt = PromptTemplate(
+                template = """
+                    {main_prompt}
+                    
+                    Survey Description: {survey_description}
+                    
+                """
+            ).invoke(
+                {
+                    "main_prompt": system_prompt,
+                    "survey_description": survey_description
+                }
+            ).text
+
+        # survey question level context (switch)
+        if question_add_context:
+            system_prompt = PromptTemplate(
+                template = """
+                    {main_prompt}
+                    
+                    Original Question: {original_question}
+                    
+                    Question Intended Purpose: {question_intent}
+                """
+            ).invoke(
+                {
+                    "main_prompt": system_prompt,
+                    "original_question": question_text,
+                    "question_intent": intent
+                }
+            ).text
+        else:
+            system_prompt = PromptTemplate(
+                template = """
+                    {main_prompt}
+                    
+                    Original Question: {original_question}
+                """
+            ).invoke(
+                {
+                    "main_prompt": system_prompt,
+                    "original_question": question_text
+                }
+            ).text
+
+        # language prompt (switch)
+        if language != "English":
+            system_prompt = PromptTemplate(
+                template = """
+                    {main_prompt}
+
+                    <-- Language Instruction -->
+                    Please ask Questions in {language} language.
+                    <-- Language Instruction -->
+                """
+            ).invoke(
+                {
+                    "main_prompt": system_prompt,
+                    "language": language
+                }
+            ).text
+        return system_prompt
+
+
+prompt_compiler = PromptCompiler()
+
+metrics.gauge("monet_prompt_cache_entries", "Compiled system prompts held in the cache.", lambda: len(prompt_compiler._cache))
+metrics.gauge("monet_prompt_cache_hits", "System prompt cache hits.", lambda: prompt_compiler.hits)
+metrics.gauge("monet_prompt_cache_misses", "System prompt cache misses.", lambda: prompt_compiler.misses)
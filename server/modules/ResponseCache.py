@@ -0,0 +1,221 @@
+import os
+import re
+import time
+import json
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import AsyncIterable, Optional
+from pydantic import BaseModel
+from langchain_core.messages import AIMessageChunk
+from .Metrics import metrics
+from .ServerLogger import ServerLogger
+from utils.redis_pool import get_async_redis
+
+logger = ServerLogger()
+
+lookups_total = metrics.counter(
+    "monet_response_cache_lookups_total",
+    "Response cache lookups by chain and result (hit_local, hit_redis, miss).",
+    ("chain", "result"),
+)
+tokens_saved_total = metrics.counter(
+    "monet_response_cache_tokens_saved_total",
+    "Approximate LLM tokens (input + output) not spent thanks to response cache hits.",
+    ("chain",),
+)
+
+_PUNCT = re.compile(r"[^\w\s]")
+_STRETCH = re.compile(r"(\w)\1{2,}")
+
+
+def normalize_response(response: str) -> str:
+    """Case, punctuation, whitespace and stretched letters ("soooo good!!") do not change the key."""
+    text = _STRETCH.sub(r"\1\1", _PUNCT.sub(" ", (response or "").lower()))
+    return " ".join(text.split())
+
+
+class ResponseCache:
+    """
+    Per-question cache of LLM results for identical (normalized) answers.
+
+    Entries are keyed by (qs_id, normalized response, turn number, prompt
+    version) and hold the NSIGHT result and, for the first turn, the
+    generated follow-up. Lookups hit a bounded in-process LRU first and the
+    shared Redis hash (`response_cache:...`, TTL'd) second, so workers share
+    what any of them has generated.
+    """
+
+    key_prefix = "response_cache:"
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[int] = None,
+        redis_url: Optional[str] = None,
+    ):
+        self.max_entries = max_entries or int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 4096))
+        self.ttl_seconds = ttl_seconds or int(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", 86400))
+        self._redis_url = redis_url
+        self._local: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def _redis(self):
+        return get_async_redis(self._redis_url)
+
+    def key(self, qs_id, response: str, turn: int, prompt_version: str) -> str:
+        digest = hashlib.sha1(normalize_response(response).encode("utf-8")).hexdigest()
+        return f"{self.key_prefix}{qs_id}:{turn}:{prompt_version}:{digest}"
+
+    def _get_local(self, key: str) -> Optional[dict]:
+        item = self._local.get(key)
+        if item is None:
+            return None
+        expires_at, entry = item
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return entry
+
+    def _put_local(self, key: str, fields: dict):
+        _, entry = self._local.get(key, (0.0, {}))
+        self._local[key] = (time.monotonic() + self.ttl_seconds, {**entry, **fields})
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def get(self, key: str) -> tuple[Optional[dict], str]:
+        """Return (entry, source) where source is "local", "redis" or "miss"."""
+        entry = self._get_local(key)
+        if entry is not None:
+            return entry, "local"
+        try:
+            raw = await self._redis.hgetall(key)
+        except Exception as e:
+            logger.error(f"Response cache lookup failed for {key}: {e}")
+            raw = None
+        if not raw:
+            return None, "miss"
+        entry = {
+            (k.decode() if isinstance(k, bytes) else k): json.loads(v)
+            for k, v in raw.items()
+        }
+        self._put_local(key, entry)
+        return entry, "redis"
+
+    async def put(self, key: str, **fields):
+        """Merge `fields` into the entry (metrics and follow-up are stored as they complete)."""
+        self._put_local(key, fields)
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.hset(key, mapping={k: json.dumps(v) for k, v in fields.items()})
+            pipe.expire(key, self.ttl_seconds)
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"Response cache write failed for {key}: {e}")
+
+    def record(self, chain: str, source: str, saved_tokens: int = 0):
+        result = "miss" if source == "miss" else f"hit_{source}"
+        lookups_total.inc(chain=chain, result=result)
+        if source == "miss":
+            self.misses += 1
+        else:
+            self.hits += 1
+            tokens_saved_total.inc(saved_tokens, chain=chain)
+
+    def clear(self):
+        self._local.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._local),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class CachedTurn:
+    """
+    One turn's cache lookup, shared by the metric and follow-up streams.
+
+    Each wrapped stream awaits the lookup first and only iterates its (lazy)
+    live LLM stream on a miss; completed live results are written back. The
+    lookup is started eagerly so it overlaps the rest of the turn set-up.
+    """
+
+    def __init__(
+        self,
+        cache: ResponseCache,
+        key: str,
+        metric_tokens: int,
+        follow_up_tokens: int,
+        cache_metrics: bool,
+        cache_follow_up: bool,
+    ):
+        self._cache = cache
+        self.key = key
+        self._metric_tokens = metric_tokens
+        self._follow_up_tokens = follow_up_tokens
+        self._cache_metrics = cache_metrics
+        self._cache_follow_up = cache_follow_up
+        self._lookup = asyncio.ensure_future(cache.get(key))
+
+    async def metrics(self, live: AsyncIterable, schema: type[BaseModel]):
+        entry, source = await self._lookup
+        if self._cache_metrics and entry and "nsight" in entry:
+            self._cache.record("metrics", source, self._metric_tokens + len(json.dumps(entry["nsight"])) // 4)
+            yield schema.model_validate(entry["nsight"])
+            return
+        if self._cache_metrics:
+            self._cache.record("metrics", "miss")
+        last = None
+        async for metric in live:
+            last = metric
+            yield metric
+        if self._cache_metrics and last is not None:
+            await self._cache.put(self.key, nsight=last.model_dump())
+
+    def follow_up(self, live: AsyncIterable) -> "CachedFollowUp":
+        return CachedFollowUp(self, live)
+
+
+class CachedFollowUp:
+    """Follow-up side of a CachedTurn; `cancel()` is forwarded to the live stream (e.g. a fused call)."""
+
+    def __init__(self, turn: CachedTurn, live: AsyncIterable):
+        self._turn = turn
+        self._live = live
+
+    async def __aiter__(self):
+        turn = self._turn
+        entry, source = await turn._lookup
+        if turn._cache_follow_up and entry and entry.get("follow_up"):
+            text = entry["follow_up"]
+            turn._cache.record("follow_up", source, turn._follow_up_tokens + len(text) // 4)
+            yield AIMessageChunk(content=text)
+            return
+        if turn._cache_follow_up:
+            turn._cache.record("follow_up", "miss")
+        text = ""
+        async for chunk in self._live:
+            text += chunk.content if hasattr(chunk, "content") else str(chunk)
+            yield chunk
+        if turn._cache_follow_up and text:
+            await turn._cache.put(turn.key, follow_up=text)
+
+    async def cancel(self):
+        cancel = getattr(self._live, "cancel", None)
+        if cancel is not None:
+            await cancel()
+            return
+        aclose = getattr(self._live, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,216 @@
+import os
+import time
+import random
+import asyncio
+from typing import Any, AsyncIterator, Iterator, Optional
+from pydantic import BaseModel
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from .FusedStream import METRICS_CLOSE, METRICS_OPEN
+
+# LLM_SIMULATE=true swaps every provider for SimulatedChatModel (load tests, offline benches)
+LLM_SIMULATE = os.environ.get("LLM_SIMULATE", "false").lower() == "true"
+
+FOLLOW_UPS = [
+    "What was it about that moment that stood out to you the most, and why?",
+    "Could you tell me a bit more about how that made you feel while watching?",
+    "You mentioned that part; what would have made it work better for you?",
+    "How does that compare with other trailers you have seen recently?",
+    "Which scene would you tell a friend about first, and what would you say?",
+]
+
+
+def _env(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+class LatencyModel:
+    """
+    Sampled provider timings: time to first token (`fixed`, `exponential` or
+    `lognormal` around a median) and a per-token interval with jitter.
+    """
+
+    def __init__(
+        self,
+        ttft_ms: float = 600,
+        ttft_dist: str = "lognormal",
+        ttft_sigma: float = 0.5,
+        tokens_per_second: float = 60,
+        output_tokens: int = 40,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        if ttft_dist not in {"fixed", "exponential", "lognormal"}:
+            raise ValueError(f"Unsupported TTFT distribution: {ttft_dist}")
+        self.ttft_ms = ttft_ms
+        self.ttft_dist = ttft_dist
+        self.ttft_sigma = ttft_sigma
+        self.tokens_per_second = max(tokens_per_second, 0.001)
+        self.output_tokens = max(int(output_tokens), 1)
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+    @classmethod
+    def from_env(cls) -> "LatencyModel":
+        seed = os.environ.get("SIM_LLM_SEED")
+        return cls(
+            ttft_ms=_env("SIM_LLM_TTFT_MS", 600),
+            ttft_dist=os.environ.get("SIM_LLM_TTFT_DIST", "lognormal"),
+            ttft_sigma=_env("SIM_LLM_TTFT_SIGMA", 0.5),
+            tokens_per_second=_env("SIM_LLM_TOKENS_PER_SECOND", 60),
+            output_tokens=int(_env("SIM_LLM_OUTPUT_TOKENS", 40)),
+            error_rate=_env("SIM_LLM_ERROR_RATE", 0.0),
+            seed=int(seed) if seed is not None else None,
+        )
+
+    def ttft(self) -> float:
+        median = self.ttft_ms / 1000
+        if self.ttft_dist == "fixed":
+            return median
+        if self.ttft_dist == "exponential":
+            return self._random.expovariate(1 / median) if median > 0 else 0.0
+        return self._random.lognormvariate(0, self.ttft_sigma) * median
+
+    def token_gap(self) -> float:
+        return self._random.uniform(0.5, 1.5) / self.tokens_per_second
+
+    def fails(self) -> bool:
+        return self._random.random() < self.error_rate
+
+    def choice(self, items: list):
+        return self._random.choice(items)
+
+
+def _latest_response(messages: list[BaseMessage]) -> str:
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return message.content if isinstance(message.content, str) else str(message.content)
+    return ""
+
+
+def simulated_metrics(schema: type[BaseModel], response: str) -> BaseModel:
+    """A valid `schema` instance for `response`: bounded ints from its length, gibberish from the local scorer."""
+    from utils.gibberish import gibberish_scorer
+
+    estimate = gibberish_scorer.score(response)
+    words = len(response.split())
+    values: dict[str, Any] = {}
+    for name, field in schema.model_fields.items():
+        bounds = {type(m).__name__: m for m in field.metadata}
+        low = getattr(bounds.get("Ge"), "ge", 0)
+        high = getattr(bounds.get("Le"), "le", 10)
+        if field.annotation is int:
+            values[name] = max(low, min(high, 2 + words // 4))
+        elif field.annotation is str:
+            values[name] = "simulated"
+        else:
+            values[name] = response.split()[:3] or ["none"]
+    if "gibberish_score" in values:
+        values["gibberish_score"] = round(estimate.score)
+    return schema.model_validate(values)
+
+
+class SimulatedChatModel(BaseChatModel):
+    """
+    Chat model that streams canned follow-up questions with sampled latency
+    (see LatencyModel / the SIM_LLM_* settings), so the whole turn path runs
+    without a provider. Fused prompts get a `<metrics>` block first;
+    `with_structured_output` returns schema instances built locally.
+    """
+
+    provider: str = "simulated"
+    latency: Any = None
+
+    def model_post_init(self, __context: Any):
+        if self.latency is None:
+            self.latency = LatencyModel.from_env()
+
+    @property
+    def _llm_type(self) -> str:
+        return "simulated"
+
+    def _reply(self, messages: list[BaseMessage]) -> str:
+        question = self.latency.choice(FOLLOW_UPS)
+        words = question.split()
+        while len(words) < self.latency.output_tokens:
+            words += self.latency.choice(FOLLOW_UPS).split()
+        text = " ".join(words[:self.latency.output_tokens])
+        if any(METRICS_OPEN in str(m.content) for m in messages):
+            from .ProdNSightGenerator import NSIGHT
+
+            metrics = simulated_metrics(NSIGHT, _latest_response(messages)).model_dump_json()
+            return f"{METRICS_OPEN}{metrics}{METRICS_CLOSE} {text}"
+        return text
+
+    def _tokens(self, messages: list[BaseMessage]) -> list[str]:
+        if self.latency.fails():
+            raise RuntimeError(f"Simulated {self.provider} provider error")
+        reply = self._reply(messages)
+        # ~4 characters per token, like the rest of the token estimates
+        return [reply[i:i + 4] for i in range(0, len(reply), 4)]
+
+    def _generate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep(self.latency.ttft() + sum(self.latency.token_gap() for _ in tokens[1:]))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency.ttft())
+        for i, token in enumerate(self._tokens(messages)):
+            if i:
+                time.sleep(self.latency.token_gap())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _agenerate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.latency.ttft() + sum(self.latency.token_gap() for _ in tokens[1:]))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _astream(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.latency.ttft())
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self.latency.token_gap())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def with_structured_output(self, schema: type[BaseModel], **kwargs) -> Runnable:
+        return SimulatedStructuredOutput(self, schema)
+
+
+class SimulatedStructuredOutput(Runnable):
+    """`with_structured_output` of the simulated model: one schema instance after the sampled generation time."""
+
+    def __init__(self, model: SimulatedChatModel, schema: type[BaseModel]):
+        self.model = model
+        self.schema = schema
+
+    def _messages(self, input: Any) -> list[BaseMessage]:
+        return input.to_messages() if hasattr(input, "to_messages") else list(input)
+
+    def _duration(self, result: BaseModel) -> float:
+        tokens = len(result.model_dump_json()) // 4
+        return self.model.latency.ttft() + sum(self.model.latency.token_gap() for _ in range(tokens))
+
+    def _result(self, input: Any) -> BaseModel:
+        if self.model.latency.fails():
+            raise RuntimeError(f"Simulated {self.model.provider} provider error")
+        return simulated_metrics(self.schema, _latest_response(self._messages(input)))
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> BaseModel:
+        result = self._result(input)
+        time.sleep(self._duration(result))
+        return result
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> BaseModel:
+        result = self._result(input)
+        await asyncio.sleep(self._duration(result))
+        return result
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> AsyncIterator[BaseModel]:
+        yield await self.ainvoke(input, config, **kwargs)
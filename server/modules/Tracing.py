@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Optional
+
+# per-turn span timelines kept in process: every slow / failed turn, plus a head sample of the rest
+TRACING = os.environ.get("TRACING", "true").lower() == "true"
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 0.05))
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", 2000))
+TRACE_BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER_SIZE", 256))
+TRACE_MAX_SPANS = int(os.environ.get("TRACE_MAX_SPANS", 512))
+# kept traces are also appended here as OTLP/JSON lines (one ExportTraceServiceRequest per trace)
+TRACE_OTLP_FILE = os.environ.get("TRACE_OTLP_FILE", "")
+TRACE_SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "monet-ai")
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: dict, start_ns: Optional[int] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.status = "ok"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self, origin_ns: int) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "offset_ms": round((self.start_ns - origin_ns) / 1e6, 3),
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Returned outside a sampled turn (or with TRACING off) so call sites never branch."""
+
+    def set(self, **attributes):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    __slots__ = ("root", "spans", "sampled", "dropped", "kept")
+
+    def __init__(self, root: Span, sampled: bool):
+        self.root = root
+        self.spans: list[Span] = [root]
+        self.sampled = sampled
+        self.dropped = 0
+        # why the turn was kept: error, slow or head (sampled)
+        self.kept: Optional[str] = None
+
+    def add(self, span: Span) -> bool:
+        if self.root.end_ns is not None:
+            # a background task started during the turn outlived it
+            return False
+        if len(self.spans) >= TRACE_MAX_SPANS:
+            self.dropped += 1
+            return False
+        self.spans.append(span)
+        return True
+
+    def summary(self) -> dict:
+        return {
+            "trace_id": self.root.trace_id,
+            "name": self.root.name,
+            "start": self.root.start_ns / 1e9,
+            "duration_ms": round(self.root.duration_ms, 3),
+            "status": self.root.status,
+            "spans": len(self.spans),
+            "kept": self.kept,
+            "attributes": self.root.attributes,
+        }
+
+    def timeline(self) -> dict:
+        spans = sorted(self.spans, key=lambda span: span.start_ns)
+        return {**self.summary(), "dropped_spans": self.dropped, "timeline": [s.to_dict(self.root.start_ns) for s in spans]}
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("monet_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("monet_span", default=None)
+
+
+def _reset(var: ContextVar, token):
+    try:
+        var.reset(token)
+    except ValueError:
+        # finished in another context (e.g. a generator closed elsewhere): nothing to restore
+        pass
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> list[dict]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class Tracer:
+    """
+    Low-overhead span recorder for websocket turns.
+
+    `trace()` opens a turn; `span()` / `record()` add children to whatever
+    turn is current (a contextvar, so tasks spawned by the turn join it) and
+    cost one attribute lookup when there is none. Every turn is recorded;
+    when it ends it is kept if head-sampled (TRACE_SAMPLE_RATE), slower than
+    TRACE_SLOW_MS or not ok, and dropped otherwise. Kept turns go to a ring
+    buffer of TRACE_BUFFER_SIZE and, with TRACE_OTLP_FILE, to an OTLP/JSON file.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = TRACING,
+        sample_rate: float = TRACE_SAMPLE_RATE,
+        slow_ms: float = TRACE_SLOW_MS,
+        buffer_size: int = TRACE_BUFFER_SIZE,
+        otlp_file: str = TRACE_OTLP_FILE,
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.otlp_file = otlp_file
+        self._buffer: deque[Trace] = deque(maxlen=buffer_size)
+        self._export_lock = threading.Lock()
+        self.started = 0
+        self.kept = {"head": 0, "slow": 0, "error": 0}
+        self.export_errors = 0
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        """Open a root span for one turn; yields it (or a no-op span when tracing is off)."""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        root = Span(name, os.urandom(16).hex(), None, attributes)
+        trace = Trace(root, sampled=random.random() < self.sample_rate)
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(root)
+        self.started += 1
+        try:
+            yield root
+        except BaseException as e:
+            root.status = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+            root.attributes.setdefault("error", repr(e)[:200])
+            raise
+        finally:
+            root.end_ns = time.time_ns()
+            _reset(_current_span, span_token)
+            _reset(_current_trace, trace_token)
+            self._finish(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Child span of the current one; a no-op outside a turn. Not for blocks that span generator yields."""
+        trace = _current_trace.get()
+        if trace is None:
+            yield NOOP_SPAN
+            return
+        parent = _current_span.get()
+        span = Span(name, trace.root.trace_id, parent.span_id if parent else None, attributes)
+        if not trace.add(span):
+            yield NOOP_SPAN
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+            span.attributes.setdefault("error", repr(e)[:200])
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _reset(_current_span, token)
+
+    def record(self, name: str, seconds: float, **attributes):
+        """Add a finished child span that ended now and lasted `seconds` (for durations measured elsewhere)."""
+        trace = _current_trace.get()
+        if trace is None:
+            return
+        parent = _current_span.get()
+        end_ns = time.time_ns()
+        span = Span(name, trace.root.trace_id, parent.span_id if parent else None, attributes, end_ns - int(seconds * 1e9))
+        span.end_ns = end_ns
+        trace.add(span)
+
+    def annotate(self, **attributes):
+        """Set attributes on the current turn's root span."""
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.root.attributes.update(attributes)
+
+    def error(self, exc: BaseException):
+        """Mark the current turn failed for an exception that was handled (so it is kept)."""
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.root.status = "error"
+            trace.root.attributes["error"] = repr(exc)[:200]
+
+    def _finish(self, trace: Trace):
+        if trace.root.status != "ok":
+            reason = "error"
+        elif trace.root.duration_ms >= self.slow_ms:
+            reason = "slow"
+        elif trace.sampled:
+            reason = "head"
+        else:
+            return
+        trace.kept = reason
+        self.kept[reason] += 1
+        self._buffer.append(trace)
+        if self.otlp_file:
+            line = json.dumps(self.to_otlp([trace]), separators=(",", ":"), default=str)
+            try:
+                asyncio.get_running_loop().run_in_executor(None, self._export, line)
+            except RuntimeError:
+                self._export(line)
+
+    def _export(self, line: str):
+        try:
+            with self._export_lock, open(self.otlp_file, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError:
+            self.export_errors += 1
+
+    # -- reading
+
+    def traces(self, limit: int = 50, min_ms: float = 0.0) -> list[dict]:
+        """Kept turns, newest first."""
+        found = []
+        for trace in reversed(self._buffer):
+            if trace.root.duration_ms >= min_ms:
+                found.append(trace.summary())
+                if len(found) >= limit:
+                    break
+        return found
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        return next((trace for trace in self._buffer if trace.root.trace_id == trace_id), None)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_ms,
+            "started": self.started,
+            "kept": dict(self.kept),
+            "buffered": len(self._buffer),
+            "otlp_file": self.otlp_file or None,
+            "export_errors": self.export_errors,
+        }
+
+    @staticmethod
+    def to_otlp(traces: list[Trace]) -> dict:
+        """OTLP/JSON ExportTraceServiceRequest for `traces`."""
+        spans = []
+        for trace in traces:
+            for span in trace.spans:
+                spans.append({
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                    "name": span.name,
+                    "kind": 2 if span.parent_id is None else 1,  # SERVER for the turn, INTERNAL below it
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns or span.start_ns),
+                    "attributes": _otlp_attributes(span.attributes),
+                    "status": {"code": 1} if span.status == "ok" else {"code": 2, "message": span.status},
+                })
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": TRACE_SERVICE_NAME, "process.pid": os.getpid()})},
+                "scopeSpans": [{"scope": {"name": "monet.tracing"}, "spans": spans}],
+            }]
+        }
+
+
+tracer = Tracer()
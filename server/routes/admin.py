@@ -0,0 +1,126 @@
+import os
+import hmac
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from modules.ServerLogger import ServerLogger
+from modules.LoopMonitor import loop_monitor
+from modules.Profiler import ProfilerBusy, cpu_profiler, memory_profiler
+from modules.Tracing import tracer
+from utils.db_switcher import DBSwitcher
+from utils.warmup import WARMUP_CONCURRENCY, warm_survey
+
+admin_router = APIRouter(prefix="/admin", tags=["admin"])
+logger = ServerLogger()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """Admin endpoints are disabled unless ADMIN_TOKEN is set, and then need it in `X-Admin-Token`."""
+    expected = os.environ.get("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Admin API is disabled (ADMIN_TOKEN not set)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@admin_router.post("/surveys/{su_id}/warmup", dependencies=[Depends(require_admin)])
+async def warmup_survey(su_id: str, db_type: str = "mongo", concurrency: int = WARMUP_CONCURRENCY):
+    """
+    Precompute a survey's cold costs before launch: survey/question configs in
+    Redis, intents for every add_context question and this worker's compiled prompts.
+    """
+    report = await warm_survey(
+        DBSwitcher(logger=logger),
+        db_type=db_type,
+        su_id=su_id,
+        concurrency=concurrency,
+        on_progress=lambda event: logger.info(
+            f"Warm-up {su_id}: {event['done']}/{event['total']} ({event['qs_id']}, intent={event['intent']})"
+        ),
+    )
+    if "error" in report:
+        raise HTTPException(status_code=report["error"]["code"], detail=report["error"]["message"])
+    return {"error": False, "code": 200, "report": report}
+
+
+@admin_router.get("/traces", dependencies=[Depends(require_admin)])
+async def list_traces(limit: int = 50, min_ms: float = 0.0):
+    """Turns kept by this worker's tracer (slow, failed or head-sampled), newest first."""
+    return {"error": False, "code": 200, "stats": tracer.stats(), "traces": tracer.traces(limit=limit, min_ms=min_ms)}
+
+
+@admin_router.get("/traces/{trace_id}", dependencies=[Depends(require_admin)])
+async def get_trace(trace_id: str, format: str = "timeline"):
+    """One turn's spans as a timeline (offsets from the turn start) or as OTLP/JSON (`format=otlp`)."""
+    trace = tracer.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (not kept, or rotated out of the buffer)")
+    if format == "otlp":
+        return tracer.to_otlp([trace])
+    return {"error": False, "code": 200, "trace": trace.timeline()}
+
+
+@admin_router.post("/profile/cpu", dependencies=[Depends(require_admin)])
+async def profile_cpu(seconds: float = 10.0, interval_ms: float = 5.0, format: str = "collapsed", all_threads: bool = False):
+    """
+    Sample this worker's event loop thread (or every thread) for `seconds`.
+    `format=collapsed` returns flamegraph.pl / speedscope input, `json` the top frames.
+    """
+    try:
+        result = await cpu_profiler.profile(seconds, interval_ms, all_threads=all_threads)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "json":
+        return {"error": False, "code": 200, "profile": cpu_profiler.summary(result)}
+    return PlainTextResponse(
+        cpu_profiler.collapsed(result),
+        headers={"Content-Disposition": f'attachment; filename="cpu-{os.getpid()}.collapsed"'},
+    )
+
+
+@admin_router.post("/profile/memory/start", dependencies=[Depends(require_admin)])
+async def profile_memory_start(frames: int = 16):
+    """Start tracemalloc (stops itself after TRACEMALLOC_MAX_SECONDS) and take the baseline snapshot."""
+    return {"error": False, "code": 200, "memory": await memory_profiler.start(frames)}
+
+
+@admin_router.post("/profile/memory/reset", dependencies=[Depends(require_admin)])
+async def profile_memory_reset():
+    """Take a new baseline snapshot."""
+    try:
+        return {"error": False, "code": 200, "memory": await memory_profiler.reset()}
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@admin_router.get("/profile/memory", dependencies=[Depends(require_admin)])
+async def profile_memory_diff(limit: int = 25, depth: int = 2):
+    """Growth since the baseline by allocating module, by owning server module and by tracked instance counts."""
+    from routes.websocket import probes
+
+    try:
+        diff = await memory_profiler.diff(limit=limit, depth=depth)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"error": False, "code": 200, "memory": {**diff, "probe_registry": probes.stats()}}
+
+
+@admin_router.post("/profile/memory/stop", dependencies=[Depends(require_admin)])
+async def profile_memory_stop():
+    """Stop tracemalloc and drop the baseline."""
+    return {"error": False, "code": 200, "memory": memory_profiler.stop()}
+
+
+@admin_router.get("/loop-lag", dependencies=[Depends(require_admin)])
+async def loop_lag(limit: int = 20, order: str = "total_ms"):
+    """Event loop lag and the call sites that blocked the loop, worst first (`total_ms`, `max_ms` or `count`)."""
+    if order not in {"total_ms", "max_ms", "count"}:
+        raise HTTPException(status_code=400, detail="order must be total_ms, max_ms or count")
+    return {"error": False, "code": 200, "stats": loop_monitor.stats(), "sites": loop_monitor.top(limit, order)}
+
+
+@admin_router.post("/loop-lag/reset", dependencies=[Depends(require_admin)])
+async def loop_lag_reset():
+    """Forget the recorded blocking sites (the lag histogram is cumulative and is kept)."""
+    loop_monitor.reset()
+    return {"error": False, "code": 200, "stats": loop_monitor.stats()}
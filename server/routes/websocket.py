@@ -1,125 +1,346 @@
-import json
-import websockets
 import os
 import json
+import time
+import asyncio
+import websockets
 from redis import Redis
 from typing import Dict
 from bson import ObjectId
 # import httpx
-from models.Survey import SurveyResponse
-from modules.MongoWrapper import monet_db
+from modules.MongoWrapper import monet_db_async
 from types import SimpleNamespace
 from modules.ServerLogger import ServerLogger
 from modules.ProdProbe_v2 import Probe, NSIGHT_v2
+from modules.ProbeRegistry import ProbeRegistry
+from modules.ProbeStateStore import ProbeStateStore
+from modules.Metrics import time_stage, observe_stage
+from modules.Tracing import tracer
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from models.Survey import SurveyResponse, SurveyConfig, QuestionConfig
+from models.Survey import SurveyResponse, SurveyConfig, QuestionConfig, PySurvey, PySurveyQuestion
 from utils.db_switcher import DBSwitcher
+from utils.frames import negotiate_protocol, make_frame_writer
+from utils.connection import ConnectionReader, TurnProgress, disconnects_total
 
 websocket_router = APIRouter(prefix="/ws", tags=["websocket", "ai-qa"])
 logger = ServerLogger()
 
 active_connections: Dict[str, WebSocket] = {}
-DbSurvey = monet_db.get_collection("surveys")
-DbSurveyQuestion = monet_db.get_collection("survey-questions")
+DbSurvey = monet_db_async.get_collection("surveys")
+DbSurveyQuestion = monet_db_async.get_collection("survey-questions")
+
+MONGO_LOOKUP_TIMEOUT = float(os.environ.get("MONGO_LOOKUP_TIMEOUT_SECONDS", 5))
+# start the follow-up generation together with the metrics call instead of after it
+SPECULATIVE_FOLLOW_UP = os.environ.get("SPECULATIVE_FOLLOW_UP", "false").lower() == "true"
+
+probes = ProbeRegistry()
+probe_states = ProbeStateStore()
+PROBE_STATE_CAS_RETRIES = int(os.environ.get("PROBE_STATE_CAS_RETRIES", 3))
+
+
+async def _find_by_id(collection, doc_id: str, timeout: float = MONGO_LOOKUP_TIMEOUT):
+    """Non-blocking `find_one` by ObjectId, bounded by `timeout` seconds."""
+    return await asyncio.wait_for(collection.find_one({"_id": ObjectId(doc_id)}), timeout=timeout)
+
+
+class SpeculativeStream:
+    """
+    Drives the follow-up stream in the background while NSIGHT metrics are
+    being scored and buffers its chunks until the gibberish gate is decided.
+    Iterating replays the buffer and then follows the live stream; `cancel()`
+    aborts the generation if it is still running. Nothing is written to
+    history here: the handler records the follow-up once it has been sent.
+    """
+
+    def __init__(self, stream):
+        self._buffer: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._fill(stream))
+
+    async def _fill(self, stream):
+        try:
+            async for chunk in stream:
+                self._buffer.put_nowait(chunk)
+        finally:
+            self._buffer.put_nowait(None)
+
+    async def __aiter__(self):
+        while (chunk := await self._buffer.get()) is not None:
+            yield chunk
+        # surface provider errors raised while prefetching
+        await self._task
+
+    async def cancel(self):
+        if self._task.done():
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+class TurnClaim:
+    """The session state a claimed turn moved forward from, to put back if the turn does not complete."""
+
+    def __init__(self, key: str, version: int, state: dict, history_length: int):
+        self.key = key
+        # version the claim wrote (the one a rollback has to find)
+        self.version = version
+        self.state = state
+        self.history_length = history_length
+
+
+async def _claim_turn(key: str, survey: PySurvey, question: PySurveyQuestion, survey_response: SurveyResponse) -> tuple[Probe, TurnClaim]:
+    """
+    Rehydrate the respondent's Probe from the shared session state and claim
+    the next turn with a compare-and-set, so the turn can run on any worker.
+    The locally cached Probe is reused while its session is still current.
+    """
+    for _ in range(PROBE_STATE_CAS_RETRIES):
+        with tracer.span("probe_state_load"):
+            state, version = await probe_states.load(key)
+        session_no = int(state.get("session_no", 0))
+        new_session = survey_response.question == question.question
+        if new_session:
+            session_no += 1
+
+        probe = probes.get(key)
+        if probe is None or probe.session_no != session_no:
+            with time_stage("probe_init", provider=survey.config.llm.value, db_type="mongo"):
+                probe = await Probe.acreate(mo_id=survey_response.mo_id,metadata=survey,question=question,simple_store=False,session_no=session_no, survey_details=survey_response)
+            probes.put(key, probe)
+        elif not new_session and int(state.get("counter", probe.counter)) != probe.counter:
+            # another worker served turns of this session: our in-memory history is stale
+            with tracer.span("probe_rehydrate"):
+                await probe.ahydrate()
+        if not new_session:
+            probe.apply_state(state)
+
+        with tracer.span("probe_state_cas") as span:
+            claimed = await probe_states.compare_and_set(key, version, {**probe.to_state(), "counter": probe.counter + 1})
+            span.set(claimed=claimed)
+        if claimed:
+            return probe, TurnClaim(key, version + 1, state, len(probe.history.messages))
+        logger.warn(f"Probe state for {key} moved on another worker, retrying")
+    raise RuntimeError(f"Could not claim turn for {key}: concurrent updates")
+
+
+async def _release_turn(probe: Probe, claim: TurnClaim, reason: str):
+    """
+    Undo a claimed turn that did not complete: cut its messages out of the
+    history and put the session state back with a compensating CAS, so the
+    persisted counter never runs ahead of the persisted history.
+    """
+    # the in-memory copy no longer matches Redis: the next turn rehydrates
+    probes.discard(claim.key, reason=reason)
+    try:
+        with tracer.span("turn_rollback", reason=reason):
+            dropped = await probe.rollback(claim.history_length)
+            restored = await probe_states.compare_and_set(claim.key, claim.version, claim.state)
+    except Exception as e:
+        logger.error(f"Could not roll back turn for {claim.key}: {e}")
+        return
+    if not restored:
+        logger.warn(f"Probe state for {claim.key} moved on before the turn was rolled back")
+    logger.info(f"Rolled back turn for {claim.key} ({reason}), {dropped} history messages dropped")
+
+
+async def _close_stream(stream):
+    """Abort a turn stream nobody will read: `cancel()` for background generations, `aclose()` for generators."""
+    cancel = getattr(stream, "cancel", None)
+    if cancel is not None:
+        await cancel()
+        return
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+async def _run_turn(websocket: WebSocket, frames, data: str, progress: TurnProgress, session_keys: set):
+    # one trace per turn: kept in the admin ring buffer when slow, failed or sampled
+    with tracer.trace("ws_turn", protocol=frames.version) as span:
+        await _turn(websocket, frames, data, progress, session_keys)
+        span.set(stage=progress.stage, follow_up_chars=progress.follow_up_chars)
+
+
+async def _turn(websocket: WebSocket, frames, data: str, progress: TurnProgress, session_keys: set):
+    survey_response = SurveyResponse.model_validate_json(data)
+    tracer.annotate(su_id=survey_response.su_id, qs_id=survey_response.qs_id, mo_id=survey_response.mo_id)
+
+    # Fetch survey and question concurrently on the async client
+    lookup_started = time.perf_counter()
+    try:
+        survey, question = await asyncio.gather(
+            _find_by_id(DbSurvey, survey_response.su_id),
+            _find_by_id(DbSurveyQuestion, survey_response.qs_id),
+        )
+    except asyncio.TimeoutError:
+        observe_stage("survey_lookup", time.perf_counter() - lookup_started, db_type="mongo")
+        logger.error(f"Survey lookup timed out after {MONGO_LOOKUP_TIMEOUT}s")
+        await websocket.send_json({
+            "error": True,
+            "message": "Survey lookup timed out",
+            "code": 504
+        })
+        return
+
+    if not survey:
+        await websocket.send_json({
+            "error": True,
+            "message": "Survey not found",
+            "code": 404
+        })
+        return
+
+    if not question:
+        await websocket.send_json({
+            "error": True,
+            "message": "Question not found",
+            "code": 404
+        })
+        return
+
+    survey = PySurvey(**survey)
+    question = PySurveyQuestion(**question)
+    labels = {"provider": survey.config.llm.value, "db_type": "mongo"}
+    observe_stage("survey_lookup", time.perf_counter() - lookup_started, **labels)
+
+    claim = None
+    committed = False
+    try:
+        key = f"{survey_response.su_id}-{survey_response.qs_id}-{survey_response.mo_id}"
+        session_keys.add(key)
+        progress.stage = "claim"
+        with tracer.span("claim_turn", **labels):
+            probe, claim = await _claim_turn(key, survey, question, survey_response)
+        progress.claim = claim
+        tracer.annotate(session_no=probe.session_no, counter=probe.counter, fused=probe.fused)
+        progress.probe = probe
+
+        # Generate follow-up using the probe
+        turn_started = time.perf_counter()
+        with tracer.span("prepare_streams", **labels) as span:
+            stream, metric_stream = probe.gen_streamed_follow_up(survey_response.question, survey_response.response)
+            span.set(**probe.last_context)
+        if SPECULATIVE_FOLLOW_UP and not probe.fused:
+            stream = SpeculativeStream(stream)
+        # speculative and fused follow-ups generate while metrics are scored
+        progress.follow_up_started = SPECULATIVE_FOLLOW_UP or probe.fused
+        frames.labels = labels
+        frames.begin(
+            question="",
+            min_probing=probe.question.config.probes,
+            max_probing=probe.question.config.max_probes,
+        )
+        is_gibberish = None
+        metric = None
+
+        try:
+            progress.stage = "metrics"
+            metric_started = time.perf_counter()
+            first_partial = True
+            async for metric in metric_stream:
+                if first_partial:
+                    observe_stage("metrics_first_partial", time.perf_counter() - metric_started, **labels)
+                    first_partial = False
+                is_gibberish = True if metric.gibberish_score > question.config.gibberish_score else False
+                await frames.metrics(
+                    ended=True if metric.quality >= probe.question.config.quality_threshold else False,
+                    metrics=metric.model_dump(),
+                    is_gibberish=is_gibberish,
+                )
+            progress.metrics_done = True
+            observe_stage("metrics_total", time.perf_counter() - metric_started, **labels)
+
+            # the gate is only decided on the final metric: a partial
+            # gibberish_score can still be a truncated number
+            if is_gibberish == False:
+                progress.stage = "follow_up"
+                progress.follow_up_started = True
+                follow_up_started = turn_started if (SPECULATIVE_FOLLOW_UP or probe.fused) else time.perf_counter()
+                first_token = True
+                follow_up = ""
+                async for chunk in stream:
+                    if first_token:
+                        now = time.perf_counter()
+                        observe_stage("follow_up_first_token", now - follow_up_started, **labels)
+                        observe_stage("turn_first_token", now - turn_started, **labels)
+                        first_token = False
+                    follow_up += chunk.content
+                    progress.follow_up_chars += len(chunk.content)
+                    await frames.token(chunk.content, ended=probe.ended)
+                # only a question the respondent actually received goes into history
+                probe.add_follow_up(follow_up)
+                observe_stage("follow_up_total", time.perf_counter() - follow_up_started, **labels)
+        finally:
+            # abort generations nobody will read (gibberish gate, errors, client gone)
+            await _close_stream(stream)
+            await _close_stream(metric_stream)
+
+        # generation is done: from here on a disconnect no longer cancels the turn
+        progress.stage = "finishing"
+        if "prescreen" not in probe.last_context:
+            progress.completed(len(metric.model_dump_json()) if metric is not None else 0)
+        # the turn only counts once its history is in Redis: other workers rehydrate from it
+        with tracer.span("history_flush", **labels):
+            await probe.history.aflush()
+        committed = True
+        # charge the turn's history growth to the registry's byte budget
+        probes.touch(key)
+        try:
+            await frames.end()
+        finally:
+            if probe.simple_store:
+                nsight_v2 = NSIGHT_v2(**{**metric.model_dump(), "question": survey_response.question, "response": survey_response.response})
+                # only enqueues: the write-behind buffer inserts in bulk off the turn
+                with time_stage("store_response", **labels):
+                    await probe.store_response(nsight_v2, probe.session_no)
+
+    except Exception as e:
+        logger.error(f"Error in microservice WS communication: {e}")
+        tracer.error(e)
+        if claim is not None and not committed:
+            await _release_turn(probe, claim, reason="failed")
+        await websocket.send_json({
+            "error": True,
+            "message": str(e),
+            "code": 500
+        })
 
-probes = {}
 
 @websocket_router.websocket("/ai-qa")
 async def websocket_ai_qa(websocket: WebSocket):
-    await websocket.accept()
-    
+    protocol, subprotocol = negotiate_protocol(websocket)
+    await websocket.accept(subprotocol=subprotocol)
+    frames = make_frame_writer(websocket, protocol)
+    reader = ConnectionReader(websocket)
+    # registry entries this connection used, released when it goes away
+    session_keys: set = set()
+
     try:
         while True:
-            data = await websocket.receive_text()
-            survey_response = SurveyResponse.model_validate_json(data)
-            
-          `  # Validate the survey exists
-            survey = DbSurvey.find_one({"_id": ObjectId(survey_response.su_id)})
-            if not survey:
-                await websocket.send_json({
-                    "error": True,
-                    "message": "Survey not found",
-                    "code": 404
-                })
-                continue
-`
-            question = DbSurveyQuestion.find_one({"_id": ObjectId(survey_response.qs_id)})
-            if not question:
-                await websocket.send_json({
-                    "error": True,
-                    "message": "Question not found",
-                    "code": 404
-                })
-                continue
-
-            survey = PySurvey(**survey)
-            question = PySurveyQuestion(**question)
-
-            try:
-                probe = None
-                key = f"{survey_response.su_id}-{survey_response.qs_id}-{survey_response.mo_id}"
-                if key in probes:
-                    probe = probes[key]
-                else:
-                    probe = Probe(mo_id=survey_response.mo_id,metadata=survey,question=question,simple_store=False,session_no=0, survey_details=survey_response)
-                    probes[key] = probe
-                if survey_response.question == question.question:
-                    session_no = probe.session_no + 1
-                    probe = Probe(mo_id=survey_response.mo_id,metadata=survey,question=question,simple_store=False,session_no=session_no, survey_details=survey_response)
-                    probes[key] = probe   
-
-                # Generate follow-up using the probe
-                stream, metric_stream = probe.gen_streamed_follow_up(survey_response.question, survey_response.response)
-                final_response = {
-                    "error": False,
-                    "message": "streaming-started",
-                    "code": 200,
-                    "response": {
-                        "question": "",
-                        "min_probing": probe.question.config.probes,
-                        "max_probing": probe.question.config.max_probes,
-                    }
-                }
-                ended_response = {}
-
-                async for metric in metric_stream:
-                    final_response["message"] = "streaming-started"
-                    final_response["response"] = {
-                        **final_response["response"],
-                        "ended": True if metric.quality >= probe.question.config.quality_threshold else False,
-                        "metrics": metric.model_dump(),
-                        "is_gibberish": True if metric.gibberish_score > question.config.gibberish_score else False
-                    }
-                    ended_response = final_response.copy()
-                    ended_response["message"] = "streaming-ended"
-                    await websocket.send_json(final_response)
-
-                if final_response["response"]["is_gibberish"] == False:
-                    async for chunk in stream:
-                        final_response["message"] = "streaming"
-                        final_response["response"] = {
-                            **final_response["response"],
-                            "question": chunk.content,
-                            "ended": probe.ended,
-                        }
-                        await websocket.send_json(final_response)
-
-                await websocket.send_json(ended_response)
-                if probe.simple_store:
-                    nsight_v2 = NSIGHT_v2(**{**metric.model_dump(), "question": survey_response.question, "response": survey_response.response})
-                    probe.store_response(nsight_v2, session_no)
-                    
-            except Exception as e:
-                logger.error(f"Error in microservice WS communication: {e}")
-                await websocket.send_json({
-                    "error": True,
-                    "message": str(e),
-                    "code": 500
-                })
+            data = await reader.receive()
+            progress = TurnProgress()
+            turn = asyncio.create_task(_run_turn(websocket, frames, data, progress, session_keys))
+            if not await reader.guard(turn, cancellable=progress.generating):
+                if progress.generating():
+                    saved = progress.cancelled()
+                    if progress.claim is not None:
+                        # the claim already moved the shared counter on: put it back with the history
+                        await _release_turn(progress.probe, progress.claim, reason="abandoned")
+                    logger.info(f"Client disconnected mid-turn ({progress.stage}), cancelled generation, ~{sum(saved.values()):.0f} tokens saved")
+                disconnects_total.inc(reason="client")
+                raise WebSocketDisconnect(code=reader.close_code or 1000)
 
     except WebSocketDisconnect:
         logger.info(f"Client disconnected")
     except Exception as e:
+        disconnects_total.inc(reason="error")
         logger.error(f"WebSocket error:")
         logger.error(e)
         await websocket.close(code=1011, reason="Internal server error")
+    finally:
+        await reader.close()
+        await frames.close()
+        # the session state lives in Redis: a reconnect on any worker rehydrates it
+        for key in session_keys:
+            probes.discard(key, reason="disconnected")
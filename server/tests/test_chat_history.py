@@ -0,0 +1,74 @@
+import os
+import sys
+import asyncio
+
+import pytest
+from fakeredis import aioredis
+from redis.exceptions import ConnectionError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from modules.ChatHistory import AsyncRedisChatHistory  # noqa: E402
+
+
+class FlakyRedis:
+    """Async Redis whose pipelines fail `execute()` the first `failures` times."""
+
+    def __init__(self, failures: int):
+        self.redis = aioredis.FakeRedis()
+        self.failures = failures
+
+    def pipeline(self, transaction: bool = True):
+        pipe = self.redis.pipeline(transaction=transaction)
+        if self.failures:
+            self.failures -= 1
+
+            async def execute():
+                raise ConnectionError("connection reset by peer")
+
+            pipe.execute = execute
+        return pipe
+
+    def __getattr__(self, name):
+        return getattr(self.redis, name)
+
+
+def _history(failures: int) -> AsyncRedisChatHistory:
+    return AsyncRedisChatHistory("su-qs-mo:1", FlakyRedis(failures))
+
+
+def test_aflush_retries_a_failed_pipeline():
+    async def run():
+        history = _history(failures=2)
+        history.add_user_message("first answer")
+        history.add_ai_message("follow-up")
+        await history.aflush(retries=3, backoff=0)
+        return await history.redis_client.lrange(history.key, 0, -1)
+
+    assert len(asyncio.run(run())) == 2
+
+
+def test_aflush_raises_while_history_is_unwritten():
+    async def run():
+        history = _history(failures=10)
+        history.add_user_message("first answer")
+        with pytest.raises(ConnectionError):
+            await history.aflush(retries=2, backoff=0)
+        assert history._pending
+        return await history.redis_client.lrange(history.key, 0, -1)
+
+    assert asyncio.run(run()) == []
+
+
+def test_atruncate_drops_the_turn_in_memory_and_in_redis():
+    async def run():
+        history = _history(failures=0)
+        history.add_user_message("first answer")
+        history.add_ai_message("follow-up")
+        await history.aflush()
+        history.add_user_message("second answer")
+        dropped = await history.atruncate(2)
+        await history.aload()
+        return dropped, [m.content for m in history.messages]
+
+    assert asyncio.run(run()) == (1, ["first answer", "follow-up"])
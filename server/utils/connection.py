@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import asyncio
+from typing import Any, Optional
+from fastapi import WebSocket, WebSocketDisconnect
+from modules.Metrics import metrics
+from modules.ServerLogger import ServerLogger
+
+logger = ServerLogger()
+
+# close connections that sent nothing (not even a ping) for this long between turns
+WS_IDLE_TIMEOUT = float(os.environ.get("WS_IDLE_TIMEOUT_SECONDS", 900))
+# answers a client may send ahead of the turn being streamed
+WS_MAX_QUEUED_MESSAGES = int(os.environ.get("WS_MAX_QUEUED_MESSAGES", 8))
+
+PONG = json.dumps({"type": "pong"})
+
+disconnects_total = metrics.counter(
+    "monet_ws_disconnects_total",
+    "Websocket connections that ended, by reason (client, idle, error).",
+    ("reason",),
+)
+turns_cancelled_total = metrics.counter(
+    "monet_turns_cancelled_total",
+    "Turns cancelled because the client went away, by the stage they were in.",
+    ("stage",),
+)
+cancelled_tokens_total = metrics.counter(
+    "monet_cancelled_tokens_total",
+    "Approximate LLM tokens not spent because a turn was cancelled "
+    "(input: prompt never sent, output: generation cut short).",
+    ("chain", "kind"),
+)
+
+
+def _is_ping(message: str) -> bool:
+    if message == "ping":
+        return True
+    if '"ping"' not in message[:40]:
+        return False
+    try:
+        return json.loads(message).get("type") == "ping"
+    except (ValueError, AttributeError):
+        return False
+
+
+class ConnectionReader:
+    """
+    Reads the client's messages in a background task, so a disconnect is
+    noticed while a turn is still streaming instead of on the next
+    `receive_text()`.
+
+    Application-level pings (`"ping"` or `{"type": "ping"}`) are answered with
+    `{"type": "pong"}` and only refresh the idle timer; protocol-level
+    ping/pong is left to the ASGI server (uvicorn `--ws-ping-interval`).
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        idle_timeout: float = WS_IDLE_TIMEOUT,
+        max_queued: int = WS_MAX_QUEUED_MESSAGES,
+    ):
+        self._ws = websocket
+        self.idle_timeout = idle_timeout
+        self._inbox: asyncio.Queue = asyncio.Queue(maxsize=max(max_queued, 1))
+        self.disconnected = asyncio.Event()
+        self.close_code: Optional[int] = None
+        self.last_seen = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        try:
+            while True:
+                message = await self._ws.receive_text()
+                self.last_seen = time.monotonic()
+                if _is_ping(message):
+                    await self._ws.send_text(PONG)
+                    continue
+                # a full inbox applies backpressure: the socket is not read until a turn finishes
+                await self._inbox.put(message)
+        except WebSocketDisconnect as e:
+            self.close_code = e.code
+        except Exception as e:
+            logger.error(f"Websocket reader stopped: {e}")
+        finally:
+            self.disconnected.set()
+
+    async def receive(self) -> str:
+        """
+        Next message from the client. Raises WebSocketDisconnect once the
+        client is gone, or after closing a connection idle for `idle_timeout`.
+        """
+        while True:
+            if not self._inbox.empty():
+                return self._inbox.get_nowait()
+            if self.disconnected.is_set():
+                disconnects_total.inc(reason="client")
+                raise WebSocketDisconnect(code=self.close_code or 1000)
+            remaining = self.last_seen + self.idle_timeout - time.monotonic()
+            if remaining <= 0:
+                disconnects_total.inc(reason="idle")
+                logger.info(f"Closing websocket idle for {self.idle_timeout}s")
+                await self.close()
+                try:
+                    await self._ws.close(code=1001, reason="Idle timeout")
+                except Exception:
+                    pass
+                raise WebSocketDisconnect(code=1001)
+            get = asyncio.ensure_future(self._inbox.get())
+            gone = asyncio.ensure_future(self.disconnected.wait())
+            done, _ = await asyncio.wait({get, gone}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            gone.cancel()
+            if get in done:
+                return get.result()
+            get.cancel()
+
+    async def guard(self, task: asyncio.Task, cancellable=lambda: True) -> bool:
+        """
+        Wait for `task` (a turn). If the client disconnects first and
+        `cancellable()` still holds, cancel the task; returns False when the
+        client went away during the task.
+        """
+        gone = asyncio.ensure_future(self.disconnected.wait())
+        try:
+            done, _ = await asyncio.wait({task, gone}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            gone.cancel()
+        if task not in done and cancellable():
+            task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            if not self.disconnected.is_set():
+                raise
+        except Exception as e:
+            if not self.disconnected.is_set():
+                raise
+            # sends racing the disconnect fail; that is the disconnect, not a turn error
+            logger.info(f"Turn ended by client disconnect: {e}")
+        return not self.disconnected.is_set()
+
+    async def close(self):
+        if self._task.done():
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+class OutputEstimator:
+    """Running mean of each chain's completed output size, in tokens (~4 characters each)."""
+
+    def __init__(self, prior_tokens: float = 64, weight: float = 0.05):
+        self._means: dict[str, float] = {}
+        self._prior = prior_tokens
+        self._weight = weight
+
+    def record(self, chain: str, chars: int):
+        mean = self._means.get(chain, self._prior)
+        self._means[chain] = mean + self._weight * (chars / 4 - mean)
+
+    def expected(self, chain: str) -> float:
+        return self._means.get(chain, self._prior)
+
+
+output_estimator = OutputEstimator()
+
+
+class TurnProgress:
+    """What one turn has started and streamed so far, to account for it if it is cancelled."""
+
+    def __init__(self):
+        self.stage = "lookup"
+        self.probe: Any = None
+        # the session state the turn claimed, to roll back if it is cancelled
+        self.claim: Any = None
+        self.follow_up_started = False
+        self.follow_up_chars = 0
+        self.metrics_done = False
+
+    def generating(self) -> bool:
+        """True while cancelling the turn still stops LLM work."""
+        return self.stage in {"lookup", "claim", "metrics", "follow_up"}
+
+    def completed(self, metric_chars: int):
+        # gibberish-gated and prescreened turns generate nothing and would skew the means
+        if self.follow_up_chars:
+            output_estimator.record("follow_up", self.follow_up_chars)
+        if metric_chars:
+            output_estimator.record("metrics", metric_chars)
+
+    def cancelled(self) -> dict:
+        """Record a cancellation; returns the approximate tokens it saved per chain."""
+        turns_cancelled_total.inc(stage=self.stage)
+        saved = {}
+        context = getattr(self.probe, "last_context", None) or {}
+        if self.stage in {"metrics", "follow_up"} and "prescreen" not in context:
+            if not self.metrics_done:
+                saved["metrics"] = output_estimator.expected("metrics")
+                cancelled_tokens_total.inc(saved["metrics"], chain="metrics", kind="output")
+            saved["follow_up"] = max(output_estimator.expected("follow_up") - self.follow_up_chars / 4, 0)
+            cancelled_tokens_total.inc(saved["follow_up"], chain="follow_up", kind="output")
+            if not self.follow_up_started:
+                # the follow-up call was never made: its prompt is saved too
+                prompt = context.get("follow_up_tokens", 0)
+                cancelled_tokens_total.inc(prompt, chain="follow_up", kind="input")
+                saved["follow_up"] += prompt
+        return saved
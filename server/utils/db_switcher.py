@@ -1,177 +1,3 @@
-<<<<<<< HEAD
-import json
-import pytz
-from datetime import datetime
-from typing import Dict, Any, Optional, Tuple
-from bson import ObjectId
-from sqlalchemy import text
-from redis.asyncio import Redis
-from utils.helper import Helper
-
-from modules.ServerLogger import ServerLogger
-# from database.SQL_Wrapper import AsyncSessionLocal
-
-logger = ServerLogger()
-helper = Helper()
-
-async def get_survey_config(
-    su_id: str,
-    qs_id: str,
-    mo_id: str,
-    redis_client: Redis,
-    db_type: str | None = None,
-    ttl: int = 86400
-) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
-
-    cache_key = f"survey_details:{su_id}:{qs_id}"
-    
-    try:
-        if redis_client:
-            cached = await redis_client.get(cache_key)
-            if cached:
-                return json.loads(cached), None
-
-        if db_type == "mongo" or helper._is_object_id(su_id):
-            config = await _fetch_mongo(su_id, qs_id)
-        elif db_type == "mysql" or helper._is_int_id(su_id):
-            config = await _fetch_mysql(su_id, qs_id)
-        else:
-            raise ValueError("Invalid db_type")
-            
-        if redis_client:
-            await redis_client.setex(cache_key, ttl, json.dumps(config))
-        return config, None
-
-    except Exception as e:
-        logger.error(f"Error fetching survey config: {e}")
-        return None, {"error": True, "message": str(e), "code": 500}
-
-
-async def _fetch_mongo(su_id: str, qs_id: str) -> Dict[str, Any]:
-    from modules.MongoWrapper import monet_db
-    
-    survey = monet_db.get_collection("surveys").find_one({"_id": ObjectId(su_id)})
-    question = monet_db.get_collection("survey-questions").find_one({"_id": ObjectId(qs_id)})
-    
-    if not survey or not question:
-        raise ValueError("Survey or question not found in MongoDB")
-    
-    return {
-        "survey": {
-            "survey_description": survey.get("description", "-"),
-            "language": survey.get("config", {}).get("language", "English"),
-            "add_context": survey.get("config", {}).get("add_context", True),
-        },
-        "question": {
-            "question": question.get("question", ""),
-            "question_description": question.get("description", ""),
-            "min_probe": question.get("config", {}).get("probes", 0),
-            "max_probe": question.get("config", {}).get("max_probes", 0),
-            "quality_threshold": question.get("config", {}).get("quality_threshold", 4),
-            "gibberish_score": question.get("config", {}).get("gibberish_score", 4),
-            "add_context": question.get("config", {}).get("add_context", True),
-        }
-    }
-
-
-async def _fetch_mysql(su_id: str, qs_id: str) -> Dict[str, Any]:
-    # async with AsyncSessionLocal() as session:
-    #     # Fetch Survey
-    #     result = await session.execute(
-    #         text("SELECT * FROM test_study WHERE study_id = :su_id"),
-    #         {"su_id": su_id}
-    #     )
-    #     survey_row = result.mappings().first()
-        
-    #     # Fetch Question
-    #     result = await session.execute(
-    #         text("SELECT * FROM probe_survey_question WHERE qs_id = :qs_id AND su_id = :su_id"),
-    #         {"qs_id": qs_id, "su_id": su_id}
-    #     )
-    #     question_row = result.mappings().first()
-        
-    #     if not survey_row or not question_row:
-    #         raise ValueError("Survey or question not found in MySQL")
-            
-    #     global_flags = json.loads(survey_row.get("global_flags") or "{}")
-    #     question_config = json.loads(question_row.get("config") or "{}")
-        
-    #     return {
-    #         "survey": {
-    #             "survey_description": global_flags.get("survey_description", "-"),
-    #             "language": global_flags.get("language", "English"),
-    #             "add_context": True, # Default for SQL
-    #         },
-    #         "question": {
-    #             "question": question_row.get("question", ""),
-    #             "question_description": question_row.get("description", ""),
-    #             "min_probe": question_config.get("probes", 0),
-    #             "max_probe": question_config.get("max_probes", 0),
-    #             "quality_threshold": question_config.get("quality_threshold", 4),
-    #             "gibberish_score": question_config.get("gibberish_score", 4),
-    #             "add_context": question_config.get("add_context", True),
-    #         }
-    #     }
-    pass
-
-
-async def save_probe_response(
-    survey_response: Any,
-    nsight_v2: Any,
-    probe: Any,
-    db_type: str | None = None,
-    session_no: int = 0
-):
-    """Save probe interaction to DB"""
-    if db_type == "mongo" or helper._is_object_id(survey_response.su_id):
-        await _save_mongo(survey_response, nsight_v2, probe, session_no)
-    elif db_type == "mysql" or helper._is_int_id(survey_response.su_id):
-        await _save_mysql(survey_response, nsight_v2, probe)
-    else:
-        raise ValueError("Invalid db_type")
-
-
-async def _save_mongo(survey_response: Any, nsight_v2: Any, probe: Any, session_no: int):
-    from modules.MongoWrapper import monet_db_test
-
-    QnAs = monet_db_test.get_collection("QnAs")
-    
-    data_to_save = survey_response.model_dump() if hasattr(survey_response, "model_dump") else survey_response
-    metrics_container = nsight_v2.model_dump() if hasattr(nsight_v2, "model_dump") else nsight_v2
-    metrics = metrics_container.get("metrics", {})
-    
-    print(
-        metrics,
-        "this is metrics",
-        data_to_save,
-        "this is data_to_save"
-    )
-
-    metadata = {
-        "mo_id": probe.mo_id if (probe and hasattr(probe, 'mo_id')) else getattr(survey_response, 'mo_id', None),
-        "su_id": probe.su_id if (probe and hasattr(probe, 'su_id')) else getattr(survey_response, 'su_id', None),
-        "qs_id": probe.qs_id if (probe and hasattr(probe, 'qs_id')) else getattr(survey_response, 'qs_id', None),
-        "quality": metrics.get("quality", 0),
-        "relevance": metrics.get("relevance", 0),
-        "confusion": metrics.get("confusion", 0),
-        "detail": metrics.get("detail", 0),
-        "annoyed": metrics.get("annoyed", 0),
-        "session_no": session_no,
-        "keywords": metrics.get("keywords", []),
-        "created_at": datetime.now(pytz.timezone("Asia/Kolkata")).isoformat(),
-    }
-    
-    QnAs.insert_one({**data_to_save, **metadata})
-
-
-async def _save_mysql(survey_response: Any, nsight_v2: Any, probe: Any):
-    from models.sql.models import SurveyResponseTest
-    async with AsyncSessionLocal() as session:
-        new_res = SurveyResponseTest(
-            su_id=survey_response.su_id,
-            mo_id=survey_response.mo_id,
-            qs_id=survey_response.qs_id,
-=======
 from __future__ import annotations
 
 import json
@@ -214,21 +40,17 @@ class MongoSurveyRepository:
         survey_response: SurveyResponseLike,
     ) -> FetchResult:
         """Fetch survey and question from MongoDB and normalize to Pydantic models."""
+        import asyncio
         from bson import ObjectId
-        from modules.MongoWrapper import monet_db
-        from models.Survey import (
-            PySurvey,
-            PySurveyQuestion,
-            QuestionConfig,
-            SurveyConfig,
-            PdSurvey,
-            PdSurveyQuestion,
-        )
+        from modules.MongoWrapper import monet_db_async
 
-        db_survey = monet_db.get_collection("surveys")
-        db_question = monet_db.get_collection("survey-questions")
+        db_survey = monet_db_async.get_collection("surveys")
+        db_question = monet_db_async.get_collection("survey-questions")
 
-        survey_doc = db_survey.find_one({"_id": ObjectId(survey_response.su_id)})
+        survey_doc, question_doc = await asyncio.gather(
+            db_survey.find_one({"_id": ObjectId(survey_response.su_id)}),
+            db_question.find_one({"_id": ObjectId(survey_response.qs_id)}),
+        )
         if not survey_doc:
             return None, None, {
                 "error": True,
@@ -236,7 +58,6 @@ class MongoSurveyRepository:
                 "code": 404,
             }
 
-        question_doc = db_question.find_one({"_id": ObjectId(survey_response.qs_id)})
         if not question_doc:
             return None, None, {
                 "error": True,
@@ -244,20 +65,34 @@ class MongoSurveyRepository:
                 "code": 404,
             }
 
-        survey = PySurvey(**survey_doc)
-        question = PySurveyQuestion(**question_doc)
+        return self._normalize_survey(survey_doc), self._normalize_question(question_doc), None
 
-        normalized_survey = PdSurvey(
+    @staticmethod
+    def _normalize_survey(survey_doc: dict) -> Any:
+        """Mongo survey document -> PdSurvey."""
+        from models.Survey import PySurvey, SurveyConfig, PdSurvey
+
+        survey = PySurvey(**survey_doc)
+        return PdSurvey(
             id=None,
             study_id=None,
             survey_description=survey.description,
             survey_title=survey.title,
             config=SurveyConfig(
                 language=survey.config.language,
+                llm=survey.config.llm,
                 add_context=survey.config.add_context,
+                response_cache=survey.config.response_cache,
             ),
         )
-        normalized_question = PdSurveyQuestion(
+
+    @staticmethod
+    def _normalize_question(question_doc: dict) -> Any:
+        """Mongo survey-question document -> PdSurveyQuestion."""
+        from models.Survey import PySurveyQuestion, QuestionConfig, PdSurveyQuestion
+
+        question = PySurveyQuestion(**question_doc)
+        return PdSurveyQuestion(
             question=question.question,
             description=question.description,
             config=QuestionConfig(
@@ -269,23 +104,46 @@ class MongoSurveyRepository:
             ),
         )
 
-        return normalized_survey, normalized_question, None
+    async def fetch_survey_questions(self, su_id: str) -> Tuple[Optional[Any], list, Optional[ErrorDict]]:
+        """Fetch a survey and all of its questions (two queries) as (survey, [(qs_id, question)], error)."""
+        import asyncio
+        from bson import ObjectId
+        from modules.MongoWrapper import monet_db_async
+
+        db_survey = monet_db_async.get_collection("surveys")
+        db_question = monet_db_async.get_collection("survey-questions")
+
+        survey_doc, question_docs = await asyncio.gather(
+            db_survey.find_one({"_id": ObjectId(su_id)}),
+            db_question.find({"su_id": {"$in": [ObjectId(su_id), su_id]}}).sort("seq_num", 1).to_list(None),
+        )
+        if not survey_doc:
+            return None, [], {
+                "error": True,
+                "message": "Survey not found",
+                "code": 404,
+            }
+
+        questions = [(str(doc["_id"]), self._normalize_question(doc)) for doc in question_docs]
+        return self._normalize_survey(survey_doc), questions, None
 
-    def store_response(
+    async def store_response(
         self,
         *,
         nsight_v2: Any,
         probe: Any,
         session_no: int,
         logger: Any = None,
-    ) -> Any:
-        """Store probe response in MongoDB."""
-        from modules.MongoWrapper import monet_db_test  # type: ignore
+    ) -> bool:
+        """Queue the probe response for a bulk insert into MongoDB (write-behind)."""
+        from modules.MongoWrapper import monet_db_test_async  # type: ignore
+        from utils.write_behind import write_behind
 
         india = pytz.timezone("Asia/Kolkata")
         now_india = datetime.now(india)
-        QnAs = monet_db_test.get_collection("QnAs")
-        insert_one_res = QnAs.insert_one({
+        QnAs = monet_db_test_async.get_collection("QnAs")
+        # snapshot the probe now: it moves on to the next turn before the flush
+        return await write_behind.mongo(QnAs).put({
             **nsight_v2.model_dump(),
             "ended": probe.ended,
             "mo_id": probe.mo_id,
@@ -295,10 +153,6 @@ class MongoSurveyRepository:
             "created_at": now_india.isoformat(),
             "session_no": session_no,
         })
-        if logger:
-            logger.info("Inserted one doc successfully")
-            logger.info(insert_one_res)
-        return insert_one_res
 
 
 class MySQLSurveyRepository:
@@ -312,12 +166,6 @@ class MySQLSurveyRepository:
         """Fetch survey and question from MySQL via SQLAlchemy."""
         from sqlalchemy import text
         from modules.SQL_Wrapper import AsyncSessionLocal
-        from models.Survey import (
-            QuestionConfig,
-            SurveyConfig,
-            PdSurvey,
-            PdSurveyQuestion,
-        )
 
         async def _run_queries(session: Any) -> FetchResult:
             query_survey = text(
@@ -337,22 +185,7 @@ class MySQLSurveyRepository:
                     "code": 404,
                 }
 
-            global_flags = json.loads(survey_row.get("global_flags") or "{}")
-
-            survey_config = SurveyConfig(
-                language=global_flags.get("language", "English"),
-            )
-
-            survey = PdSurvey(
-                id=survey_row.get("id"),
-                study_id=survey_row.get("study_id"),
-                cnt_id=survey_row.get("cnt_id"),
-                survey_description=global_flags.get("survey_description", "-"),
-                survey_title=survey_row.get("study_name")
-                or survey_row.get("cell_name")
-                or survey_row.get("survey_title"),
-                config=survey_config,
-            )
+            survey = self._survey_from_row(survey_row)
 
             query_question = text(
                 "SELECT * FROM probe_survey_question "
@@ -373,17 +206,7 @@ class MySQLSurveyRepository:
                     "code": 404,
                 }
 
-            parse_config = json.loads(question_row.get("config") or "{}")
-            question_config = QuestionConfig(**parse_config)
-            question = PdSurveyQuestion(
-                id=question_row.get("id"),
-                su_id=question_row.get("su_id"),
-                cnt_id=question_row.get("cnt_id"),
-                question=question_row.get("question"),
-                description=question_row.get("description"),
-                seq_num=question_row.get("seq_num"),
-                config=question_config,
-            )
+            question = self._question_from_row(question_row)
             return survey, question, None
 
         if db is not None:
@@ -392,6 +215,83 @@ class MySQLSurveyRepository:
         async with AsyncSessionLocal() as session:
             return await _run_queries(session)
 
+    @staticmethod
+    def _survey_from_row(survey_row: Any) -> Any:
+        """test_study row -> PdSurvey."""
+        from models.Survey import SurveyConfig, PdSurvey
+
+        global_flags = json.loads(survey_row.get("global_flags") or "{}")
+
+        survey_config = SurveyConfig(
+            language=global_flags.get("language", "English"),
+            llm=global_flags.get("llm", "chatgpt"),
+            response_cache=bool(global_flags.get("response_cache", False)),
+        )
+
+        return PdSurvey(
+            id=survey_row.get("id"),
+            study_id=survey_row.get("study_id"),
+            cnt_id=survey_row.get("cnt_id"),
+            survey_description=global_flags.get("survey_description", "-"),
+            survey_title=survey_row.get("study_name")
+            or survey_row.get("cell_name")
+            or survey_row.get("survey_title"),
+            config=survey_config,
+        )
+
+    @staticmethod
+    def _question_from_row(question_row: Any) -> Any:
+        """probe_survey_question row -> PdSurveyQuestion."""
+        from models.Survey import QuestionConfig, PdSurveyQuestion
+
+        parse_config = json.loads(question_row.get("config") or "{}")
+        question_config = QuestionConfig(**parse_config)
+        return PdSurveyQuestion(
+            id=question_row.get("id"),
+            su_id=question_row.get("su_id"),
+            cnt_id=question_row.get("cnt_id"),
+            question=question_row.get("question"),
+            description=question_row.get("description"),
+            seq_num=question_row.get("seq_num"),
+            config=question_config,
+        )
+
+    async def fetch_survey_questions(self, su_id: str, db: Any = None) -> Tuple[Optional[Any], list, Optional[ErrorDict]]:
+        """Fetch a survey and all of its questions (two queries) as (survey, [(qs_id, question)], error)."""
+        from sqlalchemy import text
+        from modules.SQL_Wrapper import AsyncSessionLocal
+
+        async def _run_queries(session: Any):
+            result = await session.execute(
+                text("SELECT * FROM test_study WHERE study_id = :su_id"),
+                {"su_id": su_id},
+            )
+            survey_row = result.mappings().first()
+            if not survey_row:
+                return None, [], {
+                    "error": True,
+                    "message": "Survey not found",
+                    "code": 404,
+                }
+            result = await session.execute(
+                text(
+                    "SELECT * FROM probe_survey_question "
+                    "WHERE su_id = :su_id ORDER BY seq_num"
+                ),
+                {"su_id": su_id},
+            )
+            questions = [
+                (str(row.get("qs_id")), self._question_from_row(row))
+                for row in result.mappings().all()
+            ]
+            return self._survey_from_row(survey_row), questions, None
+
+        if db is not None:
+            return await _run_queries(db)
+
+        async with AsyncSessionLocal() as session:
+            return await _run_queries(session)
+
     async def store_response(
         self,
         *,
@@ -400,41 +300,40 @@ class MySQLSurveyRepository:
         probe: Any,
         db: Any = None,
     ) -> Any:
-        """Store probe response in MySQL."""
-        from models.sql.models import SurveyResponseTest
-        from modules.SQL_Wrapper import AsyncSessionLocal
+        """
+        Queue the probe response for a bulk insert into MySQL (write-behind).
 
-        new_survey_response = SurveyResponseTest(
-            su_id=survey_response.su_id,
-            mo_id=survey_response.mo_id,
-            qs_id=survey_response.qs_id,
-            cnt_id=survey_response.cnt_id,
->>>>>>> 9288b782cee2c14fb72674c36545d94c1b069e05
-            question=survey_response.question,
-            response=survey_response.response,
-            reason=nsight_v2.reason,
-            keywords=nsight_v2.keywords,
-            quality=nsight_v2.quality,
-            relevance=nsight_v2.relevance,
-            confusion=nsight_v2.confusion,
-            negativity=nsight_v2.negativity,
-            consistency=nsight_v2.consistency,
-            qs_no=probe.counter,
-            session_no=probe.session_no,
-        )
-<<<<<<< HEAD
-        session.add(new_res)
-        await session.commit()
-=======
+        With an explicit `db` session the row is written in that session
+        instead, so callers that manage their own transaction keep doing so.
+        """
+        from models.sql.models import SurveyResponseTest
+        from utils.write_behind import write_behind
+
+        row = {
+            "su_id": survey_response.su_id,
+            "mo_id": survey_response.mo_id,
+            "qs_id": survey_response.qs_id,
+            "cnt_id": survey_response.cnt_id,
+            "question": survey_response.question,
+            "response": survey_response.response,
+            "reason": nsight_v2.reason,
+            "keywords": nsight_v2.keywords,
+            "quality": nsight_v2.quality,
+            "relevance": nsight_v2.relevance,
+            "confusion": nsight_v2.confusion,
+            "negativity": nsight_v2.negativity,
+            "consistency": nsight_v2.consistency,
+            "qs_no": probe.counter,
+            "session_no": probe.session_no,
+            "created_at": datetime.now(),
+        }
         if db is not None:
+            new_survey_response = SurveyResponseTest(**row)
             db.add(new_survey_response)
             await db.commit()
             return new_survey_response
 
-        async with AsyncSessionLocal() as session:
-            session.add(new_survey_response)
-            await session.commit()
-            return new_survey_response
+        return await write_behind.sql(SurveyResponseTest).put(row)
 
 
 class DBSwitcher:
@@ -476,13 +375,41 @@ class DBSwitcher:
 
         error_dict is None when both survey and question are found.
         """
+        from modules.Tracing import tracer
+
+        db_type_norm = self._normalize_db_type(db_type)
+
+        with tracer.span("db_fetch_survey_question", db_type=db_type_norm):
+            if db_type_norm in {"mongo", "mongodb", ""}:
+                return await self._mongo.fetch_survey_question(survey_response)
+
+            if db_type_norm in {"mysql", "sql"}:
+                return await self._mysql.fetch_survey_question(survey_response, db)
+
+        raise ValueError(f"Unsupported db_type: {db_type}")
+
+    async def fetch_survey_questions(
+        self,
+        *,
+        db_type: Optional[str],
+        su_id: str,
+        db: Any = None,
+    ) -> Tuple[Optional[Any], list, Optional[ErrorDict]]:
+        """
+        Return (survey, [(qs_id, question), ...], error_dict) for every question of a survey.
+
+        Used by the survey warm-up (utils.warmup); two queries regardless of the question count.
+        """
+        from modules.Tracing import tracer
+
         db_type_norm = self._normalize_db_type(db_type)
 
-        if db_type_norm in {"mongo", "mongodb", ""}:
-            return await self._mongo.fetch_survey_question(survey_response)
+        with tracer.span("db_fetch_survey_questions", db_type=db_type_norm):
+            if db_type_norm in {"mongo", "mongodb", ""}:
+                return await self._mongo.fetch_survey_questions(su_id)
 
-        if db_type_norm in {"mysql", "sql"}:
-            return await self._mysql.fetch_survey_question(survey_response, db)
+            if db_type_norm in {"mysql", "sql"}:
+                return await self._mysql.fetch_survey_questions(su_id, db)
 
         raise ValueError(f"Unsupported db_type: {db_type}")
 
@@ -496,7 +423,9 @@ class DBSwitcher:
             "survey": {
                 "survey_description": survey.survey_description,
                 "language": survey.config.language,
+                "llm": survey.config.llm.value,
                 "add_context": survey.config.add_context,
+                "response_cache": survey.config.response_cache,
             },
             "question": {
                 "question": question.question,
@@ -517,13 +446,30 @@ class DBSwitcher:
         qs_id: str,
     ) -> str:
         """Save output payload to Redis and return the key used."""
-        from redis import Redis
+        from utils.redis_pool import get_redis
 
-        redis_client = Redis.from_url(self._redis_url)
+        redis_client = get_redis(self._redis_url)
         redis_key = f"survey_details:{su_id}:{qs_id}"
         redis_client.setex(redis_key, self._redis_ttl_survey, json.dumps(output))
         return redis_key
 
+    async def asave_outputs_to_redis(
+        self,
+        outputs: list[Tuple[str, str, Dict[str, Dict[str, Any]]]],
+    ) -> list[str]:
+        """Save many (su_id, qs_id, output) payloads in one pipelined round trip; returns the keys."""
+        from utils.redis_pool import get_async_redis
+
+        redis_client = get_async_redis(self._redis_url)
+        pipe = redis_client.pipeline(transaction=False)
+        keys = []
+        for su_id, qs_id, output in outputs:
+            redis_key = f"survey_details:{su_id}:{qs_id}"
+            pipe.setex(redis_key, self._redis_ttl_survey, json.dumps(output))
+            keys.append(redis_key)
+        await pipe.execute()
+        return keys
+
     async def fetch_and_cache_survey_details(
         self,
         *,
@@ -544,12 +490,19 @@ class DBSwitcher:
         if error or not survey or not question:
             return None, error
 
+        from modules.Tracing import tracer
+
         output = self.build_output(survey, question)
-        self.save_output_to_redis(
-            output=output,
-            su_id=survey_response.su_id,
-            qs_id=survey_response.qs_id,
-        )
+        with tracer.span("survey_details_cache_set", sync=True):
+            self.save_output_to_redis(
+                output=output,
+                su_id=survey_response.su_id,
+                qs_id=survey_response.qs_id,
+            )
+        # the survey/question config was (re)loaded: drop prompts compiled from the old one
+        from modules.PromptCompiler import prompt_compiler
+
+        prompt_compiler.invalidate(survey_response.su_id, survey_response.qs_id)
         return output, None
 
     async def simple_store_response(
@@ -562,22 +515,30 @@ class DBSwitcher:
         session_no: int,
         db: Any = None,
     ) -> Any:
-        """Store probe response in Mongo or MySQL depending on db_type."""
+        """
+        Queue the probe response for Mongo or MySQL depending on db_type.
+
+        Rows are written in bulk by the write-behind buffers (utils.write_behind),
+        so this only waits for a database when the buffer applies backpressure.
+        """
+        from modules.Tracing import tracer
+
         db_type_norm = self._normalize_db_type(db_type)
-        if db_type_norm in {"mongo", "mongodb"}:
-            return self._mongo.store_response(
-                nsight_v2=nsight_v2,
-                probe=probe,
-                session_no=session_no,
-                logger=self._logger,
-            )
-        if db_type_norm in {"mysql", "sql"}:
-            return await self._mysql.store_response(
-                nsight_v2=nsight_v2,
-                survey_response=survey_response,
-                probe=probe,
-                db=db,
-            )
+        with tracer.span("db_store_response", db_type=db_type_norm):
+            if db_type_norm in {"mongo", "mongodb"}:
+                return await self._mongo.store_response(
+                    nsight_v2=nsight_v2,
+                    probe=probe,
+                    session_no=session_no,
+                    logger=self._logger,
+                )
+            if db_type_norm in {"mysql", "sql"}:
+                return await self._mysql.store_response(
+                    nsight_v2=nsight_v2,
+                    survey_response=survey_response,
+                    probe=probe,
+                    db=db,
+                )
         raise ValueError(f"Unsupported db_type: {db_type}")
 
 
@@ -608,18 +569,50 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Fetch survey and question by DB type.")
     parser.add_argument("--db-type", required=True, help="mongo or mysql")
     parser.add_argument("--su-id", required=True, help="Survey ID")
-    parser.add_argument("--qs-id", required=True, help="Question ID")
+    parser.add_argument("--qs-id", help="Question ID (not needed with --warmup)")
     parser.add_argument(
         "--cache",
         action="store_true",
         help="Store output in Redis using configured REDIS_URL/TTL.",
     )
+    parser.add_argument(
+        "--warmup",
+        action="store_true",
+        help="Warm every question of the survey: Redis details, intents and prompts.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(os.environ.get("WARMUP_CONCURRENCY", 8)),
+        help="Max concurrent intent extractions during --warmup.",
+    )
     args = parser.parse_args()
+    if not args.warmup and not args.qs_id:
+        parser.error("--qs-id is required unless --warmup is given")
 
     async def _main():
         """CLI entry point to fetch and print survey/question data."""
         survey_response = _SurveyResponseStub(args.su_id, args.qs_id)
         switcher = DBSwitcher(logger=ServerLogger())
+        if args.warmup:
+            from utils.warmup import warm_survey
+
+            def _progress(event: dict):
+                print(
+                    f"[{event['done']}/{event['total']}] {event['qs_id']} "
+                    f"intent={event['intent']} ({event['intent_s']}s)"
+                )
+
+            report = await warm_survey(
+                switcher,
+                db_type=args.db_type,
+                su_id=args.su_id,
+                concurrency=args.concurrency,
+                on_progress=_progress,
+            )
+            report.pop("per_question", None)
+            print(json.dumps(report, indent=2))
+            return
         if args.cache:
             output, error = await switcher.fetch_and_cache_survey_details(
                 db_type=args.db_type,
@@ -642,4 +635,3 @@ if __name__ == "__main__":
         print(output)
 
     asyncio.run(_main())
->>>>>>> 9288b782cee2c14fb72674c36545d94c1b069e05
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import asyncio
+from typing import Any
+from fastapi import WebSocket
+from modules.Metrics import observe_stage
+
+try:
+    import orjson
+
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+except ImportError:  # pragma: no cover - orjson is optional
+    def dumps(obj: Any) -> str:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+PROTOCOL_V2 = "monet.v2"
+COALESCE_MS = float(os.environ.get("WS_V2_COALESCE_MS", 30))
+
+
+def negotiate_protocol(websocket: WebSocket) -> tuple[int, str | None]:
+    """
+    Pick the frame protocol for a connection before it is accepted.
+
+    Clients opt into v2 with the `monet.v2` websocket subprotocol or a
+    `?protocol=2` query parameter; everyone else keeps the v1 full frames.
+    Returns (version, subprotocol to accept with).
+    """
+    if PROTOCOL_V2 in websocket.scope.get("subprotocols", []):
+        return 2, PROTOCOL_V2
+    if websocket.query_params.get("protocol") in {"2", "v2"}:
+        return 2, None
+    return 1, None
+
+
+class FrameWriter:
+    """
+    v1 protocol: every update sends the full `final_response` frame.
+
+    One writer lives for the whole connection; `begin()` resets it per turn.
+    """
+
+    version = 1
+
+    def __init__(self, websocket: WebSocket):
+        self._ws = websocket
+        self._response: dict = {}
+        self._ended_frame: dict = {}
+        # metric labels (provider, db_type) of the turn being streamed
+        self.labels: dict = {}
+
+    def begin(self, **response):
+        self._response = response
+        self._ended_frame = {}
+
+    async def metrics(self, **fields):
+        self._response = {**self._response, **fields}
+        frame = self._frame("streaming-started")
+        self._ended_frame = {**frame, "message": "streaming-ended"}
+        await self._send(self._ws.send_json, frame)
+
+    async def token(self, text: str, **fields):
+        self._response = {**self._response, "question": text, **fields}
+        await self._send(self._ws.send_json, self._frame("streaming"))
+
+    async def end(self):
+        await self._send(self._ws.send_json, self._ended_frame)
+
+    async def _send(self, send, payload):
+        started = time.perf_counter()
+        await send(payload)
+        observe_stage("ws_send", time.perf_counter() - started, **self.labels)
+
+    async def close(self):
+        pass
+
+    def _frame(self, message: str) -> dict:
+        return {
+            "error": False,
+            "message": message,
+            "code": 200,
+            "response": self._response,
+        }
+
+
+class DeltaFrameWriter(FrameWriter):
+    """
+    v2 protocol: delta-encoded, time-coalesced frames.
+
+        {"v": 2, "seq": 3, "message": "streaming", "reset": true,
+         "delta": {"metrics": {...}}, "append": {"question": "tokens"}}
+
+    `delta` holds only the response fields that changed since the previous
+    frame and `append` text to concatenate to the field. `reset` marks the
+    first frame of a turn (the client drops its state first). Updates are
+    merged into a single pending frame that a sender task flushes at most
+    once per coalescing window; while a send to a slow client is in flight
+    new updates keep merging into that one frame, so intermediate frames are
+    dropped instead of buffered.
+    """
+
+    version = 2
+
+    def __init__(self, websocket: WebSocket, window_ms: float = COALESCE_MS):
+        super().__init__(websocket)
+        self._window = max(window_ms, 0) / 1000
+        self._seq = 0
+        self._sent: dict = {}
+        self._pending: dict = {}
+        self._tokens: list[str] = []
+        self._message: str | None = None
+        self._reset = False
+        self._closing = False
+        self._ended_snapshot: dict = {}
+        self._wake = asyncio.Event()
+        self._sender: asyncio.Task | None = None
+        self.dropped_frames = 0
+
+    def begin(self, **response):
+        super().begin(**response)
+        self._sent = {}
+        self._pending = dict(response)
+        self._tokens = []
+        self._reset = True
+        self._closing = False
+        self._message = None
+        self._ended_snapshot = {}
+        if self._sender is None or self._sender.done():
+            self._sender = asyncio.create_task(self._run())
+        self._wake.set()
+
+    async def metrics(self, **fields):
+        self._queue("streaming-started", fields)
+        self._ended_snapshot = {**self._sent, **self._pending}
+
+    async def token(self, text: str, **fields):
+        self._tokens.append(text)
+        self._queue("streaming", fields)
+
+    async def end(self):
+        await self._drain()
+        delta = {k: v for k, v in self._ended_snapshot.items() if k != "question" and self._sent.get(k) != v}
+        self._seq += 1
+        await self._send(self._ws.send_text, dumps({"v": 2, "seq": self._seq, "message": "streaming-ended", "delta": delta}))
+        self._sent.update(delta)
+
+    async def close(self):
+        if self._sender is not None and not self._sender.done():
+            self._sender.cancel()
+            try:
+                await self._sender
+            except asyncio.CancelledError:
+                pass
+
+    def _queue(self, message: str, fields: dict):
+        if self._sender is not None and self._sender.done():
+            # the sender died (client went away): surface it to the handler
+            self._sender.result()
+        for key, value in fields.items():
+            if key in self._pending or self._sent.get(key) != value:
+                self._pending[key] = value
+        if self._message is not None:
+            self.dropped_frames += 1
+        self._message = message
+        self._wake.set()
+
+    def _take(self) -> str | None:
+        if self._message is None and not self._reset:
+            return None
+        self._seq += 1
+        frame: dict = {"v": 2, "seq": self._seq, "message": self._message or "streaming-started"}
+        if self._reset:
+            frame["reset"] = True
+            self._reset = False
+        if self._pending:
+            frame["delta"] = self._pending
+            self._sent.update(self._pending)
+        if self._tokens:
+            frame["append"] = {"question": "".join(self._tokens)}
+        self._pending = {}
+        self._tokens = []
+        self._message = None
+        return dumps(frame)
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            if not self._closing and self._window:
+                await asyncio.sleep(self._window)
+            self._wake.clear()
+            frame = self._take()
+            if frame is not None:
+                await self._send(self._ws.send_text, frame)
+            if self._closing and self._message is None and not self._reset:
+                return
+
+    async def _drain(self):
+        self._closing = True
+        self._wake.set()
+        if self._sender is not None:
+            await self._sender
+        self._sender = None
+
+
+def make_frame_writer(websocket: WebSocket, version: int) -> FrameWriter:
+    if version == 2:
+        return DeltaFrameWriter(websocket)
+    return FrameWriter(websocket)
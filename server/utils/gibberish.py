@@ -0,0 +1,214 @@
+import re
+import math
+import unicodedata
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Optional
+
+WORDLIST_PATH = Path(__file__).parent / "data" / "en_words.txt"
+
+# whole answers that mean "no answer" in an English survey (after lower-casing,
+# dropping punctuation and squeezing stretched letters, e.g. "Idk!!" / "dunnooo")
+NON_ANSWERS = {
+    "idk", "i dk", "idc", "dk", "dunno", "i dunno", "idek", "no idea", "no clue",
+    "i dont know", "dont know", "i do not know", "do not know", "i don't know", "don't know",
+    "not sure", "im not sure", "i'm not sure", "no comment", "no comments", "na", "n a",
+    "nil", "pass", "skip", "nothing to say", "i have no idea", "no answer",
+}
+
+_TOKEN = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?|\d+(?:[.,/:]\d+)*")
+_STRETCH = re.compile(r"(\w)\1{2,}")
+_REPEAT = re.compile(r"(.{1,6}?)\1{2,}", re.S)
+_WORD_REPEAT = re.compile(r"(.{2,4}?)\1+")
+_VOWELS = set("aeiouy")
+
+
+@dataclass
+class GibberishEstimate:
+    """Local gibberish estimate on the NSIGHT scale (0 = meaningful, 10 = gibberish)."""
+
+    score: float
+    confidence: float
+    verdict: str  # "empty" | "non_answer" | "gibberish" | "ok" | "unsure"
+    features: dict = field(default_factory=dict)
+
+    @property
+    def band(self) -> tuple[float, float]:
+        """Range the LLM's gibberish_score is expected to fall in."""
+        spread = 5.0 * (1.0 - self.confidence)
+        return max(0.0, self.score - spread), min(10.0, self.score + spread)
+
+
+class GibberishScorer:
+    """
+    Cheap in-process pre-screen for survey answers.
+
+    Combines the cues the NSIGHT prompt asks the LLM for: character entropy,
+    alphabetic ratio, valid-word ratio over a bundled English wordlist,
+    letter-bigram plausibility (a bigram model trained on the same wordlist)
+    and repetition runs of non-words. Confidence grows with the margin from
+    the decision boundary and with the amount of text, so short answers are
+    rarely decided locally. Word and bigram cues only apply to English
+    surveys; the others are language-agnostic.
+    """
+
+    def __init__(self, words: Optional[list[str]] = None, wordlist_path: Path = WORDLIST_PATH):
+        self._words = words
+        self._wordlist_path = wordlist_path
+        self._vocab: Optional[frozenset] = None
+        self._bigram_logp: dict[str, float] = {}
+        self._floor_logp = 0.0
+
+    def _load(self):
+        if self._vocab is not None:
+            return
+        words = self._words
+        if words is None:
+            with open(self._wordlist_path, encoding="utf-8") as f:
+                words = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        self._vocab = frozenset(words)
+
+        # conditional letter-bigram model, words weighted by frequency rank (Zipf)
+        counts: dict[str, float] = {}
+        totals: dict[str, float] = {}
+        for rank, word in enumerate(words, start=1):
+            weight = 1.0 / math.sqrt(rank)
+            padded = f"^{word.replace(chr(39), '')}$"
+            for a, b in zip(padded, padded[1:]):
+                counts[a + b] = counts.get(a + b, 0.0) + weight
+                totals[a] = totals.get(a, 0.0) + weight
+        alphabet = 28  # a-z and the two boundary markers
+        self._bigram_logp = {
+            pair: math.log((count + 0.01) / (totals[pair[0]] + 0.01 * alphabet))
+            for pair, count in counts.items()
+        }
+        self._floor_logp = math.log(0.01 / (max(totals.values()) + 0.01 * alphabet))
+
+    def is_word(self, token: str) -> bool:
+        self._load()
+        if token in self._vocab:
+            return True
+        # inflections and contractions the frequency list may not carry
+        for suffix in ("'s", "s", "es", "ed", "d", "ing", "ly", "er", "est"):
+            if token.endswith(suffix) and len(token) - len(suffix) >= 3 and token[:-len(suffix)] in self._vocab:
+                return True
+        # laughter and emphasis written as one token: "hahaha", "nonono"
+        repeat = _WORD_REPEAT.fullmatch(token)
+        return repeat is not None and self.is_repeatable(repeat.group(1))
+
+    def is_repeatable(self, unit: str) -> bool:
+        """A word that still means something when repeated; the wordlist's consonant-only abbreviations ("jk", "mn") do not."""
+        self._load()
+        return unit in self._vocab and any(c in _VOWELS for c in unit)
+
+    def _bigram(self, a: str, b: str) -> float:
+        return self._bigram_logp.get(a + b, self._floor_logp)
+
+    def score(self, text: str, language: str = "English") -> GibberishEstimate:
+        text = (text or "").strip()
+        chars = [c for c in text if not c.isspace()]
+        if not any(c.isalnum() for c in chars):
+            if any(unicodedata.category(c) == "So" for c in chars):
+                # emoji / pictographs ("👍", "😀😀😀") can be a real answer: leave it to the LLM
+                return GibberishEstimate(5.0, 0.0, "unsure", {"chars": len(chars), "symbols_only": True})
+            return GibberishEstimate(10.0, 1.0, "empty", {"chars": len(chars)})
+
+        english = (language or "English").strip().lower() in {"english", "en"}
+        lowered = text.lower()
+        normalized = " ".join(_STRETCH.sub(r"\1", re.sub(r"[^\w\s']", " ", lowered)).split())
+        if english and normalized in NON_ANSWERS:
+            return GibberishEstimate(10.0, 1.0, "non_answer", {"chars": len(chars)})
+
+        n = len(chars)
+        letters = sum(c.isalpha() for c in chars)
+        digits = sum(c.isdigit() for c in chars)
+        alpha_ratio = (letters + digits) / n
+
+        freq: dict[str, int] = {}
+        for c in chars:
+            freq[c] = freq.get(c, 0) + 1
+        entropy = -sum(k / n * math.log2(k / n) for k in freq.values())
+        # English text sits around 4 bits/char once long enough; short strings are capped by log2(n)
+        expected_entropy = min(math.log2(n), 4.1) if n > 1 else 1.0
+        entropy_dev = abs(entropy - expected_entropy) / expected_entropy
+
+        # repeating a real word ("good good good", "hahaha", "lol lol") is emphasis, not gibberish:
+        # only runs of non-words count, and without a wordlist only single characters and symbols
+        def meaningless(unit: str) -> bool:
+            if len(unit) == 1 or not unit.isalpha():
+                return True
+            return english and not self.is_repeatable(unit)
+
+        squeezed = "".join(chars).lower()
+        repeated = sum(
+            len(m.group(0)) for m in _REPEAT.finditer(squeezed)
+            if len(m.group(0)) >= 6 and meaningless(m.group(1))
+        )
+        tokens = _TOKEN.findall(lowered)
+        words = [t for t in tokens if not t[0].isdigit()]
+        word_repetition = 0.0
+        if len(words) >= 4 and len(set(words)) < len(words):
+            junk = [w for w in words if meaningless(w)]
+            word_repetition = (len(junk) - len(set(junk))) / len(words)
+        repetition = max(repeated / n, word_repetition)
+
+        features = {
+            "chars": n,
+            "alpha_ratio": round(alpha_ratio, 3),
+            "entropy": round(entropy, 3),
+            "repetition": round(repetition, 3),
+        }
+
+        if english and words:
+            ascii_words = [w for w in words if w.isascii()]
+            letter_count = sum(len(w) for w in words) or 1
+            valid_letters = sum(len(w) for w in words if self.is_word(w))
+            valid_ratio = valid_letters / letter_count
+
+            # per-bigram log-likelihood of the words that are not in the wordlist
+            rare = total = 0
+            consonant_run = 0
+            for w in ascii_words:
+                if self.is_word(w):
+                    continue
+                padded = f"^{w.replace(chr(39), '')}$"
+                for a, b in zip(padded, padded[1:]):
+                    total += 1
+                    if self._bigram(a, b) < -5.0:
+                        rare += 1
+                run = 0
+                for c in w:
+                    run = 0 if c in _VOWELS else run + 1
+                    consonant_run = max(consonant_run, run)
+            rare_ratio = rare / total if total else 0.0
+            features.update({
+                "valid_ratio": round(valid_ratio, 3),
+                "rare_bigrams": round(rare_ratio, 3),
+                "consonant_run": consonant_run,
+            })
+            z = (
+                -4.0
+                + 5.0 * (1.0 - valid_ratio)
+                + 4.0 * rare_ratio
+                + 3.0 * (1.0 - alpha_ratio)
+                + 8.0 * repetition
+                + 1.5 * min(entropy_dev, 1.0) * (1.0 - valid_ratio)
+                + 0.5 * max(consonant_run - 3, 0)
+            )
+            evidence = 1.0 - math.exp(-letter_count / 4.0)
+        else:
+            # no wordlist for this language: only symbol soup and repetition are decidable
+            z = -3.0 + 6.0 * (1.0 - alpha_ratio) + 6.0 * repetition
+            evidence = (1.0 - math.exp(-n / 6.0)) if (repetition >= 0.5 or alpha_ratio < 0.3) else 0.0
+
+        probability = 1.0 / (1.0 + math.exp(-z))
+        score = round(10.0 * probability, 2)
+        confidence = round(abs(2.0 * probability - 1.0) * evidence, 3)
+        if confidence < 0.5:
+            verdict = "unsure"
+        else:
+            verdict = "gibberish" if probability >= 0.5 else "ok"
+        return GibberishEstimate(score, confidence, verdict, features)
+
+
+gibberish_scorer = GibberishScorer()
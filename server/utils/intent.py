@@ -1,5 +1,44 @@
-from typing import Callable
+import os
+import uuid
+import asyncio
+from typing import Awaitable, Callable
 from langchain_core.prompts import PromptTemplate
+from modules.Metrics import metrics
+from modules.Tracing import tracer
+
+INTENT_LOCK_TTL_MS = int(os.environ.get("INTENT_LOCK_TTL_MS", 30000))
+INTENT_LOCK_POLL_MS = int(os.environ.get("INTENT_LOCK_POLL_MS", 100))
+INTENT_WAIT_TIMEOUT = float(os.environ.get("INTENT_WAIT_TIMEOUT_SECONDS", 30))
+
+intent_lookups = metrics.counter(
+    "monet_intent_lookups_total",
+    "Intent lookups by how they were served (cache, coalesced, remote_wait, llm, fallback).",
+    ("result",),
+)
+
+# compare-and-delete, so a worker never releases a lock that expired and was re-taken
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+INTENT_PROMPT = PromptTemplate(
+    template="""
+            You are given a survey question and description explaining its purpose. Identify the underlying intent the question is trying to understand from the respondent.
+            Write clear sentence that summarizes what the question aims to learn. Do not include quotes or extra text.
+            
+            Question: {question_text}
+            
+            Intent: {intent}
+            
+            Intent:
+        """.strip()
+)
+
+# in-flight extractions in this process, by intent key
+_inflight: dict[str, asyncio.Future] = {}
 
 
 def _intent_key(survey_details: dict, logger) -> str:
@@ -51,25 +90,14 @@ def extract_intent(
     if not intent:
         return ""
 
-    cached = _get_intent(redis_client, survey_details, ttl_seconds, logger)
+    with tracer.span("intent_cache_get", sync=True):
+        cached = _get_intent(redis_client, survey_details, ttl_seconds, logger)
     if cached:
         return cached
 
-    prompt = PromptTemplate(
-        template="""
-            You are given a survey question and description explaining its purpose. Identify the underlying intent the question is trying to understand from the respondent.
-            Write clear sentence that summarizes what the question aims to learn. Do not include quotes or extra text.
-            
-            Question: {question_text}
-            
-            Intent: {intent}
-            
-            Intent:
-        """.strip()
-    )
-
     try:
-        intent = invoke_fn(prompt, {"intent": intent, "question_text": question_text})
+        with tracer.span("intent_llm", sync=True):
+            intent = invoke_fn(INTENT_PROMPT, {"intent": intent, "question_text": question_text})
     except Exception as exc:
         logger.error(f"extract_intent failed: {exc}")
         _store_intent(redis_client, ttl_seconds, survey_details, intent, logger)
@@ -82,3 +110,147 @@ def extract_intent(
 
     _store_intent(redis_client, ttl_seconds, survey_details, final_intent, logger)
     return final_intent
+
+
+async def _aget_intent(redis_client, key: str, ttl_seconds: int, logger) -> str | None:
+    try:
+        cached = await redis_client.get(key)
+        if cached is None:
+            return None
+        try:
+            await redis_client.expire(key, ttl_seconds)
+        except Exception as exc:
+            logger.error(f"refresh_intent_ttl failed: {exc}")
+        if isinstance(cached, bytes):
+            cached = cached.decode("utf-8", errors="ignore")
+        return str(cached)
+    except Exception as exc:
+        logger.error(f"get_intent failed: {exc}")
+        return None
+
+
+async def _astore_intent(redis_client, key: str, ttl_seconds: int, intent: str, logger) -> None:
+    try:
+        await redis_client.setex(key, ttl_seconds, intent)
+    except Exception as exc:
+        logger.error(f"store_intent failed: {exc}")
+
+
+async def _acall_llm(intent: str, question_text: str, ainvoke_fn, logger) -> str:
+    try:
+        with tracer.span("intent_llm"):
+            result = await ainvoke_fn(INTENT_PROMPT, {"intent": intent, "question_text": question_text})
+    except Exception as exc:
+        logger.error(f"extract_intent failed: {exc}")
+        intent_lookups.inc(result="fallback")
+        return intent
+    intent_lookups.inc(result="llm")
+    if isinstance(result, str):
+        return result.strip()
+    return getattr(result, "content", str(result)).strip()
+
+
+async def _aextract_across_workers(
+    key: str,
+    intent: str,
+    question_text: str,
+    ainvoke_fn,
+    logger,
+    redis_client,
+    ttl_seconds: int,
+) -> str:
+    """One LLM call per key across workers: the `SET NX` lock holder extracts, everyone else polls the cache."""
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + INTENT_WAIT_TIMEOUT
+    while True:
+        try:
+            acquired = await redis_client.set(lock_key, token, nx=True, px=INTENT_LOCK_TTL_MS)
+        except Exception as exc:
+            logger.error(f"intent lock failed, extracting without it: {exc}")
+            acquired, lock_key = True, None
+
+        if acquired:
+            try:
+                # the previous holder may have stored it between our cache miss and the lock
+                cached = await _aget_intent(redis_client, key, ttl_seconds, logger)
+                if cached:
+                    intent_lookups.inc(result="remote_wait")
+                    return cached
+                final_intent = await _acall_llm(intent, question_text, ainvoke_fn, logger)
+                await _astore_intent(redis_client, key, ttl_seconds, final_intent, logger)
+                return final_intent
+            finally:
+                if lock_key is not None:
+                    try:
+                        await redis_client.eval(_RELEASE_LOCK, 1, lock_key, token)
+                    except Exception as exc:
+                        logger.error(f"intent lock release failed: {exc}")
+
+        # another worker is extracting: wait for its result or for the lock to go away
+        tracer.record("intent_lock_busy", 0.0)
+        while loop.time() < deadline:
+            await asyncio.sleep(INTENT_LOCK_POLL_MS / 1000)
+            cached = await _aget_intent(redis_client, key, ttl_seconds, logger)
+            if cached:
+                intent_lookups.inc(result="remote_wait")
+                return cached
+            try:
+                if not await redis_client.exists(lock_key):
+                    break  # the holder gave up without storing: take over
+            except Exception:
+                pass
+        else:
+            logger.error(f"Timed out after {INTENT_WAIT_TIMEOUT}s waiting for intent {key}")
+            intent_lookups.inc(result="fallback")
+            return intent
+
+
+async def aextract_intent(
+    question_description: str,
+    question_text: str,
+    survey_details: dict,
+    ainvoke_fn: Callable[[PromptTemplate, dict[str, str]], Awaitable[str]],
+    logger,
+    redis_client,
+    ttl_seconds: int,
+) -> str:
+    """
+    Async `extract_intent` with stampede protection.
+
+    Concurrent misses for the same `question_intent:{su_id}:{qs_id}` key share
+    one in-flight future in this process, and a Redis `SET NX` lock lets only
+    one worker call the LLM; every waiter gets that one result. Takes an async
+    Redis client and `LLMAdapter.ainvoke`.
+    """
+    intent = (question_description or "").strip()
+    if not intent:
+        return ""
+
+    key = _intent_key(survey_details, logger)
+    with tracer.span("intent_cache_get"):
+        cached = await _aget_intent(redis_client, key, ttl_seconds, logger)
+    if cached:
+        intent_lookups.inc(result="cache")
+        return cached
+
+    inflight = _inflight.get(key)
+    if inflight is not None:
+        intent_lookups.inc(result="coalesced")
+        with tracer.span("intent_coalesced_wait"):
+            return await asyncio.shield(inflight)
+
+    future = _inflight[key] = asyncio.get_running_loop().create_future()
+    try:
+        final_intent = await _aextract_across_workers(
+            key, intent, question_text, ainvoke_fn, logger, redis_client, ttl_seconds
+        )
+        future.set_result(final_intent)
+        return final_intent
+    except BaseException:
+        # the waiters fall back to the description instead of failing their turn
+        future.set_result(intent)
+        raise
+    finally:
+        _inflight.pop(key, None)
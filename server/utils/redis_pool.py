@@ -0,0 +1,79 @@
+import os
+from typing import Optional
+from redis import BlockingConnectionPool, Redis
+from redis.asyncio import BlockingConnectionPool as AsyncBlockingConnectionPool, Redis as AsyncRedis
+
+DEFAULT_REDIS_URL = "redis://localhost:6379/0"
+# `memory://` (e.g. REDIS_URL=memory://) gives an in-process fakeredis server per URL, for offline benches
+MEMORY_SCHEME = "memory://"
+# every session shares the one pool per URL: once all its connections are busy a command waits
+# up to REDIS_POOL_TIMEOUT_SECONDS for one instead of failing with "Too many connections"
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", 200))
+REDIS_POOL_TIMEOUT = float(os.environ.get("REDIS_POOL_TIMEOUT_SECONDS", 5))
+
+# one client (and so one connection pool) per URL for the whole process
+_sync_clients: dict[str, Redis] = {}
+_async_clients: dict[str, AsyncRedis] = {}
+
+
+_memory_servers: dict = {}
+
+
+def _resolve(url: Optional[str]) -> str:
+    return url or os.environ.get("REDIS_URL", DEFAULT_REDIS_URL)
+
+
+def _memory_client(url: str, asynchronous: bool):
+    """Sync and async clients of one `memory://` URL share a single fakeredis server."""
+    try:
+        import fakeredis
+    except ImportError as e:  # pragma: no cover - fakeredis is only needed for memory://
+        raise RuntimeError("REDIS_URL=memory:// needs the fakeredis package") from e
+
+    server = _memory_servers.get(url)
+    if server is None:
+        server = _memory_servers[url] = fakeredis.FakeServer()
+    if asynchronous:
+        return fakeredis.FakeAsyncRedis(
+            server=server, connection_pool_class=AsyncBlockingConnectionPool, max_connections=REDIS_MAX_CONNECTIONS,
+        )
+    return fakeredis.FakeRedis(
+        server=server, connection_pool_class=BlockingConnectionPool, max_connections=REDIS_MAX_CONNECTIONS,
+    )
+
+
+def get_redis(url: Optional[str] = None) -> Redis:
+    """Shared sync Redis client for `url` (defaults to REDIS_URL)."""
+    url = _resolve(url)
+    client = _sync_clients.get(url)
+    if client is None:
+        if url.startswith(MEMORY_SCHEME):
+            client = _sync_clients[url] = _memory_client(url, asynchronous=False)
+        else:
+            client = _sync_clients[url] = Redis.from_pool(
+                BlockingConnectionPool.from_url(url, max_connections=REDIS_MAX_CONNECTIONS, timeout=REDIS_POOL_TIMEOUT)
+            )
+    return client
+
+
+def get_async_redis(url: Optional[str] = None) -> AsyncRedis:
+    """Shared asyncio Redis client for `url` (defaults to REDIS_URL)."""
+    url = _resolve(url)
+    client = _async_clients.get(url)
+    if client is None:
+        if url.startswith(MEMORY_SCHEME):
+            client = _async_clients[url] = _memory_client(url, asynchronous=True)
+        else:
+            client = _async_clients[url] = AsyncRedis.from_pool(
+                AsyncBlockingConnectionPool.from_url(url, max_connections=REDIS_MAX_CONNECTIONS, timeout=REDIS_POOL_TIMEOUT)
+            )
+    return client
+
+
+async def close_all():
+    for client in _sync_clients.values():
+        client.close()
+    for client in _async_clients.values():
+        await client.aclose()
+    _sync_clients.clear()
+    _async_clients.clear()
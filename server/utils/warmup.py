@@ -0,0 +1,132 @@
+import os
+import time
+import asyncio
+import functools
+from types import SimpleNamespace
+from typing import Any, Callable, Optional
+
+from modules.ServerLogger import ServerLogger
+from modules.Metrics import observe_stage
+
+logger = ServerLogger()
+
+WARMUP_CONCURRENCY = int(os.environ.get("WARMUP_CONCURRENCY", 8))
+
+
+async def warm_survey(
+    switcher: Any,
+    *,
+    db_type: Optional[str],
+    su_id: str,
+    concurrency: int = WARMUP_CONCURRENCY,
+    on_progress: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """
+    Precompute everything the first respondents of a survey would otherwise pay for.
+
+    1. fetch the survey and all of its questions (two queries),
+    2. write every question's `survey_details:{su_id}:{qs_id}` entry in one Redis pipeline,
+    3. extract the intent of every `add_context` question through the single-flight
+       `aextract_intent`, at most `concurrency` LLM calls at a time,
+    4. compile each question's system prompt into this worker's PromptCompiler.
+
+    `on_progress` receives one event per finished question. Returns a report with
+    counts and per-stage timings.
+    """
+    from modules.LLMAdapter import LLMAdapter, llm_clients
+    from modules.LLMScheduler import Priority
+    from modules.PromptCompiler import prompt_compiler
+    from utils.intent import aextract_intent
+    from utils.redis_pool import get_async_redis
+
+    started = time.perf_counter()
+    report: dict = {
+        "su_id": su_id,
+        "db_type": db_type,
+        "questions": 0,
+        "cached": 0,
+        "intents": {"extracted": 0, "skipped": 0, "failed": 0},
+        "prompts_compiled": 0,
+        "timings": {},
+        "per_question": [],
+    }
+
+    survey, questions, error = await switcher.fetch_survey_questions(db_type=db_type, su_id=su_id)
+    report["timings"]["fetch_s"] = round(time.perf_counter() - started, 4)
+    if error:
+        report["error"] = error
+        return report
+    report["questions"] = len(questions)
+
+    stage_started = time.perf_counter()
+    outputs = [(su_id, qs_id, switcher.build_output(survey, question)) for qs_id, question in questions]
+    if outputs:
+        await switcher.asave_outputs_to_redis(outputs)
+    report["cached"] = len(outputs)
+    # configs were (re)loaded: prompts compiled from an older version are stale
+    prompt_compiler.invalidate(su_id)
+    report["timings"]["cache_s"] = round(time.perf_counter() - stage_started, 4)
+
+    provider = survey.config.llm.value
+    await llm_clients.warm([provider])
+    adapter = LLMAdapter(provider, 0.7, streaming=True, priority=Priority.INTENT)
+    redis_client = get_async_redis(os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+    ttl_seconds = int(os.environ.get("REDIS_TTL_SECONDS_INTENT", 86400))
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    done = 0
+
+    async def _warm_question(qs_id: str, question: Any, output: dict):
+        nonlocal done
+        item = {"qs_id": qs_id, "intent": "skipped", "intent_s": 0.0}
+        intent = None
+        if question.config.add_context:
+            async with semaphore:
+                question_started = time.perf_counter()
+                try:
+                    intent = await aextract_intent(
+                        question_description=question.description,
+                        question_text=question.question,
+                        survey_details=SimpleNamespace(su_id=su_id, qs_id=qs_id),
+                        ainvoke_fn=functools.partial(adapter.ainvoke, config={"metadata": {"su_id": su_id}}),
+                        logger=logger,
+                        redis_client=redis_client,
+                        ttl_seconds=ttl_seconds,
+                    )
+                    item["intent"] = "extracted"
+                except Exception as e:
+                    logger.error(f"Warm-up intent extraction failed for {su_id}/{qs_id}: {e}")
+                    item["intent"] = "failed"
+                item["intent_s"] = round(time.perf_counter() - question_started, 4)
+                observe_stage("warmup_intent", item["intent_s"], provider=provider, db_type=db_type or "")
+        report["intents"][item["intent"]] += 1
+
+        prompt_compiler.compile(
+            su_id=su_id,
+            qs_id=qs_id,
+            language=output["survey"]["language"],
+            survey_add_context=output["survey"]["add_context"],
+            question_add_context=output["question"]["add_context"],
+            survey_description=output["survey"]["survey_description"],
+            question_text=output["question"]["question"],
+            # same fallback as Probe: only add_context questions carry an intent
+            intent=(intent or question.description) if question.config.add_context else None,
+        )
+        report["prompts_compiled"] += 1
+        report["per_question"].append(item)
+
+        done += 1
+        if on_progress is not None:
+            on_progress({**item, "done": done, "total": len(questions)})
+
+    stage_started = time.perf_counter()
+    await asyncio.gather(*(
+        _warm_question(qs_id, question, output)
+        for (qs_id, question), (_, _, output) in zip(questions, outputs)
+    ))
+    report["timings"]["intent_s"] = round(time.perf_counter() - stage_started, 4)
+    report["timings"]["total_s"] = round(time.perf_counter() - started, 4)
+    logger.info(
+        f"Warmed survey {su_id}: {report['questions']} questions, "
+        f"{report['intents']['extracted']} intents in {report['timings']['total_s']}s"
+    )
+    return report
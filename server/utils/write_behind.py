@@ -0,0 +1,293 @@
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+from modules.Metrics import metrics, observe_stage
+from modules.ServerLogger import ServerLogger
+
+logger = ServerLogger()
+
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", 100))
+WRITE_BEHIND_FLUSH_MS = float(os.environ.get("WRITE_BEHIND_FLUSH_MS", 250))
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get("WRITE_BEHIND_MAX_PENDING", 10000))
+# what `put` does when `max_pending` items are already queued:
+#   block       - wait for the flusher to make room (backpressure on the turn)
+#   drop_newest - discard the new item
+#   drop_oldest - discard the oldest queued item
+WRITE_BEHIND_OVERFLOW = os.environ.get("WRITE_BEHIND_OVERFLOW", "block").lower()
+WRITE_BEHIND_DRAIN_TIMEOUT = float(os.environ.get("WRITE_BEHIND_DRAIN_TIMEOUT_SECONDS", 30))
+# failed attempts before a batch is split to find the rows the database rejects
+WRITE_BEHIND_MAX_RETRIES = int(os.environ.get("WRITE_BEHIND_MAX_RETRIES", 5))
+
+OVERFLOW_POLICIES = {"block", "drop_newest", "drop_oldest"}
+
+flushed_total = metrics.counter(
+    "monet_write_behind_flushed_total",
+    "Items written to the database by the write-behind buffers.",
+    ("sink",),
+)
+dropped_total = metrics.counter(
+    "monet_write_behind_dropped_total",
+    "Items the write-behind buffers discarded instead of writing.",
+    ("sink", "reason"),
+)
+flush_errors_total = metrics.counter(
+    "monet_write_behind_flush_errors_total",
+    "Batch writes that failed and were retried.",
+    ("sink",),
+)
+
+
+def _no_classification(e: Exception) -> Optional[str]:
+    return None
+
+
+class WriteBehindBuffer:
+    """
+    Bounded async queue in front of one bulk-write sink.
+
+    `put()` only enqueues; a single background task flushes a batch as soon as
+    `batch_size` items are queued, or `flush_ms` after it last ran, with one
+    `flush_fn(batch)` call (e.g. `insert_many`). A failed batch stays at the
+    head of the queue and is retried with backoff, so writes keep their order.
+
+    `classify(e)` tells failures apart: "transient" (connection loss) is
+    retried for as long as it lasts, "permanent" (a row the database will
+    never accept) is isolated at once, and anything else is retried
+    `max_retries` times first. Isolating halves the batch until the failing
+    rows are found; those are dropped as "rejected" and the rest is written.
+    `drain()` flushes everything that is left (shutdown).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush_fn: Callable[[list], Awaitable[Any]],
+        db_type: str,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_ms: float = WRITE_BEHIND_FLUSH_MS,
+        max_pending: int = WRITE_BEHIND_MAX_PENDING,
+        overflow: str = WRITE_BEHIND_OVERFLOW,
+        max_retries: int = WRITE_BEHIND_MAX_RETRIES,
+        classify: Callable[[Exception], Optional[str]] = _no_classification,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unsupported write-behind overflow policy: {overflow}")
+        self.name = name
+        self.db_type = db_type
+        self._flush_fn = flush_fn
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_ms / 1000
+        self.max_pending = max(max_pending, self.batch_size)
+        self.overflow = overflow
+        self.max_retries = max(max_retries, 1)
+        self._classify = classify
+        # while isolating a bad row: largest batch to try, and how many head items are still suspect
+        self._limit = self.batch_size
+        self._suspect = 0
+        self._failures = 0
+        self._items: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.flushed = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _ensure_flusher(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def put(self, item: Any) -> bool:
+        """Queue one item; returns False if the overflow policy dropped it."""
+        if self._closed:
+            raise RuntimeError(f"Write-behind buffer {self.name} is closed")
+        while len(self._items) >= self.max_pending:
+            if self.overflow == "drop_newest":
+                self._drop(1, "overflow")
+                return False
+            if self.overflow == "drop_oldest":
+                self._items.popleft()
+                self._drop(1, "overflow")
+                break
+            self._space.clear()
+            self._wakeup.set()
+            await self._space.wait()
+        self._items.append(item)
+        self._ensure_flusher()
+        if len(self._items) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def _drop(self, count: int, reason: str):
+        self.dropped += count
+        dropped_total.inc(count, sink=self.name, reason=reason)
+
+    def _consume(self, count: int):
+        for _ in range(count):
+            self._items.popleft()
+        self._failures = 0
+        self._suspect = max(self._suspect - count, 0)
+        if not self._suspect:
+            self._limit = self.batch_size
+        self._space.set()
+
+    async def _flush_once(self) -> bool:
+        """Returns False when the caller should back off before the next attempt."""
+        batch = [self._items[i] for i in range(min(self._limit, len(self._items)))]
+        started = time.perf_counter()
+        try:
+            await self._flush_fn(batch)
+        except Exception as e:
+            flush_errors_total.inc(sink=self.name)
+            logger.error(f"Write-behind flush of {len(batch)} items to {self.name} failed: {e}")
+            return self._failed(batch, e)
+        finally:
+            observe_stage("write_behind_flush", time.perf_counter() - started, db_type=self.db_type)
+        self._consume(len(batch))
+        self.flushed += len(batch)
+        flushed_total.inc(len(batch), sink=self.name)
+        return True
+
+    def _failed(self, batch: list, e: Exception) -> bool:
+        kind = self._classify(e)
+        if kind == "transient":
+            return False
+        self._failures += 1
+        # once a batch has failed past its retries, every split of it is already suspect
+        if kind != "permanent" and not self._suspect and self._failures < self.max_retries:
+            return False
+        if len(batch) == 1:
+            logger.error(f"Write-behind dropped an item {self.name} keeps rejecting: {repr(batch[0])[:300]}")
+            self._drop(1, "rejected")
+            self._consume(1)
+            return True
+        self._suspect = self._suspect or len(batch)
+        self._limit = max(len(batch) // 2, 1)
+        self._failures = 0
+        return True
+
+    async def _run(self):
+        backoff = self.flush_interval
+        while self._items:
+            if len(self._items) < self.batch_size and not self._closed and not self._suspect:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            if await self._flush_once():
+                backoff = self.flush_interval
+            else:
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    async def drain(self, timeout: float = WRITE_BEHIND_DRAIN_TIMEOUT):
+        """Stop accepting items and write out everything that is queued."""
+        self._closed = True
+        self._wakeup.set()
+        if self._items:
+            self._ensure_flusher()
+        try:
+            if self._task is not None:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            logger.error(f"Write-behind buffer {self.name} did not drain in {timeout}s, {len(self._items)} items lost")
+            self._drop(len(self._items), "shutdown")
+            self._items.clear()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._items),
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "overflow": self.overflow,
+            "isolating": self._suspect,
+        }
+
+
+class WriteBehindRegistry:
+    """One buffer per sink (Mongo collection / SQL table), created on first use."""
+
+    def __init__(self):
+        self._buffers: dict[str, WriteBehindBuffer] = {}
+
+    def get(
+        self,
+        name: str,
+        flush_fn: Callable[[list], Awaitable[Any]],
+        db_type: str,
+        classify: Callable[[Exception], Optional[str]] = _no_classification,
+    ) -> WriteBehindBuffer:
+        buffer = self._buffers.get(name)
+        if buffer is None:
+            buffer = self._buffers[name] = WriteBehindBuffer(name, flush_fn, db_type, classify=classify)
+        return buffer
+
+    def mongo(self, collection) -> WriteBehindBuffer:
+        """Buffer flushed with an unordered `insert_many` on an async collection."""
+
+        async def _insert_many(docs: list[dict]):
+            from pymongo.errors import BulkWriteError
+
+            try:
+                await collection.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                # unordered: the rest of the batch was written, retrying would duplicate it.
+                # Duplicate keys on a retried batch are documents an earlier attempt already wrote.
+                failed = sum(1 for error in e.details.get("writeErrors", []) if error.get("code") != 11000)
+                if failed:
+                    logger.error(f"{failed} of {len(docs)} documents rejected by {collection.full_name}: {e}")
+                    self._buffers[name]._drop(failed, "rejected")
+
+        def _classify(e: Exception) -> Optional[str]:
+            from bson.errors import InvalidDocument
+            from pymongo.errors import ConnectionFailure, DocumentTooLarge
+
+            if isinstance(e, ConnectionFailure):
+                return "transient"
+            if isinstance(e, (DocumentTooLarge, InvalidDocument)):
+                return "permanent"
+            return None
+
+        name = f"mongo:{collection.full_name}"
+        return self.get(name, _insert_many, "mongo", _classify)
+
+    def sql(self, model) -> WriteBehindBuffer:
+        """Buffer flushed as one multi-row INSERT per batch through an async SQLAlchemy session."""
+
+        async def _bulk_insert(rows: list[dict]):
+            from sqlalchemy import insert
+            from modules.SQL_Wrapper import AsyncSessionLocal
+
+            async with AsyncSessionLocal() as session:
+                await session.execute(insert(model), rows)
+                await session.commit()
+
+        def _classify(e: Exception) -> Optional[str]:
+            from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, InterfaceError, OperationalError
+
+            if isinstance(e, (OperationalError, InterfaceError)) or (isinstance(e, DBAPIError) and e.connection_invalidated):
+                return "transient"
+            if isinstance(e, (IntegrityError, DataError)):
+                return "permanent"
+            return None
+
+        return self.get(f"sql:{model.__tablename__}", _bulk_insert, "mysql", _classify)
+
+    async def drain(self):
+        await asyncio.gather(*(buffer.drain() for buffer in self._buffers.values()))
+
+    def pending(self) -> int:
+        return sum(len(buffer) for buffer in self._buffers.values())
+
+    def stats(self) -> dict:
+        return {name: buffer.stats() for name, buffer in self._buffers.items()}
+
+
+write_behind = WriteBehindRegistry()